@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  bench/bench.py - time each conversion path on synthetic inputs.
+#
+
+import os
+import sys
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import synthetic
+
+import json
+import multiprocessing
+import ofx
+import ofxtools
+import platform
+import resource
+import time
+from optparse import OptionParser
+
+__doc__ = \
+"""Times each fixofx conversion path (OFX/1.02, QIF and OFC to OFX/2.0) on
+synthetic statements of several sizes, and writes the results as JSON.
+Each run happens in a fresh process, so that its peak memory can be
+measured and so that one run's caches don't help the next."""
+
+def stages_ofx(text):
+    """Generate (stage name, function) pairs that convert OFX/1.x text,
+    each function taking the previous one's result."""
+    yield ("type",   lambda arg: ofx.FileTyper(text).trust())
+    yield ("parse",  lambda filetype: (filetype, ofx.Response(text)))
+    yield ("as_xml", lambda (filetype, response):
+                         response.as_xml(original_format=filetype))
+
+def stages_qif(text):
+    yield ("type",   lambda arg: ofx.FileTyper(text).trust())
+    yield ("parse",  lambda filetype: ofxtools.QifConverter(text))
+    yield ("to_xml", lambda converter: converter.to_xml())
+
+def stages_ofc(text):
+    yield ("type",   lambda arg: ofx.FileTyper(text).trust())
+    yield ("parse",  lambda filetype: ofxtools.OfcConverter(text))
+    yield ("to_xml", lambda converter: converter.to_xml())
+
+STAGES = { "ofx" : stages_ofx, "qif" : stages_qif, "ofc" : stages_ofc }
+
+def max_rss_kb():
+    # ru_maxrss is in kilobytes on Linux, but in bytes on Mac OS X.
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss = rss / 1024
+    return rss
+
+def run_once(format, text, results):
+    """Run one conversion, putting a dictionary of stage timings and
+    memory use on the 'results' queue.  Runs in its own process."""
+    try:
+        start_rss = max_rss_kb()
+        stages = []
+        value = None
+        for (name, stage) in STAGES[format](text):
+            start = time.time()
+            value = stage(value)
+            stages.append((name, time.time() - start))
+        results.put({ "stages"       : stages,
+                      "output_bytes" : len(value),
+                      "start_rss_kb" : start_rss,
+                      "peak_rss_kb"  : max_rss_kb() })
+    except Exception, detail:
+        results.put({ "error" : "%s: %s" % (detail.__class__.__name__, detail) })
+
+def run_case(format, count, repeat=1, seed=0):
+    """Convert a synthetic statement 'repeat' times, and return a result
+    dictionary for the fastest run."""
+    text = synthetic.generate(format, count, seed=seed)
+    best = None
+    for i in range(repeat):
+        results = multiprocessing.Queue()
+        process = multiprocessing.Process(target=run_once,
+                                          args=(format, text, results))
+        process.start()
+        run = results.get()
+        process.join()
+        if "error" in run:
+            best = run
+            break
+        run["seconds"] = sum([seconds for (name, seconds) in run["stages"]])
+        if best is None or run["seconds"] < best["seconds"]:
+            best = run
+
+    result = { "format"       : format,
+               "transactions" : count,
+               "input_bytes"  : len(text) }
+    result.update(best)
+    if "error" not in result:
+        result["stages"] = dict(result["stages"])
+        result["txns_per_sec"] = count / max(result["seconds"], 1e-9)
+        result["mb_per_sec"] = len(text) / 1048576.0 / max(result["seconds"], 1e-9)
+    return result
+
+def describe(result, baseline=None):
+    """Return a one-line, human-readable summary of a result."""
+    line = "%-4s %7d txns " % (result["format"], result["transactions"])
+    if "error" in result:
+        return line + "FAILED: %s" % result["error"]
+
+    line += "%9.3fs %10.0f txns/s %7.2f MB/s %8d KB peak  " % \
+            (result["seconds"], result["txns_per_sec"], result["mb_per_sec"],
+             result["peak_rss_kb"])
+    line += " ".join(["%s %.3fs" % (name, seconds)
+                      for (name, seconds) in sorted(result["stages"].items())])
+    if baseline is not None and "seconds" in baseline:
+        line += "  speedup %.2fx" % (baseline["seconds"] / max(result["seconds"], 1e-9))
+    return line
+
+parser = OptionParser(description=__doc__)
+parser.add_option("-s", "--sizes", dest="sizes", default="10,1000,10000,100000",
+                  help="comma-separated transaction counts to run")
+parser.add_option("-f", "--formats", dest="formats", default="ofx,qif,ofc",
+                  help="comma-separated input formats to run")
+parser.add_option("-r", "--repeat", dest="repeat", type="int", default=3,
+                  help="runs per case; the fastest is reported")
+parser.add_option("--seed", dest="seed", type="int", default=0,
+                  help="random seed for the synthetic statements")
+parser.add_option("-o", "--output", dest="output", default=None,
+                  help="file to write JSON results to (default: STDOUT)")
+parser.add_option("-c", "--compare", dest="compare", default=None,
+                  help="JSON results from an earlier run to compare against")
+
+if __name__ == '__main__':
+    (options, args) = parser.parse_args()
+
+    baselines = {}
+    if options.compare is not None:
+        for result in json.load(open(options.compare))["results"]:
+            baselines[(result["format"], result["transactions"])] = result
+
+    results = []
+    for format in options.formats.split(","):
+        if format not in STAGES:
+            parser.error("unknown format '%s'" % format)
+        for count in [int(size) for size in options.sizes.split(",")]:
+            result = run_case(format, count, repeat=options.repeat,
+                              seed=options.seed)
+            results.append(result)
+            sys.stderr.write(describe(result, baselines.get((format, count))) + "\n")
+
+    report = { "python"    : platform.python_version(),
+               "platform"  : platform.platform(),
+               "timestamp" : time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "seed"      : options.seed,
+               "repeat"    : options.repeat,
+               "results"   : results }
+
+    if options.output is None:
+        json.dump(report, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write("\n")
+    else:
+        output = open(options.output, "w")
+        json.dump(report, output, indent=2, sort_keys=True)
+        output.close()
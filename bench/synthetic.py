@@ -0,0 +1,43 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  bench/synthetic - make benchmark inputs of a given size.
+#
+
+import os
+import sys
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from datetime import date
+import fakeofx
+import random
+
+def statement(count, seed=0, accttype="CHECKING", end_date=date(2010, 1, 31)):
+    """Return an ofx.Generator holding a fake statement with 'count'
+    transactions, made with the fakeofx spending model.  The same
+    arguments always make the same statement."""
+    random.seed(seed)
+    days = max(90, count / 20)
+    return fakeofx.fake_statement(days=days, end_date=end_date, 
+                                  accttype=accttype, count=count)
+
+RENDERERS = { "ofx" : fakeofx.to_ofx102,
+              "qif" : fakeofx.to_qif,
+              "ofc" : fakeofx.to_ofc }
+
+def generate(format, count, seed=0):
+    """Return a synthetic document in the given format ("ofx", "qif" or
+    "ofc") with 'count' transactions."""
+    return RENDERERS[format](statement(count, seed=seed))
@@ -26,34 +26,21 @@ def fixpath(filename):
     mypath = os.path.dirname(sys._getframe(1).f_code.co_filename)
     return os.path.normpath(os.path.join(mypath, filename))
 
-sys.path.insert(0, '3rdparty')
-sys.path.insert(0, 'lib')
+sys.path.insert(0, fixpath('3rdparty'))
+sys.path.insert(0, fixpath('lib'))
 
-from datetime import date
-from datetime import timedelta
+from datetime import date as date_type
+from datetime import datetime, timedelta
+import json
+import multiprocessing
 import ofx
 from optparse import OptionParser
 import random
+import signal
 
 def generate_amt(base_amt):
     return random.uniform((base_amt * 0.6), (base_amt * 1.4))
 
-# How long should this statement be?
-
-days = 90
-end_date = date.today()
-
-# How much spending should the statement represent?
-
-income = 85000
-take_home_pay = income * .6
-paycheck_amt = "%.02f" % (take_home_pay / 26)
-daily_income = take_home_pay / 365
-
-# Assume that people spend their whole income.  At least.
-
-total_spending = daily_income * days
-
 # How do people usually spend their money?  Taken from
 # http://www.billshrink.com/blog/consumer-income-spending/
 # The fees number is made up, but seemed appropriate.
@@ -102,31 +89,10 @@ top_merchants = \
       "rent":          ["Rent Payment"],
       "utility":       ["AT&T", "Verizon", "PG&E", "Comcast", "Brinks", ""] }
 
-# Choose a random account type.
-accttype = random.choice(['CHECKING', 'CREDITCARD'])
-
-if accttype == "CREDITCARD":
-    # Make up a random 16-digit credit card number with a standard prefix.
-    acctid = "9789" + str(random.randint(000000000000, 999999999999))
-    
-    # Credit card statements don't use bankid.
-    bankid = None
-    
-    # Make up a negative balance.
-    balance = "%.02f" % generate_amt(-5000)
-    
-else:
-    # Make up a random 8-digit account number.
-    acctid = random.randint(10000000, 99999999)
-    
-    # Use a fake bankid so it's easy to find fake OFX uploads.
-    bankid = "987987987"
-    
-    # Make up a positive balance.
-    balance = "%.02f" % generate_amt(1000)
-
-def generate_transaction(stmt, tag, type, date=None):
+def generate_transaction(stmt, tag, type, date=None, days=90, end_date=None):
     if date is None:
+        if end_date is None:
+            end_date = date_type.today()
         days_ago = timedelta(days=random.randint(0, days))
         date = (end_date - days_ago).strftime("%Y%m%d")
     
@@ -138,53 +104,345 @@ def generate_transaction(stmt, tag, type, date=None):
     stmt.add_transaction(date=date, amount=txn_amt, payee=merchant, type=type)
     return amount
 
-
-stmt = ofx.Generator(fid="9789789", org="FAKEOFX", acctid=acctid, accttype=accttype, 
-                     bankid=bankid, availbal=balance, ledgerbal=balance)
-
-tags = spending_pcts.keys()
-tags.remove("housing")
-
-if accttype == "CREDITCARD":
-    # Add credit card payments
-
-    payment_days_ago = 0
-
-    while payment_days_ago < days:
-        payment_days_ago += 30
-        payment_amt = "%.02f" % generate_amt(1000)
-        paymentday = (end_date - timedelta(days=payment_days_ago)).strftime("%Y%m%d")
-        stmt.add_transaction(date=paymentday, amount=payment_amt, payee="Credit Card Payment", type="PAYMENT")
+def fake_statement(days=90, end_date=None, income=85000, accttype=None,
+                   count=None):
+    """Make up a statement covering 'days' days up to 'end_date' (today by
+    default), and return it as an ofx.Generator.  Normally the statement
+    spends the income for the period; if 'count' is given, it instead has
+    exactly that many spending transactions, with categories chosen in
+    proportion to how much people spend on them."""
+    if end_date is None:
+        end_date = date_type.today()
     
-elif accttype == "CHECKING":
-    # First deal with income
-
-    pay_days_ago = 0
-
-    while pay_days_ago < days:
-        pay_days_ago += 15
-        payday = (end_date - timedelta(days=pay_days_ago)).strftime("%Y%m%d")
-        stmt.add_transaction(date=payday, amount=paycheck_amt, payee="Payroll", type="DEP")
-
-    # Then deal with housing
-
-    housing_tag = random.choice(["rent", "mortgage"])
-
-    housing_days_ago = 0
+    # How much spending should the statement represent?
+    
+    take_home_pay = income * .6
+    paycheck_amt = "%.02f" % (take_home_pay / 26)
+    daily_income = take_home_pay / 365
+    
+    # Assume that people spend their whole income.  At least.
+    
+    total_spending = daily_income * days
+    
+    # Choose a random account type.
+    if accttype is None:
+        accttype = random.choice(['CHECKING', 'CREDITCARD'])
+    
+    if accttype == "CREDITCARD":
+        # Make up a random 16-digit credit card number with a standard prefix.
+        acctid = "9789" + str(random.randint(000000000000, 999999999999))
+        
+        # Credit card statements don't use bankid.
+        bankid = None
+        
+        # Make up a negative balance.
+        balance = "%.02f" % generate_amt(-5000)
+        
+    else:
+        # Make up a random 8-digit account number.
+        acctid = random.randint(10000000, 99999999)
+        
+        # Use a fake bankid so it's easy to find fake OFX uploads.
+        bankid = "987987987"
+        
+        # Make up a positive balance.
+        balance = "%.02f" % generate_amt(1000)
+    
+    stmt = ofx.Generator(fid="9789789", org="FAKEOFX", acctid=acctid, accttype=accttype, 
+                         bankid=bankid, availbal=balance, ledgerbal=balance,
+                         stmtdate=end_date.strftime("%Y%m%d"))
+    
+    tags = spending_pcts.keys()
+    tags.remove("housing")
+    tags.sort()
+    
+    if count is not None:
+        weights = [spending_pcts[tag] for tag in tags]
+        for i in range(count):
+            pick = random.uniform(0, sum(weights))
+            for (tag, weight) in zip(tags, weights):
+                pick -= weight
+                if pick <= 0:
+                    break
+            generate_transaction(stmt, tag, "DEBIT", days=days, end_date=end_date)
+        return stmt
+    
+    if accttype == "CREDITCARD":
+        # Add credit card payments
+        
+        payment_days_ago = 0
+        
+        while payment_days_ago < days:
+            payment_days_ago += 30
+            payment_amt = "%.02f" % generate_amt(1000)
+            paymentday = (end_date - timedelta(days=payment_days_ago)).strftime("%Y%m%d")
+            stmt.add_transaction(date=paymentday, amount=payment_amt, payee="Credit Card Payment", type="PAYMENT")
+        
+    elif accttype == "CHECKING":
+        # First deal with income
+        
+        pay_days_ago = 0
+        
+        while pay_days_ago < days:
+            pay_days_ago += 15
+            payday = (end_date - timedelta(days=pay_days_ago)).strftime("%Y%m%d")
+            stmt.add_transaction(date=payday, amount=paycheck_amt, payee="Payroll", type="DEP")
+        
+        # Then deal with housing
+        
+        housing_tag = random.choice(["rent", "mortgage"])
+        
+        housing_days_ago = 0
+        
+        while housing_days_ago < days:
+            housing_days_ago += 30
+            amount = generate_transaction(stmt, housing_tag, "DEBIT", 
+                                          days=days, end_date=end_date)
+            total_spending -= abs(amount)
+    
+    # Now deal with the rest of the tags
+    
+    for tag in tags:
+        tag_spending = total_spending * spending_pcts[tag]
+        while tag_spending > 0 and total_spending > 0:
+            amount = generate_transaction(stmt, tag, "DEBIT", 
+                                          days=days, end_date=end_date)
+            tag_spending   -= abs(amount)
+            total_spending -= abs(amount)
+    
+    return stmt
 
-    while housing_days_ago < days:
-        housing_days_ago += 30
-        last_housing = (end_date - timedelta(days=housing_days_ago)).strftime("%Y%m%d")
-        amount = generate_transaction(stmt, housing_tag, "DEBIT")
-        total_spending -= abs(amount)
+#
+# Other renderings of a statement
+#
 
-# Now deal with the rest of the tags
+# OFC codes for the account and transaction types used above.
+ofc_acct_types = { "CHECKING" : "0", "CREDITCARD" : "2" }
+ofc_txn_types  = { "DEBIT" : "1", "DEP" : "5", "PAYMENT" : "9" }
+
+def transactions(stmt):
+    """Return the transactions in a statement, oldest first."""
+    txns = []
+    dates = stmt.txns_by_date.keys()
+    dates.sort()
+    for txn_date in dates:
+        txns.extend(stmt.txns_by_date[txn_date])
+    return txns
+
+def to_ofx102(stmt):
+    """Render a statement as OFX/1.02."""
+    return stmt.to_ofx1()
+
+def to_ofx2(stmt):
+    """Render a statement as OFX/2.0."""
+    return ofx.Response(stmt.to_ofx1()).as_xml()
+
+def to_qif(stmt):
+    """Render a statement as QIF, with US dates."""
+    if stmt.accttype == "CREDITCARD":
+        lines = ["!Type:CCard"]
+    else:
+        lines = ["!Type:Bank"]
+    
+    for txn in transactions(stmt):
+        lines.append("D%s/%s/%s" % (txn.date[4:6], txn.date[6:8], txn.date[0:4]))
+        lines.append("T%s" % txn.amount)
+        if txn.payee:
+            lines.append("P%s" % txn.payee)
+        lines.append("^")
+    return "\n".join(lines) + "\n"
+
+def to_ofc(stmt):
+    """Render a statement as OFC."""
+    txns = transactions(stmt)
+    lines = ["<OFC>",
+             "<DTCLIENT>%s" % txns[-1].date,
+             "<ACCTSTMT>",
+             "<ACCTFROM>",
+             "<BANKID>%s" % (stmt.bankid or "0"),
+             "<ACCTID>%s" % stmt.acctid,
+             "<ACCTTYPE>%s" % ofc_acct_types.get(stmt.accttype, "5"),
+             "</ACCTFROM>",
+             "<STMTRS>",
+             "<DTSTART>%s" % txns[0].date,
+             "<DTEND>%s" % txns[-1].date,
+             "<LEDGER>%s" % stmt.ledgerbal]
+    
+    for txn in txns:
+        lines.append("<STMTTRN>")
+        lines.append("<TRNTYPE>%s" % ofc_txn_types.get(txn.type, "12"))
+        lines.append("<DTPOSTED>%s" % txn.date)
+        lines.append("<TRNAMT>%s" % txn.amount)
+        if txn.payee:
+            lines.append("<NAME>%s" % txn.payee)
+        lines.append("</STMTTRN>")
+    
+    lines.extend(["</STMTRS>", "</ACCTSTMT>", "</OFC>"])
+    return "\n".join(lines) + "\n"
+
+def to_csv(stmt):
+    """Render a statement as CSV, with US dates."""
+    lines = ["Date,Description,Amount"]
+    for txn in transactions(stmt):
+        payee = (txn.payee or "").replace('"', '""')
+        lines.append('%s/%s/%s,"%s",%s' % (txn.date[4:6], txn.date[6:8],
+                                           txn.date[0:4], payee, txn.amount))
+    return "\n".join(lines) + "\n"
+
+# Each rendering, by name, with the file extension used in a corpus.
+renderers = { "ofx102" : (to_ofx102, "ofx"),
+              "ofx2"   : (to_ofx2,   "xml"),
+              "qif"    : (to_qif,    "qif"),
+              "ofc"    : (to_ofc,    "ofc"),
+              "csv"    : (to_csv,    "csv") }
 
-for tag in tags:
-    tag_spending = total_spending * spending_pcts[tag]
-    while tag_spending > 0 and total_spending > 0:
-        amount = generate_transaction(stmt, tag, "DEBIT")
-        tag_spending   -= abs(amount)
-        total_spending -= abs(amount)
+#
+# Corpus generation
+#
 
-print stmt
+def corpus_statement(index, seed=0, days=90, end_date=None, density=None):
+    """Make statement number 'index' of a corpus.  The same arguments
+    always make the same statement, no matter which process makes it.
+    With a 'density', the statement has that many transactions per day
+    (on average) instead of following the income model."""
+    random.seed(seed * 2**32 + index)
+    count = None
+    if density is not None:
+        count = max(1, int(round(days * density)))
+    return fake_statement(days=days, end_date=end_date, count=count)
+
+def corpus_path(index, ext):
+    """Return the path, relative to the corpus directory, for a file of
+    statement 'index'.  Files go 1,000 statements to a directory."""
+    return os.path.join("%06d" % (index / 1000), "%09d.%s" % (index, ext))
+
+def write_corpus_statement(job):
+    """Make one statement of a corpus, write its renderings, and return its
+    manifest entry.  Runs in a worker process."""
+    (index, output_dir, formats, seed, days, end_date, density) = job
+    stmt = corpus_statement(index, seed=seed, days=days, end_date=end_date,
+                            density=density)
+    entry = { "id"           : index,
+              "accttype"     : stmt.accttype,
+              "transactions" : sum([len(txns) for txns in stmt.txns_by_date.values()]),
+              "start_date"   : min(stmt.txns_by_date.keys()),
+              "end_date"     : max(stmt.txns_by_date.keys()),
+              "files"        : {} }
+    for format in formats:
+        (render, ext) = renderers[format]
+        path = corpus_path(index, ext)
+        full_path = os.path.join(output_dir, path)
+        if not os.path.isdir(os.path.dirname(full_path)):
+            try:
+                os.makedirs(os.path.dirname(full_path))
+            except OSError:
+                # Another worker made it first.
+                pass
+        output = open(full_path, "w")
+        output.write(render(stmt))
+        output.close()
+        entry["files"][format] = path
+    return entry
+
+def init_worker():
+    # Let the parent process handle Ctrl-C.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def write_corpus(output_dir, count, formats=None, seed=0, days=90,
+                 end_date=None, density=None, jobs=None, start=0):
+    """Write 'count' statements (numbered from 'start') to 'output_dir',
+    in each of the given formats (all of them by default), using 'jobs'
+    processes (one per CPU by default).  A manifest with one JSON object
+    per line, giving each statement's account type, transaction count,
+    date range and files, is written to manifest.jsonl in the same
+    directory, and the settings used go in corpus.json.  Returns the
+    total number of transactions."""
+    if formats is None:
+        formats = sorted(renderers.keys())
+    if end_date is None:
+        end_date = date_type.today()
+    if not os.path.isdir(output_dir):
+        os.makedirs(output_dir)
+    
+    jobs_list = ((index, output_dir, formats, seed, days, end_date, density)
+                 for index in xrange(start, start + count))
+    total = 0
+    manifest = open(os.path.join(output_dir, "manifest.jsonl"), "w")
+    pool = multiprocessing.Pool(jobs, init_worker)
+    try:
+        for entry in pool.imap(write_corpus_statement, jobs_list, 16):
+            manifest.write(json.dumps(entry, sort_keys=True) + "\n")
+            total += entry["transactions"]
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+        manifest.close()
+    
+    settings = { "statements"   : count,
+                 "start"        : start,
+                 "transactions" : total,
+                 "formats"      : formats,
+                 "seed"         : seed,
+                 "days"         : days,
+                 "end_date"     : end_date.strftime("%Y%m%d"),
+                 "density"      : density }
+    output = open(os.path.join(output_dir, "corpus.json"), "w")
+    json.dump(settings, output, indent=2, sort_keys=True)
+    output.close()
+    return total
+
+parser = OptionParser(usage="%prog [options]",
+                      description="Writes a fake statement as OFX/1.02 to "
+                      "STDOUT, or, with -n, writes a corpus of fake statements "
+                      "in several formats to a directory.")
+parser.add_option("-n", "--statements", dest="statements", type="int",
+                  default=None, help="number of statements in the corpus")
+parser.add_option("-o", "--output-dir", dest="output_dir", default="corpus",
+                  help="directory to write the corpus to (default: corpus)")
+parser.add_option("-f", "--formats", dest="formats",
+                  default=",".join(sorted(renderers.keys())),
+                  help="comma-separated corpus formats (default: %default)")
+parser.add_option("-s", "--seed", dest="seed", type="int", default=None,
+                  help="random seed; the same seed makes the same statements")
+parser.add_option("--days", dest="days", type="int", default=90,
+                  help="days covered by each statement (default: %default)")
+parser.add_option("--end-date", dest="end_date", default=None,
+                  help="last day of each statement, as YYYYMMDD (default: today)")
+parser.add_option("--density", dest="density", type="float", default=None,
+                  help="transactions per day, instead of spending an income")
+parser.add_option("-j", "--jobs", dest="jobs", type="int", default=None,
+                  help="worker processes for a corpus (default: one per CPU)")
+
+if __name__ == '__main__':
+    (options, args) = parser.parse_args()
+    
+    end_date = None
+    if options.end_date is not None:
+        try:
+            end_date = datetime.strptime(options.end_date, "%Y%m%d").date()
+        except ValueError:
+            parser.error("--end-date must be given as YYYYMMDD")
+    
+    if options.statements is None:
+        if options.seed is not None:
+            random.seed(options.seed)
+        count = None
+        if options.density is not None:
+            count = max(1, int(round(options.days * options.density)))
+        print fake_statement(days=options.days, end_date=end_date, count=count)
+        sys.exit(0)
+    
+    formats = options.formats.split(",")
+    for format in formats:
+        if format not in renderers:
+            parser.error("unknown format '%s'" % format)
+    
+    total = write_corpus(options.output_dir, options.statements,
+                         formats=formats, seed=options.seed or 0,
+                         days=options.days, end_date=end_date,
+                         density=options.density, jobs=options.jobs)
+    sys.stderr.write("Wrote %d statements with %d transactions to %s.\n" %
+                     (options.statements, total, options.output_dir))
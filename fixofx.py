@@ -18,9 +18,21 @@
 # fixofx.py - canonicalize all recognized upload formats to OFX 2.0
 #
 
+import atexit
+import BaseHTTPServer
+import cgi
+import glob
+import json
+import mmap
+import multiprocessing
 import os
 import os.path
+import signal
+import SocketServer
 import sys
+import threading
+import time
+import urlparse
 
 def fixpath(filename):
     mypath = os.path.dirname(sys._getframe(1).f_code.co_filename)
@@ -60,37 +72,74 @@ except ImportError:
 def convert(text, filetype, verbose=False, fid="UNKNOWN", org="UNKNOWN", 
             bankid="UNKNOWN", accttype="UNKNOWN", acctid="UNKNOWN",
             balance="UNKNOWN", curdef=None, lang="ENG", dayfirst=False, 
-            debug=False):
+            debug=False, cache=None, output=None, timings=None):
+    """Convert 'text', of the given file type, to OFX 2.0, and return it.
+    If a file-like 'output' is given, the document is written to it as
+    it's converted instead (unless it comes from the cache, which holds
+    whole documents), and nothing is returned.  If an ofx.Timings is
+    given, each stage of the conversion is timed in it."""
     
     # This finishes a verbosity message started by the caller, where the
     # caller explains the source command-line option and this explains the
     # source format.
     if verbose: 
         sys.stderr.write("Converting from %s format.\n" % filetype)
+    
+    # OFX/2 comes back unaltered, so there's nothing worth caching.
+    if cache is None or filetype.startswith("OFX/2"):
+        return _convert(text, filetype, verbose, fid, org, bankid, accttype,
+                        acctid, balance, curdef, lang, dayfirst, debug, output,
+                        timings)
+    
+    key = cache.key(text, filetype=filetype, fid=fid, org=org, bankid=bankid,
+                    accttype=accttype, acctid=acctid, balance=balance,
+                    curdef=curdef, lang=lang, dayfirst=dayfirst)
+    with ofx.timed(timings, "cache_get", text) as stage:
+        converted = cache.get(key)
+        if converted is not None:
+            stage.output_bytes = len(converted)
+    if converted is not None:
+        if verbose: sys.stderr.write("Returning cached conversion.\n")
+    else:
+        converted = _convert(text, filetype, verbose, fid, org, bankid,
+                             accttype, acctid, balance, curdef, lang, dayfirst,
+                             debug, timings=timings)
+        with ofx.timed(timings, "cache_put", converted):
+            cache.put(key, converted)
+    
+    if output is None:
+        return converted
+    output.write(converted)
 
-    if options.debug and (filetype in ["OFC", "QIF"] or filetype.startswith("OFX")):
+def _convert(text, filetype, verbose, fid, org, bankid, accttype, acctid,
+             balance, curdef, lang, dayfirst, debug, output=None, timings=None):
+
+    if debug and (filetype in ["OFC", "QIF"] or filetype.startswith("OFX")):
         sys.stderr.write("Starting work on raw text:\n")
-        sys.stderr.write(rawtext + "\n\n")
+        sys.stderr.write(text + "\n\n")
     
     if filetype.startswith("OFX/2"):
         if verbose: sys.stderr.write("No conversion needed; returning unmodified.\n")
         
         # The file is already OFX 2 -- return it unaltered, ignoring
         # any of the parameters passed to this method.
-        return text
+        if output is None:
+            return text
+        output.write(text)
     
     elif filetype.startswith("OFX"):
         if verbose: sys.stderr.write("Converting to OFX/2.0...\n")
         
         # This will throw a ParseException if it is unable to recognize
         # the source format.
-        response = ofx.Response(text, debug=debug)        
-        return response.as_xml(original_format=filetype)
+        response = ofx.Response(text, debug=debug, timings=timings)
+        return response.as_xml(original_format=filetype, stream=output,
+                               timings=timings)
     
     elif filetype == "OFC":
         if verbose: sys.stderr.write("Beginning OFC conversion...\n")
         converter = ofxtools.OfcConverter(text, fid=fid, org=org, curdef=curdef,
-                                          lang=lang, debug=debug)
+                                          lang=lang, debug=debug, timings=timings)
         
         # This will throw a ParseException if it is unable to recognize
         # the source format.
@@ -99,7 +148,7 @@ def convert(text, filetype, verbose=False, fid="UNKNOWN", org="UNKNOWN",
                              converter.to_ofx102())
             sys.stderr.write("Converting to OFX/2.0...\n")
                                              
-        return converter.to_xml()
+        return converter.to_xml(stream=output)
     
     elif filetype == "QIF":
         if verbose: sys.stderr.write("Beginning QIF conversion...\n")
@@ -107,7 +156,7 @@ def convert(text, filetype, verbose=False, fid="UNKNOWN", org="UNKNOWN",
                                           bankid=bankid, accttype=accttype, 
                                           acctid=acctid, balance=balance, 
                                           curdef=curdef, lang=lang, dayfirst=dayfirst,
-                                          debug=debug)
+                                          debug=debug, timings=timings)
         
         # This will throw a ParseException if it is unable to recognize
         # the source format.
@@ -116,12 +165,368 @@ def convert(text, filetype, verbose=False, fid="UNKNOWN", org="UNKNOWN",
                              converter.to_ofx102())
             sys.stderr.write("Converting to OFX/2.0...\n")
                                              
-        return converter.to_xml()
+        return converter.to_xml(stream=output)
     
     else:
         raise TypeError("Unable to convert source format '%s'." % filetype)
 
-parser = OptionParser(description=__doc__)
+def map_file(path):
+    """Memory-map a file for reading, or return None if it's empty (an
+    empty file can't be mapped)."""
+    srcfile = open(path, 'rb')
+    try:
+        if os.fstat(srcfile.fileno()).st_size == 0:
+            return None
+        # The map stays open after the file is closed.
+        return mmap.mmap(srcfile.fileno(), 0, access=mmap.ACCESS_READ)
+    finally:
+        srcfile.close()
+
+#
+# Batch conversion.
+#
+
+def batch_inputs(paths, manifest=None):
+    """Expand the batch arguments -- files, directories (searched
+    recursively) and glob patterns -- plus any paths listed in the
+    manifest file, into a list of input files."""
+    if manifest is not None:
+        if manifest == "-":
+            lines = sys.stdin.readlines()
+        else:
+            listfile = open(manifest, 'rU')
+            lines = listfile.readlines()
+            listfile.close()
+        for line in lines:
+            line = line.strip()
+            if line != "" and not line.startswith("#"):
+                paths.append(line)
+    
+    inputs = []
+    for path in paths:
+        if os.path.isdir(path):
+            for (dirpath, dirnames, filenames) in os.walk(path):
+                dirnames[:] = sorted([d for d in dirnames if not d.startswith(".")])
+                for filename in sorted(filenames):
+                    if not filename.startswith("."):
+                        inputs.append(os.path.join(dirpath, filename))
+        elif os.path.exists(path):
+            inputs.append(path)
+        else:
+            # Either a glob pattern or a missing file; a missing file is
+            # reported along with the other results.
+            matches = sorted(glob.glob(path))
+            if len(matches) == 0:
+                inputs.append(path)
+            for match in matches:
+                if os.path.isfile(match):
+                    inputs.append(match)
+    
+    # Arguments can overlap; convert each file only once.
+    seen   = set()
+    unique = []
+    for path in inputs:
+        if os.path.abspath(path) not in seen:
+            seen.add(os.path.abspath(path))
+            unique.append(path)
+    return unique
+
+def batch_outputs(inputs, output_dir=None):
+    """Choose an output path for each input.  Without an output directory,
+    the output goes next to the input, with ".xml" added to its name.
+    With one, the inputs' directory structure (below the directory they
+    all have in common) is recreated under the output directory."""
+    if output_dir is None:
+        return [path + ".xml" for path in inputs]
+    
+    absolute = [os.path.abspath(path) for path in inputs]
+    common = os.path.commonprefix([os.path.dirname(path) + os.sep 
+                                   for path in absolute])
+    common = common[:common.rfind(os.sep) + 1]
+    return [os.path.join(output_dir, path[len(common):] + ".xml") 
+            for path in absolute]
+
+def skip_outputs(inputs, output_dir=None):
+    """Drop the inputs this batch would write to, which are outputs from
+    an earlier run over the same files, so that running the same batch
+    again doesn't convert its own output."""
+    while True:
+        outputs = set([os.path.abspath(output) 
+                       for output in batch_outputs(inputs, output_dir)])
+        kept = [path for path in inputs if os.path.abspath(path) not in outputs]
+        if len(kept) == len(inputs):
+            return kept
+        # Dropping inputs can change the outputs of the rest (see
+        # batch_outputs), so look again.
+        inputs = kept
+
+def init_worker():
+    """Set up a new worker process.  Workers leave interrupts to the main
+    process, which shuts them down, and build the parsers' shared state
+    up front so that the first file they handle doesn't pay for it."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    ofxtools.OfcParser()
+
+
+def convert_text(text, type_only, kwargs):
+    """Detect the type of 'text' and convert it, returning a tuple of (file
+    type, exit code, result).  The exit code is the one fixofx would have
+    exited with for the same input on the command line, and the result is
+    the converted document, or the error message on failure.  Errors
+    never escape, so that one bad input can't stop a batch or a server."""
+    filetype = "UNKNOWN"
+    try:
+        if text == "" or text is None:
+            return (filetype, 3, "No input.")
+        
+        filetype = ofx.FileTyper(text).trust()
+        if type_only:
+            return (filetype, 0, "")
+        
+        return (filetype, 0, convert(text, filetype, cache=conversion_cache,
+                                     **kwargs))
+    
+    except ParseException, detail:
+        return (filetype, 4, 
+                "Parse exception during '%s' conversion: %s" % (filetype, detail))
+    
+    except TypeError, detail:
+        return (filetype, 5, str(detail))
+    
+    except Exception, detail:
+        return (filetype, 1, "%s: %s" % (detail.__class__.__name__, detail))
+
+def convert_file(job):
+    """Convert one file for a batch, returning a tuple of (input path,
+    file type, seconds taken, exit code, message), where the message is
+    the output path, or the error on failure."""
+    (path, output, type_only, kwargs) = job
+    start = time.time()
+    if not os.path.isfile(path):
+        return (path, "UNKNOWN", time.time() - start, 2, 
+                "'%s' does not appear to be a file." % path)
+    
+    try:
+        srcfile = open(path, 'rU')
+        text = srcfile.read()
+        srcfile.close()
+    except StandardError, detail:
+        return (path, "UNKNOWN", time.time() - start, 1, 
+                "Exception during file read: %s" % detail)
+    
+    (filetype, code, result) = convert_text(text, type_only, kwargs)
+    if code != 0 or type_only:
+        return (path, filetype, time.time() - start, code, result)
+    
+    try:
+        outdir = os.path.dirname(output)
+        if outdir != "" and not os.path.isdir(outdir):
+            try:
+                os.makedirs(outdir)
+            except OSError:
+                # Another worker may have just made it.
+                if not os.path.isdir(outdir):
+                    raise
+        outfile = open(output, 'w')
+        outfile.write(result + "\n")
+        outfile.close()
+    except EnvironmentError, detail:
+        return (path, filetype, time.time() - start, 1, 
+                "Exception during file write: %s" % detail)
+    return (path, filetype, time.time() - start, 0, output)
+
+def convert_batch(inputs, outputs, kwargs, jobs=None, type_only=False, 
+                  report=sys.stdout):
+    """Convert every input across a pool of worker processes, writing a
+    tab-separated status line per file to 'report' as each one finishes.
+    Returns the number of files that failed."""
+    work = [(path, output, type_only, kwargs) 
+            for (path, output) in zip(inputs, outputs)]
+    
+    pool = multiprocessing.Pool(jobs, init_worker)
+    failures = 0
+    try:
+        for (path, filetype, seconds, code, message) in \
+        pool.imap_unordered(convert_file, work, chunksize=4):
+            if code != 0:
+                failures += 1
+            report.write("%s\t%s\t%.3f\t%d\t%s\n" % 
+                         (path, filetype, seconds, code, message))
+            report.flush()
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    pool.join()
+    return failures
+
+#
+# Conversion server.
+#
+
+class ConversionStats:
+    """Thread-safe record of request outcomes and recent latencies."""
+    def __init__(self, window=10000):
+        self.window    = window
+        self.latencies = []
+        self.requests  = 0
+        self.failures  = 0
+        self.lock      = threading.Lock()
+    
+    def record(self, seconds, code):
+        self.lock.acquire()
+        try:
+            self.requests += 1
+            if code != 0:
+                self.failures += 1
+            self.latencies.append(seconds)
+            if len(self.latencies) > self.window:
+                del self.latencies[:len(self.latencies) - self.window]
+        finally:
+            self.lock.release()
+    
+    def report(self):
+        """Return the counts and the latency percentiles, in milliseconds,
+        over the most recent requests."""
+        self.lock.acquire()
+        try:
+            latencies = sorted(self.latencies)
+            report = { "requests" : self.requests, 
+                       "failures" : self.failures }
+        finally:
+            self.lock.release()
+        
+        percentiles = {}
+        if len(latencies) > 0:
+            for pct in (50, 90, 95, 99):
+                rank = max(int(round(pct / 100.0 * len(latencies))) - 1, 0)
+                percentiles["p%d" % pct] = latencies[rank] * 1000
+            percentiles["max"] = latencies[-1] * 1000
+        report["latency_ms"] = percentiles
+        return report
+
+class ConversionHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Handles "POST /convert" with the file to convert as the request
+    body, and "GET /stats".  Conversion options are given as query
+    parameters named after the command line options (fid, org, curdef,
+    lang, bankid, accttype, acctid, balance, dayfirst and type), and
+    default to the options the server was started with.  The response
+    carries the exit code fixofx would have given in an X-Fixofx-Exit-Code
+    header, and the file type in X-Fixofx-File-Type."""
+    
+    # Exit codes mapped to HTTP status codes.
+    statuses = { 0 : 200, 1 : 500, 3 : 400, 4 : 422, 5 : 422 }
+    
+    def do_POST(self):
+        url = urlparse.urlparse(self.path)
+        if url.path != "/convert":
+            self.send_error(404)
+            return
+        
+        start  = time.time()
+        query  = cgi.parse_qs(url.query, keep_blank_values=True)
+        kwargs = dict(self.server.kwargs)
+        for name in ("fid", "org", "curdef", "lang", "bankid", "accttype",
+                     "acctid", "balance"):
+            if name in query:
+                kwargs[name] = query[name][-1]
+        if "dayfirst" in query:
+            kwargs["dayfirst"] = self._flag(query["dayfirst"][-1])
+        type_only = "type" in query and self._flag(query["type"][-1])
+        
+        text = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        (filetype, code, result) = \
+            self.server.pool.apply(convert_text, (text, type_only, kwargs))
+        
+        self._respond(self.statuses.get(code, 500), result, 
+                      { "X-Fixofx-Exit-Code" : str(code),
+                        "X-Fixofx-File-Type" : filetype })
+        self.server.stats.record(time.time() - start, code)
+    
+    def do_GET(self):
+        if urlparse.urlparse(self.path).path != "/stats":
+            self.send_error(404)
+            return
+        self._respond(200, json.dumps(self.server.stats.report()), 
+                      { "Content-Type" : "application/json" })
+    
+    def _flag(self, value):
+        return value.lower() in ("", "1", "true", "yes", "on")
+    
+    def _respond(self, status, body, headers):
+        self.send_response(status)
+        for (name, value) in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def address_string(self):
+        # Unix socket clients have no address.
+        if isinstance(self.client_address, tuple):
+            return self.client_address[0]
+        return "local"
+    
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPServer.BaseHTTPRequestHandler.log_message(self, format, *args)
+
+class ConversionServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+class UnixConversionServer(SocketServer.ThreadingMixIn, 
+                           SocketServer.UnixStreamServer):
+    daemon_threads = True
+    
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        SocketServer.UnixStreamServer.server_bind(self)
+
+def serve(address, kwargs, jobs=None, verbose=False):
+    """Serve conversion requests over HTTP until interrupted or terminated.
+    'address' is either host:port, for a TCP socket, or the path of a Unix
+    socket.  Conversions run in a pool of 'jobs' worker processes;
+    requests beyond that wait their turn."""
+    if ":" in address and not os.sep in address:
+        (host, port) = address.rsplit(":", 1)
+        server = ConversionServer((host or "localhost", int(port)), 
+                                  ConversionHandler)
+    else:
+        server = UnixConversionServer(address, ConversionHandler)
+    
+    server.kwargs  = kwargs
+    server.verbose = verbose
+    server.stats   = ConversionStats()
+    server.pool    = multiprocessing.Pool(jobs, init_worker)
+    
+    # Shut down cleanly when stopped by a service manager, too.  Raising
+    # from the handler could leave a lock held wherever the main thread
+    # happened to be, and hang the shutdown; so ask serve_forever() to
+    # return instead (from another thread, since shutdown() waits for it).
+    def terminate(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+    signal.signal(signal.SIGTERM, terminate)
+    
+    sys.stderr.write("Serving conversions on %s.\n" % address)
+    try:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    finally:
+        server.server_close()
+        server.pool.terminate()
+        if isinstance(server.server_address, str):
+            os.unlink(server.server_address)
+        sys.stderr.write("Served %(requests)d requests (%(failures)d failed).\n" % 
+                         server.stats.report())
+        latency = server.stats.report()["latency_ms"]
+        if len(latency) > 0:
+            sys.stderr.write("Latency (ms): p50 %(p50).1f, p90 %(p90).1f, "
+                             "p99 %(p99).1f, max %(max).1f\n" % latency)
+
+parser = OptionParser(usage="%prog [options] [PATH ...]", description=__doc__)
 parser.add_option("-d", "--debug", action="store_true", dest="debug",
                   default=False, help="spit out gobs of debugging output during parse")
 parser.add_option("-v", "--verbose", action="store_true", dest="verbose",
@@ -146,8 +551,24 @@ parser.add_option("--acctid", dest="acctid", default="UNKNOWN",
                   help="(QIF only) Account number to use in output")
 parser.add_option("--balance", dest="balance", default="UNKNOWN",
                   help="(QIF only) Account balance to use in output")
+parser.add_option("--mmap", action="store_true", dest="mmap", default=False,
+                  help="memory-map the -f file, converting OFX 1.x as it's read")
+parser.add_option("--timings", action="store_true", dest="timings", default=False,
+                  help="write the time taken by each conversion stage to STDERR as JSON")
 parser.add_option("--dayfirst", action="store_true", dest="dayfirst", default=False,
                   help="(QIF only) Parse dates day first (UK format)")
+parser.add_option("-m", "--manifest", dest="manifest", default=None,
+                  help="(batch only) file listing paths to convert, one per line")
+parser.add_option("-o", "--output-dir", dest="output_dir", default=None,
+                  help="(batch only) directory to write converted files to")
+parser.add_option("-j", "--jobs", dest="jobs", type="int", default=None,
+                  help="(batch/server only) number of worker processes (default: one per CPU)")
+parser.add_option("--serve", dest="serve", default=None, metavar="ADDRESS",
+                  help="serve conversions over HTTP on host:port or a Unix socket path")
+parser.add_option("--cache", dest="cache", default=None, metavar="DIR",
+                  help="reuse earlier conversions of the same input, kept in DIR")
+parser.add_option("--cache-size", dest="cache_size", type="float", default=100,
+                  metavar="MB", help="size limit for the --cache directory (default: 100)")
 (options, args) = parser.parse_args()
 
 #
@@ -160,44 +581,170 @@ if options.verbose and not hasattr(open, 'newlines'):
 
 if options.verbose: print "Options: %s" % options
 
+# Conversion options, as passed to convert() by batch and server modes.
+kwargs = { "verbose"  : options.verbose,  "fid"      : options.fid,
+           "org"      : options.org,      "bankid"   : options.bankid,
+           "accttype" : options.accttype, "acctid"   : options.acctid,
+           "balance"  : options.balance,  "curdef"   : options.curdef,
+           "lang"     : options.lang,     "dayfirst" : options.dayfirst,
+           "debug"    : options.debug }
+
+# Earlier conversions, shared by every conversion in this run (including
+# those in batch and server worker processes, which inherit it).
+conversion_cache = None
+if options.cache is not None:
+    conversion_cache = ofxtools.ConversionCache(
+        ofxtools.DirectoryStore(options.cache,
+                                max_bytes=int(options.cache_size * 1024 * 1024)))
+
 #
-# Load up the raw text to be converted.
+# In batch mode, each PATH argument (a file, a directory, or a glob
+# pattern) and each path in the manifest is converted, and a status line
+# giving the input path, file type, seconds taken, exit code and output
+# path (or error) is printed for each.
+#
+
+if len(args) > 0 or options.manifest is not None:
+    inputs  = skip_outputs(batch_inputs(args, options.manifest),
+                           options.output_dir)
+    outputs = batch_outputs(inputs, options.output_dir)
+    
+    start    = time.time()
+    failures = convert_batch(inputs, outputs, kwargs, jobs=options.jobs,
+                             type_only=options.type)
+    
+    sys.stderr.write("Converted %d of %d files in %.1f seconds.\n" % 
+                     (len(inputs) - failures, len(inputs), time.time() - start))
+    if failures > 0:
+        sys.stderr.write("fixofx failed with error code 6\n")
+        sys.exit(6)
+    sys.exit(0)
+
+#
+# In server mode, conversion requests are taken over HTTP (see
+# ConversionHandler) until the server is interrupted.
 #
 
+if options.serve is not None:
+    serve(options.serve, kwargs, jobs=options.jobs, verbose=options.verbose)
+    sys.exit(0)
+
 rawtext = None
 
-if options.filename:
-    if os.path.isfile(options.filename):
-        if options.verbose: 
-            sys.stderr.write("Reading from '%s'\n." % options.filename)
-        
-        try:
-            srcfile = open(options.filename, 'rU')
-            rawtext = srcfile.read()
-            srcfile.close()
-        except StandardError, detail:
-            print "Exception during file read:\n%s" % detail
-            print "Exiting."
-            sys.stderr.write("fixofx failed with error code 1\n")
-            sys.exit(1)
-        
-    else:
-        print "'%s' does not appear to be a file.  Try --help." % options.filename
+# With --timings, each stage of the conversion (reading the input
+# included) is timed, and the stages are written out as JSON when fixofx
+# exits, whether or not the conversion worked.
+timings = None
+if options.timings:
+    timings = ofx.Timings()
+    
+    def write_timings():
+        json.dump(timings.as_dict(), sys.stderr, indent=2, sort_keys=True)
+        sys.stderr.write("\n")
+    atexit.register(write_timings)
+
+#
+# With --mmap, the file given with -f is memory-mapped instead of read.
+# OFX 1.x is converted as it's read from the map and written out as it's
+# converted, so memory use depends on the largest element rather than on
+# the size of the file.  Other formats still need the whole text.
+#
+
+if options.mmap:
+    if options.filename is None or not os.path.isfile(options.filename):
+        print "--mmap needs a file to convert, given with -f.  Try --help."
         sys.stderr.write("fixofx failed with error code 2\n")
         sys.exit(2)
-
-else:
-    if options.verbose: 
-        sys.stderr.write("Reading from standard input.\n")
     
-    stdin_universal = os.fdopen(os.dup(sys.stdin.fileno()), "rU")
-    rawtext = stdin_universal.read()
+    if options.verbose: 
+        sys.stderr.write("Mapping '%s'.\n" % options.filename)
+    try:
+        mapped = map_file(options.filename)
+    except EnvironmentError, detail:
+        print "Exception during file read:\n%s" % detail
+        print "Exiting."
+        sys.stderr.write("fixofx failed with error code 1\n")
+        sys.exit(1)
     
-    if rawtext == "" or rawtext is None:
-        print "No input.  Pipe a file to convert to the script,\n" + \
-              "or call with -f.  Call with --help for more info."
+    if mapped is None:
+        print "No input.  '%s' is empty." % options.filename
         sys.stderr.write("fixofx failed with error code 3\n")
         sys.exit(3)
+    
+    with ofx.timed(timings, "filetype", mapped):
+        filetype = ofx.FileTyper(mapped).trust()
+    if options.type:
+        print "Input file type is %s." % filetype
+        sys.exit(0)
+    
+    if filetype.startswith("OFX/1"):
+        # The cache holds whole documents, which is what streaming avoids
+        # building.
+        if conversion_cache is not None:
+            sys.stderr.write("Warning: --cache is not used for OFX 1.x "
+                             "files converted with --mmap.\n")
+        if options.verbose: 
+            sys.stderr.write("Converting from %s format as it's read.\n" % filetype)
+        try:
+            reader = ofx.Reader(mapped, rules=ofx.Response.rules)
+            reader.write_xml(sys.stdout, original_format=filetype,
+                             timings=timings)
+        except ParseException, detail:
+            print "Parse exception during '%s' conversion:\n%s" % (filetype, detail)
+            print "Exiting."
+            sys.stderr.write("fixofx failed with error code 4\n")
+            sys.exit(4)
+        sys.stdout.write("\n")
+        sys.exit(0)
+    
+    # Read the rest the same way as without --mmap, universal newlines
+    # and all.
+    with ofx.timed(timings, "read") as stage:
+        rawtext = mapped[:].replace("\r\n", "\n").replace("\r", "\n")
+        stage.output_bytes = len(rawtext)
+    mapped.close()
+
+#
+# Load up the raw text to be converted.
+#
+
+if rawtext is None:
+    if options.filename:
+        if os.path.isfile(options.filename):
+            if options.verbose: 
+                sys.stderr.write("Reading from '%s'\n." % options.filename)
+            
+            try:
+                with ofx.timed(timings, "read") as stage:
+                    srcfile = open(options.filename, 'rU')
+                    rawtext = srcfile.read()
+                    srcfile.close()
+                    stage.output_bytes = len(rawtext)
+            except StandardError, detail:
+                print "Exception during file read:\n%s" % detail
+                print "Exiting."
+                sys.stderr.write("fixofx failed with error code 1\n")
+                sys.exit(1)
+            
+        else:
+            print "'%s' does not appear to be a file.  Try --help." % options.filename
+            sys.stderr.write("fixofx failed with error code 2\n")
+            sys.exit(2)
+
+    else:
+        if options.verbose: 
+            sys.stderr.write("Reading from standard input.\n")
+        
+        with ofx.timed(timings, "read") as stage:
+            stdin_universal = os.fdopen(os.dup(sys.stdin.fileno()), "rU")
+            rawtext = stdin_universal.read()
+            stage.output_bytes = len(rawtext)
+        
+        if rawtext == "" or rawtext is None:
+            print "No input.  Pipe a file to convert to the script,\n" + \
+                  "or call with -f.  Call with --help for more info."
+            sys.stderr.write("fixofx failed with error code 3\n")
+            sys.exit(3)
 
 #
 # Convert the raw text to OFX 2.0.
@@ -207,7 +754,8 @@ try:
     # Determine the type of file contained in 'text', using a quick guess
     # rather than parsing the file to make sure.  (Parsing will fail
     # below if the guess is wrong on OFX/1 and QIF.)
-    filetype  = ofx.FileTyper(rawtext).trust()
+    with ofx.timed(timings, "filetype", rawtext):
+        filetype = ofx.FileTyper(rawtext).trust()
     
     if options.type:
         print "Input file type is %s." % filetype
@@ -215,13 +763,13 @@ try:
     elif options.debug:
         sys.stderr.write("Input file type is %s.\n" % filetype)
     
-    converted = convert(rawtext, filetype, verbose=options.verbose, 
-                        fid=options.fid, org=options.org, bankid=options.bankid, 
-                        accttype=options.accttype, acctid=options.acctid, 
-                        balance=options.balance, curdef=options.curdef,
-                        lang=options.lang, dayfirst=options.dayfirst,
-                        debug=options.debug)
-    print converted
+    convert(rawtext, filetype, verbose=options.verbose, fid=options.fid,
+            org=options.org, bankid=options.bankid, accttype=options.accttype,
+            acctid=options.acctid, balance=options.balance,
+            curdef=options.curdef, lang=options.lang, dayfirst=options.dayfirst,
+            debug=options.debug, cache=conversion_cache, output=sys.stdout,
+            timings=timings)
+    sys.stdout.write("\n")
     sys.exit(0)
 
 except ParseException, detail:
@@ -22,13 +22,18 @@
 
 from ofx.account import *
 from ofx.builder import *
+from ofx.cache import *
 from ofx.client import *
+from ofx.connection import *
 from ofx.document import *
 from ofx.error import *
 from ofx.filetyper import *
 from ofx.generator import *
 from ofx.institution import *
 from ofx.parser import *
+from ofx.reader import *
 from ofx.request import *
 from ofx.response import *
+from ofx.rules import *
+from ofx.timings import *
 from ofx.validators import *
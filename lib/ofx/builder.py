@@ -39,6 +39,8 @@ component using the name of the instance.  Example usage:
             # ... other OFX message components here ...
 """
 
+import threading
+
 # FIXME: This supports OFX 1.02.  Make something that supports OFX 2.0.
 
 # REVIEW: This class is pretty hackish, and it's not easy to maintain
@@ -69,19 +71,29 @@ class Tag:
         self.message_block = message_block
         self.payload_block = payload_block
         self.document_type = document_type
+        self.content       = not (aggregate or header or header_block or
+                                  message_block or payload_block or
+                                  document_type is not None)
 
     def __call__(self, *values, **params):
         """Invoked when an OfxTag instance is invoked as a method
         call (see constructor documentation for an example).  The
         instance will return a string using its tag as a marker,
-        with the arguments to the call used as the value of the tag."""
-        if self.document_type is not None:
+        with the arguments to the call used as the value of the tag.
+        Inside a 'with Fragments():' block, it returns a Fragment
+        instead."""
+        if self.content:
+            # Content tags are by far the most common, so they come first.
+            return "<" + self.tag + ">" + ''.join([str(x) for x in values]) + "\r\n"
+
+        elif self.document_type is not None:
             self._output_version(self.document_type)
+            return None
 
         elif self.message_block:
             # For consistency, we use an empty join to put together
             # parts of an OFX message in a "message block" tag.
-            return ''.join(values)
+            start, end = "", ""
 
         elif self.header_block:
             if self.output == "ofx2":
@@ -89,27 +101,104 @@ class Tag:
             else:
                 # The header block takes all the headers and adds an
                 # extra newline to signal the end of the block.
-                return ''.join(values) + "\r\n"
+                start, end = "", "\r\n"
 
         elif self.payload_block:
             # This is really a hack, to make sure that the OFX
             # tag generation doesn't end with a newline.  Hmm...
-            return "<" + self.tag + ">" + "\r\n" + ''.join(values) \
-                + "</" + self.tag + ">"
+            start, end = "<" + self.tag + ">\r\n", "</" + self.tag + ">"
 
         elif self.header:
             # This is an individual name/value pair in the header.
-            return self.tag + ":" + ''.join(values) + "\r\n"
-
-        elif self.aggregate:
-            return "<" + self.tag + ">" + "\r\n" + ''.join(values) \
-                + "</" + self.tag + ">" + "\r\n"
+            start, end = self.tag + ":", "\r\n"
 
         else:
-            if values is None: return ""
-            values = [str(x) for x in values]
-            if values == "": return ""
-            return "<" + self.tag + ">" + ''.join(values) + "\r\n"
+            start, end = "<" + self.tag + ">\r\n", "</" + self.tag + ">\r\n"
+
+        if _fragments.depth > 0:
+            # Small aggregates are cheaper to join on the spot; only keep
+            # references to big pieces and to other fragments.
+            for value in values:
+                if type(value) is Fragment or len(value) > _JOIN_LIMIT:
+                    return Fragment(start, values, end)
+        return start + ''.join(values) + end
+
+# Values longer than this are never copied inside a Fragments block.
+_JOIN_LIMIT = 4096
+
+class _FragmentState(threading.local):
+    depth = 0
+
+_fragments = _FragmentState()
+
+class Fragments:
+    """Makes the tags called inside a 'with' block return Fragment objects
+    rather than strings:
+
+        with Fragments():
+            document = DOCUMENT(HEADER(...), OFX(...))
+        text = str(document)
+
+    Building a document out of strings copies each aggregate's contents
+    once for every level of nesting above it, and so does adding up a
+    list of transactions with '+=' one at a time.  Fragments just keep
+    references to their contents, so the whole document is put together
+    once, at the end.  Blocks can be nested, and the setting is per
+    thread."""
+    def __enter__(self):
+        _fragments.depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        _fragments.depth -= 1
+        return False
+
+class Fragment(object):
+    """A piece of a document being built by tags inside a Fragments block.
+    A fragment holds the strings and other fragments it is made of, and
+    becomes a string when str() is called on it or when it is written out
+    with write().  Adding a fragment to a string or to another fragment
+    makes a new fragment without copying either one."""
+    __slots__ = ("start", "values", "end")
+
+    def __init__(self, start, values, end):
+        self.start  = start
+        self.values = values
+        self.end    = end
+
+    def __add__(self, other):
+        return Fragment("", (self, other), "")
+
+    def __radd__(self, other):
+        return Fragment("", (other, self), "")
+
+    def __str__(self):
+        strings = []
+        self.write(strings.append)
+        return ''.join(strings)
+
+    def __eq__(self, other):
+        return str(self) == str(other)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return "Fragment(%r)" % str(self)
+
+    def write(self, write):
+        """Calls write() with each string in the fragment, in order."""
+        # Walk the fragments with an explicit stack, since a long run of
+        # '+=' makes a tree as deep as the number of additions.
+        stack = [self]
+        while stack:
+            piece = stack.pop()
+            if type(piece) is Fragment:
+                stack.append(piece.end)
+                stack.extend(reversed(piece.values))
+                stack.append(piece.start)
+            else:
+                write(piece)
 
 # The following is really dumb and hackish.  Is there any way to know the
 # name of the variable called when __call__ is invoked?  I guess that
@@ -126,8 +215,8 @@ __all__ = ['ACCTID', 'ACCTINFORQ', 'ACCTINFOTRNRQ', 'ACCTTYPE', 'APPID',
 'CHARSET', 'CHECKNUM', 'CLIENTROUTING', 'CLTCOOKIE', 'CODE', 'COMPRESSION',
 'CREDITCARDMSGSRQV1', 'CREDITCARDMSGSRSV1', 'CURDEF', 'DATA', 'DOCUMENT',
 'DTACCTUP', 'DTASOF', 'DTCLIENT', 'DTEND', 'DTPOSTED', 'DTPROFUP', 'DTSERVER',
-'DTSTART', 'ENCODING', 'FI', 'FID', 'FITID', 'HEADER', 'INCBAL', 'INCLUDE',
-'INCOO', 'INCPOS', 'INCTRAN', 'INVACCTFROM', 'INVSTMTMSGSRQV1', 'INVSTMTRQ',
+'DTSTART', 'ENCODING', 'FI', 'FID', 'FITID', 'Fragment', 'Fragments',
+'HEADER', 'INCBAL', 'INCLUDE', 'INCOO', 'INCPOS', 'INCTRAN', 'INVACCTFROM', 'INVSTMTMSGSRQV1', 'INVSTMTRQ',
 'INVSTMTTRNRQ', 'LANGUAGE', 'LEDGERBAL', 'MEMO', 'MESSAGE', 'NAME',
 'NEWFILEUID', 'OFX', 'OFXHEADER', 'OFX1', 'OFX2', 'OLDFILEUID', 'ORG',
 'PROFMSGSRQV1', 'PROFRQ', 'PROFTRNRQ', 'SECURITY', 'SEVERITY',
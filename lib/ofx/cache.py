@@ -0,0 +1,267 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# ofx.cache - things ofx.Client remembers about institutions between requests.
+#
+
+import json
+import ofx
+import os
+import re
+import threading
+import time
+
+_DTPROFUP = re.compile(r"<DTPROFUP>\s*([^<\r\n]*)")
+
+class DateRangeCache:
+    """Remembers, for each institution and kind of statement, the longest
+    date range ('daysago' value) the server last accepted, so that
+    ofx.Client can start its 365/90/30-day retry ladder there instead of
+    paying for the failed requests every time:
+
+        client = ofx.Client(ranges=ofx.DateRangeCache("ranges.json"))
+
+    Institutions are told apart by FID and ORG.  Once 'reprobe_interval'
+    seconds have passed since the client last tried the full ladder for
+    an institution, start() returns None so that the longer ranges get
+    tried again, in case the server has started accepting them.
+
+    If a path is given, the cache is loaded from that JSON file, and
+    saved back to it whenever it changes.  The 'hits' and 'probes'
+    counters record how often start() returned a learned range, and how
+    often it sent the client back to the top of the ladder."""
+    def __init__(self, path=None, reprobe_interval=7 * 24 * 60 * 60):
+        self.path   = path
+        self.reprobe_interval = reprobe_interval
+        self.ranges = {}
+        self.lock   = threading.Lock()
+        self.hits   = 0
+        self.probes = 0
+        if path is not None and os.path.exists(path):
+            try:
+                self.ranges = json.load(open(path))
+            except ValueError:
+                # A damaged cache file just means relearning the ranges.
+                pass
+
+    def start(self, institution, kind):
+        """Return the daysago value to start with for the institution and
+        kind of statement ("bank" or "creditcard"), or None to try the
+        whole ladder."""
+        self.lock.acquire()
+        try:
+            entry = self.ranges.get(self._key(institution, kind))
+            if entry is None or \
+               time.time() - entry["probed"] >= self.reprobe_interval:
+                self.probes += 1
+                return None
+            self.hits += 1
+            return entry["daysago"]
+        finally:
+            self.lock.release()
+
+    def record(self, institution, kind, daysago, probed):
+        """Record that the server accepted a request for 'daysago' days.
+        'probed' is true if the client started at the top of the ladder
+        to get there."""
+        key = self._key(institution, kind)
+        self.lock.acquire()
+        try:
+            entry = self.ranges.get(key)
+            if probed or entry is None:
+                entry = { "daysago" : daysago, "probed" : time.time() }
+            elif entry["daysago"] != daysago:
+                entry = { "daysago" : daysago, "probed" : entry["probed"] }
+            else:
+                return
+            self.ranges[key] = entry
+            self._save()
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        return { "hits"   : self.hits,
+                 "probes" : self.probes,
+                 "size"   : len(self.ranges) }
+
+    def clear(self):
+        """Forget every institution and reset the counters."""
+        self.lock.acquire()
+        try:
+            self.ranges = {}
+            self.hits   = 0
+            self.probes = 0
+            self._save()
+        finally:
+            self.lock.release()
+
+    def _key(self, institution, kind):
+        return "%s/%s/%s" % (institution.ofx_fid, institution.ofx_org, kind)
+
+    def _save(self):
+        # Write a new file and move it into place, so that a crash can't
+        # leave a half-written cache behind.
+        if self.path is None:
+            return
+        temp_path = self.path + ".tmp"
+        temp = open(temp_path, "w")
+        try:
+            json.dump(self.ranges, temp, indent=2, sort_keys=True)
+        finally:
+            temp.close()
+        os.rename(temp_path, self.path)
+
+class ProfileCache:
+    """Keeps the FI profile each institution last sent, along with its
+    DTPROFUP, so that ofx.Client can send that DTPROFUP with the next
+    profile request.  If the server says the client is up to date (status
+    code 1), the client returns the cached ofx.Response instead:
+
+        client = ofx.Client(profiles=ofx.ProfileCache("profiles"))
+
+    Institutions are told apart by FID and ORG.  Profiles are kept in
+    memory, already parsed; if a directory is given, the raw profiles are
+    also saved there, and read back (and parsed) the first time they're
+    needed.  A profile older than 'max_age' seconds, if given, is treated
+    as missing, so that it gets downloaded in full again.  The 'hits' and
+    'misses' counters record how many profile requests were answered from
+    the cache, and how many downloaded a full profile."""
+    def __init__(self, path=None, max_age=None):
+        self.path     = path
+        self.max_age  = max_age
+        self.profiles = {}
+        self.lock     = threading.Lock()
+        self.hits     = 0
+        self.misses   = 0
+        if path is not None and not os.path.isdir(path):
+            os.makedirs(path)
+
+    def dtprofup(self, institution):
+        """Return the DTPROFUP of the cached profile for the institution,
+        or None if there isn't one."""
+        entry = self._entry(institution)
+        if entry is None:
+            return None
+        return entry[0]
+
+    def response(self, institution):
+        """Return the cached profile for the institution as an ofx.Response,
+        or None if there isn't one."""
+        entry = self._entry(institution)
+        if entry is not None and entry[2] is None:
+            # Loaded from disk, and not parsed yet.
+            try:
+                entry[2] = ofx.Response(open(self._file(institution)).read())
+            except Exception:
+                self._forget(institution)
+                return None
+
+        if entry is not None:
+            self.lock.acquire()
+            self.hits += 1
+            self.lock.release()
+            return entry[2]
+        return None
+
+    def store(self, institution, response):
+        """Cache a full profile response.  Responses without a DTPROFUP
+        can't be checked for freshness, so they aren't kept."""
+        match = _DTPROFUP.search(response.as_string())
+        if match is None or match.group(1).strip() == "":
+            return
+        entry = [match.group(1).strip(), time.time(), response]
+
+        self.lock.acquire()
+        try:
+            self.profiles[self._key(institution)] = entry
+            self.misses += 1
+        finally:
+            self.lock.release()
+
+        if self.path is not None:
+            file_path = self._file(institution)
+            temp = open(file_path + ".tmp", "w")
+            try:
+                temp.write(response.as_string())
+            finally:
+                temp.close()
+            os.rename(file_path + ".tmp", file_path)
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        return { "hits"   : self.hits,
+                 "misses" : self.misses,
+                 "size"   : len(self.profiles) }
+
+    def clear(self):
+        """Forget every profile (in memory and on disk) and reset the
+        counters."""
+        self.lock.acquire()
+        try:
+            self.profiles = {}
+            self.hits     = 0
+            self.misses   = 0
+            if self.path is not None:
+                for name in os.listdir(self.path):
+                    if name.endswith(".ofx"):
+                        os.remove(os.path.join(self.path, name))
+        finally:
+            self.lock.release()
+
+    def _entry(self, institution):
+        # Returns [dtprofup, fetched, response], where the response is None
+        # if the profile was found on disk and hasn't been parsed yet.
+        key = self._key(institution)
+        self.lock.acquire()
+        try:
+            entry = self.profiles.get(key)
+            if entry is None and self.path is not None:
+                entry = self._load(institution)
+                if entry is not None:
+                    self.profiles[key] = entry
+            if entry is not None and self.max_age is not None and \
+               time.time() - entry[1] > self.max_age:
+                return None
+            return entry
+        finally:
+            self.lock.release()
+
+    def _forget(self, institution):
+        self.lock.acquire()
+        try:
+            self.profiles.pop(self._key(institution), None)
+            if self.path is not None and os.path.exists(self._file(institution)):
+                os.remove(self._file(institution))
+        finally:
+            self.lock.release()
+
+    def _load(self, institution):
+        # Read just the DTPROFUP from a saved profile; the rest is parsed
+        # only if the server says it's still current.
+        file_path = self._file(institution)
+        if not os.path.exists(file_path):
+            return None
+        match = _DTPROFUP.search(open(file_path).read())
+        if match is None:
+            return None
+        return [match.group(1).strip(), os.path.getmtime(file_path), None]
+
+    def _key(self, institution):
+        return "%s/%s" % (institution.ofx_fid, institution.ofx_org)
+
+    def _file(self, institution):
+        name = re.sub(r"[^A-Za-z0-9_.-]", "_", self._key(institution))
+        return os.path.join(self.path, name + ".ofx")
@@ -16,9 +16,14 @@
 # ofx.client - user agent for sending OFX requests and checking responses.
 #
 
+from collections import deque
 import ofx
+import threading
 import urllib2
 
+# The statement date ranges to try, in days, longest first.
+_DAYSAGO = (365, 90, 30)
+
 class Client:
     """Network client for communicating with OFX servers.  The client
     handles forming a valid OFX request document, transmiting that
@@ -26,24 +31,54 @@ class Client:
     error flags and throwing errors as exceptions, and returning the
     requested OFX document if the request was successful."""
 
-    def __init__(self, debug=False):
-        """Constructs the Client object.  No configuration options
-        are offered."""
+    def __init__(self, debug=False, pool=None, ranges=None, profiles=None):
+        """Constructs the Client object.  If an ofx.ConnectionPool is
+        given, requests are sent on its keep-alive connections;
+        otherwise each request opens a new connection with urllib2.
+        If an ofx.DateRangeCache is given, statement requests start
+        with the date range each institution last accepted, and if an
+        ofx.ProfileCache is given, FI profiles are only downloaded when
+        they've changed."""
         # FIXME: Need to let the client set itself for OFX 1.02 or OFX 2.0 formatting.
-        self.request_msg = None
+        # The last request message, kept per thread so that the threads
+        # get_statements() runs don't overwrite each other's.
+        self.last = threading.local()
         self.debug = debug
+        self.pool = pool
+        self.ranges = ranges
+        self.profiles = profiles
 
     def get_fi_profile(self, institution,
                        username="anonymous00000000000000000000000",
                        password="anonymous00000000000000000000000"):
         request = ofx.Request()
-        self.request_msg = request.fi_profile(institution, username, password)
-        return self._send_request(institution.ofx_url, self.request_msg)
+        dtprofup = None
+        if self.profiles is not None:
+            dtprofup = self.profiles.dtprofup(institution)
+        self.last.request_msg = request.fi_profile(institution, username,
+                                                   password, dtprofup=dtprofup)
+        response = self._send_request(institution.ofx_url, self.last.request_msg)
+
+        if self.profiles is not None:
+            status = response.as_dict()["PROFMSGSRSV1"]["PROFTRNRS"]["STATUS"]
+            if dtprofup is not None and status.asDict().get("CODE") == "1":
+                # Code "1" means our copy of the profile is up to date.
+                cached = self.profiles.response(institution)
+                if cached is not None:
+                    return cached
+                # Our copy couldn't be read back after all, so the
+                # response has no profile in it; ask for the whole thing.
+                self.last.request_msg = request.fi_profile(institution,
+                                                           username, password)
+                response = self._send_request(institution.ofx_url,
+                                              self.last.request_msg)
+            self.profiles.store(institution, response)
+        return response
 
     def get_account_info(self, institution, username, password):
         request = ofx.Request()
-        self.request_msg = request.account_info(institution, username, password)
-        return self._send_request(institution.ofx_url, self.request_msg)
+        self.last.request_msg = request.account_info(institution, username, password)
+        return self._send_request(institution.ofx_url, self.last.request_msg)
 
     def get_statement(self, account, username, password):
         acct_type = account.get_ofx_accttype()
@@ -62,22 +97,8 @@ class Client:
         request = ofx.Request()
         # I'm breaking out these retries by statement type since I'm assuming that bank,
         # credit card, and investment OFX servers may each have different behaviors.
-        try:
-            # First, try to get a statement for the full year.  The USAA and American Express
-            # OFX servers return a valid statement, although USAA only includes 90 days and
-            # American Express seems to only include back to the first of the year.
-            self.request_msg = request.bank_stmt(account, username, password, daysago=365)
-            return self._send_request(account.institution.ofx_url, self.request_msg)
-        except ofx.Error, detail:
-            try:
-                # If that didn't work, try 90 days back.
-                self.request_msg = request.bank_stmt(account, username, password, daysago=90)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
-            except ofx.Error, detail:
-                # If that also didn't work, try 30 days back, which has been our default and
-                # which always seems to work across all OFX servers.
-                self.request_msg = request.bank_stmt(account, username, password, daysago=30)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
+        return self._get_stmt("bank", request.bank_stmt,
+                              account, username, password)
 
     def get_creditcard_statement(self, account, username, password):
         """Sends an OFX request for the given user's credit card
@@ -85,19 +106,86 @@ class Client:
         successful.  If the OFX server returns an error, the client
         will throw an OfxException indicating the error code and
         message."""
-        # See comments in get_bank_statement, above, which explain these try/catch
-        # blocks.
         request = ofx.Request()
-        try:
-            self.request_msg = request.creditcard_stmt(account, username, password, daysago=365)
-            return self._send_request(account.institution.ofx_url, self.request_msg)
-        except ofx.Error, detail:
+        return self._get_stmt("creditcard", request.creditcard_stmt,
+                              account, username, password)
+
+    def get_statements(self, accounts, threads=8, per_institution=2):
+        """Fetches statements for many accounts at once.  'accounts' is a
+        list of (account, username, password) tuples.  Up to 'threads'
+        requests are sent at a time, but no more than 'per_institution'
+        to any one OFX server (institutions are told apart by their OFX
+        URL), so that a long list of accounts at one bank doesn't hold
+        up everyone else or get us throttled.
+
+        Returns a list with an (account, response, error) tuple for each
+        account, in the order given.  If the statement was fetched, the
+        response is its ofx.Response and the error is None; otherwise the
+        response is None, and the error is the exception (usually an
+        ofx.Error) that get_statement raised for that account.  The
+        requests are sent from other threads, so get_request_message()
+        doesn't return them."""
+        results = [None] * len(accounts)
+        pending = {}
+        order   = []
+        for index, job in enumerate(accounts):
+            url = job[0].institution.ofx_url
+            if url not in pending:
+                pending[url] = deque()
+                order.append(url)
+            pending[url].append((index, job))
+
+        active    = dict([(url, 0) for url in order])
+        order     = deque(order)
+        condition = threading.Condition()
+
+        def next_job():
+            # Take a job from the next institution (in turn) that has
+            # work waiting and is under its limit, or return None once
+            # there's nothing left to start.
+            condition.acquire()
             try:
-                self.request_msg = request.creditcard_stmt(account, username, password, daysago=90)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
-            except ofx.Error, detail:
-                self.request_msg = request.creditcard_stmt(account, username, password, daysago=30)
-                return self._send_request(account.institution.ofx_url, self.request_msg)
+                while len(order) > 0:
+                    for i in range(len(order)):
+                        url = order[0]
+                        order.rotate(-1)
+                        if active[url] < per_institution:
+                            active[url] += 1
+                            index, job = pending[url].popleft()
+                            if len(pending[url]) == 0:
+                                order.remove(url)
+                            return url, index, job
+                    condition.wait()
+                return None
+            finally:
+                condition.release()
+
+        def work():
+            while True:
+                taken = next_job()
+                if taken is None:
+                    return
+                url, index, (account, username, password) = taken
+                try:
+                    try:
+                        response = self.get_statement(account, username, password)
+                        results[index] = (account, response, None)
+                    except Exception, error:
+                        results[index] = (account, None, error)
+                finally:
+                    condition.acquire()
+                    active[url] -= 1
+                    condition.notifyAll()
+                    condition.release()
+
+        workers = [threading.Thread(target=work)
+                   for i in range(min(threads, len(accounts)))]
+        for worker in workers:
+            worker.setDaemon(True)
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
 
     def get_closing(self, account, username, password):
         # FIXME: Make sure this list only exists in one place and isn't duplicated here.
@@ -116,8 +204,8 @@ class Client:
         the request is successful."""
         acct_type = account.get_ofx_accttype()
         request = ofx.Request()
-        self.request_msg = request.bank_closing(account, username, password)
-        return self._send_request(account.institution.ofx_url, self.request_msg)
+        self.last.request_msg = request.bank_closing(account, username, password)
+        return self._send_request(account.institution.ofx_url, self.last.request_msg)
 
     def get_creditcard_closing(self, account, username, password):
         """Sends an OFX request for the given user's credit card
@@ -126,24 +214,59 @@ class Client:
         will throw an OfxException indicating the error code and
         message."""
         request = ofx.Request()
-        self.request_msg = request.creditcard_closing(account, username, password)
-        return self._send_request(account.institution.ofx_url, self.request_msg)
+        self.last.request_msg = request.creditcard_closing(account, username, password)
+        return self._send_request(account.institution.ofx_url, self.last.request_msg)
 
     def get_request_message(self):
-        """Returns the last request message (or None if no request has been
-        sent) for debugging purposes."""
-        return self.request_msg
+        """Returns the last request message sent by the calling thread (or
+        None if it hasn't sent one) for debugging purposes.  Requests made
+        by get_statements() are sent from its own threads, so they aren't
+        returned here."""
+        return getattr(self.last, "request_msg", None)
+
+    # Read-only, for code that used the attribute this replaced.
+    request_msg = property(get_request_message)
+
+    def _get_stmt(self, kind, build, account, username, password):
+        # First, try to get a statement for the full year.  The USAA and American Express
+        # OFX servers return a valid statement, although USAA only includes 90 days and
+        # American Express seems to only include back to the first of the year.  If that
+        # doesn't work, try 90 days back, and then 30 days back, which has been our default
+        # and which always seems to work across all OFX servers.  If the date range cache
+        # knows what this institution accepted last time, skip the longer ranges.
+        start = None
+        if self.ranges is not None:
+            start = self.ranges.start(account.institution, kind)
+        ladder = [daysago for daysago in _DAYSAGO
+                  if start is None or daysago <= max(start, _DAYSAGO[-1])]
+
+        for daysago in ladder:
+            self.last.request_msg = build(account, username, password, daysago=daysago)
+            try:
+                response = self._send_request(account.institution.ofx_url,
+                                              self.last.request_msg)
+            except ofx.Error, detail:
+                if daysago == ladder[-1]:
+                    raise
+                continue
+            if self.ranges is not None:
+                self.ranges.record(account.institution, kind, daysago,
+                                   probed=start is None)
+            return response
 
     def _send_request(self, url, request_body):
         """Transmits the message to the server and checks the response
         for error status."""
 
-        request = urllib2.Request(url, request_body,
-                                  { "Content-type": "application/x-ofx",
-                                    "Accept": "*/*, application/x-ofx" })
-        stream = urllib2.urlopen(request)
-        response = stream.read()
-        stream.close()
+        headers = { "Content-type": "application/x-ofx",
+                    "Accept": "*/*, application/x-ofx" }
+        if self.pool is not None:
+            response = self.pool.post(url, request_body, headers)
+        else:
+            request = urllib2.Request(url, request_body, headers)
+            stream = urllib2.urlopen(request)
+            response = stream.read()
+            stream.close()
 
         if self.debug:
             print response
@@ -170,6 +293,11 @@ class Client:
                 parsed_ofx["SIGNUPMSGSRSV1"]["ACCTINFOTRNRS"]["STATUS"]
             self._check_status(acctinfo_status, "account information")
 
+        elif parsed_ofx.has_key("PROFMSGSRSV1"):
+            profile_status = \
+                parsed_ofx["PROFMSGSRSV1"]["PROFTRNRS"]["STATUS"]
+            self._check_status(profile_status, "financial institution profile")
+
         return response
 
     def _check_status(self, status_block, description):
@@ -0,0 +1,172 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+# ofx.connection - keep-alive HTTP connections for talking to OFX servers.
+#
+
+import httplib
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+from StringIO import StringIO
+
+class ConnectionPool:
+    """Pool of keep-alive HTTP connections, kept separately for each OFX
+    URL.  Pass one to ofx.Client to have requests to the same server
+    (including the retries in get_bank_statement) share a connection
+    instead of opening a new one, and doing a new TLS handshake, every
+    time:
+
+        client = ofx.Client(pool=ofx.ConnectionPool(size=2, idle_timeout=30))
+
+    At most 'size' idle connections are kept for each URL, and a
+    connection left idle for more than 'idle_timeout' seconds is closed
+    rather than reused, since servers drop quiet connections on their
+    own.  A reused connection that turns out to have been closed by the
+    server is replaced, and the request sent again, once.  The pool is
+    safe to share between threads.
+
+    The pool sends requests with httplib directly, so unlike urllib2 it
+    doesn't follow redirects or use proxies.  A response with an error
+    status raises urllib2.HTTPError, as urllib2 does."""
+    def __init__(self, size=4, idle_timeout=60, connection_classes=None):
+        self.size         = size
+        self.idle_timeout = idle_timeout
+        self.idle         = {}
+        self.lock         = threading.Lock()
+        self.connection_classes = { "http"  : httplib.HTTPConnection,
+                                    "https" : httplib.HTTPSConnection }
+        if connection_classes is not None:
+            self.connection_classes.update(connection_classes)
+        self.clear_stats()
+
+    def post(self, url, body, headers):
+        """Post the body to the URL, and return the response body."""
+        (scheme, netloc, path, query, fragment) = urlparse.urlsplit(url)
+        if path == "":
+            path = "/"
+        if query != "":
+            path = path + "?" + query
+
+        retried = False
+        while True:
+            connection, reused = self._checkout(url, scheme, netloc)
+            try:
+                connection.request("POST", path, body, headers)
+                response = connection.getresponse()
+                data = response.read()
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                self._count("discarded")
+                if reused and not retried:
+                    # The server probably closed the connection while it
+                    # sat idle; try once more on a new one.
+                    retried = True
+                    self._count("retried")
+                    continue
+                raise
+
+            if response.will_close:
+                connection.close()
+                self._count("discarded")
+            else:
+                self._checkin(url, connection)
+
+            if response.status < 200 or response.status >= 300:
+                raise urllib2.HTTPError(url, response.status, response.reason,
+                                        response.msg, StringIO(data))
+            return data
+
+    def stats(self):
+        """Return the pool counters as a dictionary.  'reuse_rate' is the
+        fraction of requests sent on a connection that was already open."""
+        self.lock.acquire()
+        try:
+            requests = self.created + self.reused
+            return { "requests"   : requests,
+                     "created"    : self.created,
+                     "reused"     : self.reused,
+                     "retried"    : self.retried,
+                     "expired"    : self.expired,
+                     "discarded"  : self.discarded,
+                     "idle"       : sum([len(idle) for idle in self.idle.values()]),
+                     "reuse_rate" : float(self.reused) / max(requests, 1) }
+        finally:
+            self.lock.release()
+
+    def clear_stats(self):
+        """Reset the counters."""
+        self.lock.acquire()
+        try:
+            self.created   = 0
+            self.reused    = 0
+            self.retried   = 0
+            self.expired   = 0
+            self.discarded = 0
+        finally:
+            self.lock.release()
+
+    def close(self):
+        """Close every idle connection."""
+        self.lock.acquire()
+        try:
+            for idle in self.idle.values():
+                for (connection, idle_since) in idle:
+                    connection.close()
+            self.idle.clear()
+        finally:
+            self.lock.release()
+
+    def _checkout(self, url, scheme, netloc):
+        # Returns (connection, reused).  Idle connections are kept oldest
+        # first; close any that have timed out, then take the newest.
+        if scheme not in self.connection_classes:
+            raise urllib2.URLError("unknown url type: %s" % scheme)
+
+        self.lock.acquire()
+        try:
+            idle = self.idle.get(url, [])
+            now  = time.time()
+            while len(idle) > 0 and now - idle[0][1] > self.idle_timeout:
+                idle.pop(0)[0].close()
+                self.expired += 1
+            if len(idle) > 0:
+                self.reused += 1
+                return idle.pop()[0], True
+            self.created += 1
+        finally:
+            self.lock.release()
+        return self.connection_classes[scheme](netloc), False
+
+    def _checkin(self, url, connection):
+        self.lock.acquire()
+        try:
+            idle = self.idle.setdefault(url, [])
+            if len(idle) < self.size:
+                idle.append((connection, time.time()))
+                return
+            self.discarded += 1
+        finally:
+            self.lock.release()
+        connection.close()
+
+    def _count(self, counter):
+        self.lock.acquire()
+        try:
+            setattr(self, counter, getattr(self, counter) + 1)
+        finally:
+            self.lock.release()
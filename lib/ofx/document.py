@@ -20,10 +20,49 @@ import ofx
 import xml.sax.saxutils as sax
 
 class Document:
-    def as_xml(self, original_format=None, date_format=None):
-        """Formats this document as an OFX 2.0 XML document."""
-        xml = ""
+    def as_xml(self, original_format=None, date_format=None, stream=None,
+               timings=None):
+        """Formats this document as an OFX 2.0 XML document.  If a
+        file-like 'stream' is given, the document is written to it as it's
+        formatted, as with write_xml(), and nothing is returned.  If an
+        ofx.Timings is given, formatting is timed as the 'as_xml' stage."""
+        if stream is not None:
+            return self.write_xml(stream, original_format, date_format,
+                                  timings)
+        with ofx.timed(timings, "as_xml") as stage:
+            pieces = []
+            self._write_document(pieces.append, original_format, date_format)
+            xml = "".join(pieces)
+            stage.output_bytes = len(xml)
+        return xml
+
+    def write_xml(self, stream, original_format=None, date_format=None,
+                  timings=None):
+        """Writes this document as an OFX 2.0 XML document to the given
+        file-like object, a piece at a time, without building the whole
+        document as a string first."""
+        if timings is None:
+            self._write_document(stream.write, original_format, date_format)
+            return
+
+        # Count what's written, for the output size.
+        written = [0]
+        def write(piece):
+            written[0] += len(piece)
+            stream.write(piece)
+        with ofx.timed(timings, "as_xml") as stage:
+            try:
+                self._write_document(write, original_format, date_format)
+            finally:
+                stage.output_bytes = written[0]
 
+    def _write_document(self, write, original_format=None, date_format=None):
+        self._write_header(write, self.parse_dict["header"], original_format,
+                           date_format)
+        self._write_element(write, self.parse_dict["body"]["OFX"])
+
+    def _write_header(self, write, header, original_format=None,
+                      date_format=None):
         # NOTE: Encoding in OFX, particularly in OFX 1.02,
         # is kind of a mess.  The OFX 1.02 spec talks about "UNICODE"
         # as a supported encoding, which the OFX 2.0 spec has
@@ -41,44 +80,69 @@ class Document:
         # we're actually seeing, and use that to maybe be smarter
         # about this in the future.
         encoding = ""
-        if self.parse_dict["header"]["ENCODING"] == "USASCII":
+        if header["ENCODING"] == "USASCII":
             encoding = "US-ASCII"
-        elif self.parse_dict["header"]["ENCODING"] == "UNICODE":
+        elif header["ENCODING"] == "UNICODE":
             encoding = "UTF-8"
-        elif self.parse_dict["header"]["ENCODING"] == "NONE":
+        elif header["ENCODING"] == "NONE":
             encoding = "UTF-8"
         else:
-            encoding = self.parse_dict["header"]["ENCODING"]
+            encoding = header["ENCODING"]
 
-        xml += """<?xml version="1.0" encoding="%s"?>\n""" % encoding
-        xml += """<?OFX OFXHEADER="200" VERSION="200" """ + \
-               """SECURITY="%s" OLDFILEUID="%s" NEWFILEUID="%s"?>\n""" % \
-               (self.parse_dict["header"]["SECURITY"],
-                self.parse_dict["header"]["OLDFILEUID"],
-                self.parse_dict["header"]["NEWFILEUID"])
+        write("""<?xml version="1.0" encoding="%s"?>\n""" % encoding)
+        write("""<?OFX OFXHEADER="200" VERSION="200" """ + \
+              """SECURITY="%s" OLDFILEUID="%s" NEWFILEUID="%s"?>\n""" % \
+              (header["SECURITY"],
+               header["OLDFILEUID"],
+               header["NEWFILEUID"]))
 
         if original_format is not None:
-            xml += """<!-- Converted from: %s -->\n""" % original_format
+            write("""<!-- Converted from: %s -->\n""" % original_format)
         if date_format is not None:
-            xml += """<!-- Date format was: %s -->\n""" % date_format
+            write("""<!-- Date format was: %s -->\n""" % date_format)
 
-        taglist = self.parse_dict["body"]["OFX"].asList()
-        xml += self._format_xml(taglist)
+    def _format_xml(self, mylist, indent=0):
+        pieces = []
+        self._write_element(pieces.append, mylist, indent)
+        return "".join(pieces)
 
-        return xml
+    def _write_element(self, write, element, indent=0):
+        """Writes one element and everything inside it.  The element can
+        be a Node from the SGML parser, a pyparsing result, or a nested
+        list of the kind returned by asList(), where the first item is the
+        tag and the rest are either child lists or a single value.  The
+        element is not modified."""
+        if isinstance(element, ofx.Node):
+            tag, value, children = element.tag, element.value, element.children
+        else:
+            if not isinstance(element, list):
+                element = element.asList()
+            tag, value, children = element[0], None, None
+            if len(element) > 1 and isinstance(element[1], list):
+                children = element[1:]
+            elif len(element) > 1:
+                value = element[1]
 
-    def _format_xml(self, mylist, indent=0):
-        xml = ""
         indentstring = " " * indent
-        tag = mylist.pop(0)
-        if len(mylist) > 0 and isinstance(mylist[0], list):
-            xml += "%s<%s>\n" % (indentstring, tag)
-            for value in mylist:
-                xml += self._format_xml(value, indent=indent + 2)
-            xml += "%s</%s>\n" % (indentstring, tag)
-        elif len(mylist) > 0:
-            # Unescape then reescape so we don't wind up with '&amp;lt;', oy.
-            value = sax.escape(sax.unescape(mylist[0]))
-            xml += "%s<%s>%s</%s>\n" % (indentstring, tag, value, tag)
-        return xml
+        if children:
+            write("%s<%s>\n" % (indentstring, tag))
+            childindent = " " * (indent + 2)
+            for child in children:
+                if isinstance(child, ofx.Node) and child.children is None:
+                    # Content tags are by far the most common, so they
+                    # are written here rather than with a recursive call.
+                    write("%s<%s>%s</%s>\n" % (childindent, child.tag,
+                                              self._escape(child.value),
+                                              child.tag))
+                else:
+                    self._write_element(write, child, indent + 2)
+            write("%s</%s>\n" % (indentstring, tag))
+        elif value is not None:
+            write("%s<%s>%s</%s>\n" % (indentstring, tag,
+                                      self._escape(value), tag))
 
+    def _escape(self, value):
+        # Unescape then reescape so we don't wind up with '&amp;lt;', oy.
+        if "&" in value or "<" in value or ">" in value:
+            return sax.escape(sax.unescape(value))
+        return value
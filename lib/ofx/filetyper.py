@@ -20,8 +20,63 @@ import csv
 import re
 
 class FileTyper:
-    def __init__(self, text):
-        self.text = text
+    """Guesses the type of a data file from its contents.  The source can
+    be a string, a file object or an mmap.  Only the first 'prefix_size'
+    bytes are examined for the type markers, plus (for the CSV check) up
+    to 'sample_lines' lines sampled evenly from the rest of the file, so
+    typing a large file costs about the same as typing a small one.  A
+    file object or mmap is left at the position it was at."""
+    def __init__(self, source, prefix_size=65536, sample_lines=100):
+        self.prefix_size  = prefix_size
+        self.sample_lines = sample_lines
+        (self.text, self.samples) = self._read(source)
+    
+    def _read(self, source):
+        """Return the prefix of the source to examine, trimmed to a whole
+        number of lines if the source is longer, and a list of lines
+        sampled from the remainder."""
+        if isinstance(source, basestring):
+            start  = 0
+            size   = len(source)
+            prefix = source[:self.prefix_size]
+        else:
+            # A file object is typed from where it is, not from the start.
+            start  = source.tell()
+            prefix = source.read(self.prefix_size)
+            source.seek(0, 2)
+            size   = source.tell()
+        
+        samples = []
+        if size - start > len(prefix):
+            # Drop the partial line at the end of the prefix, so that it
+            # can't be mistaken for a line on its own.
+            cut = prefix.rfind("\n")
+            if cut != -1:
+                prefix = prefix[:cut + 1]
+            
+            # Take the first whole line after each of a set of evenly
+            # spaced offsets through the rest of the file.
+            rest = size - start - len(prefix)
+            step = max(rest / max(self.sample_lines, 1), 1)
+            for offset in range(start + len(prefix), size,
+                                step)[:self.sample_lines]:
+                if isinstance(source, basestring):
+                    begin = source.find("\n", offset) + 1
+                    end   = source.find("\n", begin)
+                    if begin == 0 or end == -1:
+                        break
+                    line = source[begin:end]
+                else:
+                    source.seek(offset)
+                    source.readline()
+                    line = source.readline()
+                    if line == "" or not line.endswith("\n"):
+                        break
+                samples.append(line.rstrip("\r\n"))
+        
+        if not isinstance(source, basestring):
+            source.seek(start)
+        return (prefix, samples)
     
     def trust(self):
         if re.search("OFXHEADER:", self.text, re.IGNORECASE) != None:
@@ -88,7 +143,7 @@ class FileTyper:
                 return "UNKNOWN"
             
             try:
-                lines = self.text.splitlines()
+                lines = self.text.splitlines() + self.samples
                 rows  = 0
                 frequencies = {}
                 for row in csv.reader(lines, dialect=dialect):
@@ -17,11 +17,17 @@
 #
 
 from datetime import date
+import cPickle
+import heapq
 import ofx
 from ofx.builder import *
+import shutil
+import tempfile
 import uuid
 
-class Generator:
+class _BaseGenerator:
+    """The statement settings and OFX builders Generator and
+    StreamGenerator share.  Subclasses supply _ofx_txns()."""
     def __init__(self, fid="UNKNOWN", org="UNKNOWN", bankid="UNKNOWN",
                  accttype="UNKNOWN", acctid="UNKNOWN", availbal="0.00",
                  ledgerbal="0.00", stmtdate=None, curdef="USD", lang="ENG"):
@@ -35,38 +41,6 @@ class Generator:
         self.stmtdate  = stmtdate
         self.curdef    = curdef
         self.lang      = lang
-        self.txns_by_date = {}
-    
-    def add_transaction(self, date=None, amount=None, number=None, 
-                        txid=None, type=None, payee=None, memo=None):
-        txn = ofx.Transaction(date=date, amount=amount, number=number, 
-                              txid=txid, type=type, payee=payee, memo=memo)
-        txn_date_list = self.txns_by_date.get(txn.date, [])
-        txn_date_list.append(txn)
-        self.txns_by_date[txn.date] = txn_date_list
-    
-    def to_ofx1(self):
-        # Sort transactions and fill in date information.
-        # OFX transactions appear most recent first, and oldest last.
-        self.date_list = self.txns_by_date.keys()
-        self.date_list.sort()
-        self.date_list.reverse()
-        
-        self.startdate = self.date_list[-1]
-        self.enddate   = self.date_list[0] 
-        if self.stmtdate is None:
-            self.stmtdate = date.today().strftime("%Y%m%d")
-        
-        # Generate the OFX statement.
-        return DOCUMENT(self._ofx_header(),
-                        OFX(self._ofx_signon(),
-                            self._ofx_stmt()))
-    
-    def to_str(self):
-        return self.to_ofx1()
-    
-    def __str__(self):
-        return self.to_ofx1()
     
     def _ofx_header(self):
         return HEADER(
@@ -137,8 +111,46 @@ class Generator:
             BALAMT(self.availbal),
             DTASOF(self.stmtdate))
 
+class Generator(_BaseGenerator):
+    def __init__(self, *args, **params):
+        _BaseGenerator.__init__(self, *args, **params)
+        self.txns_by_date = {}
+    
+    def add_transaction(self, date=None, amount=None, number=None, 
+                        txid=None, type=None, payee=None, memo=None):
+        txn = ofx.Transaction(date=date, amount=amount, number=number, 
+                              txid=txid, type=type, payee=payee, memo=memo)
+        txn_date_list = self.txns_by_date.get(txn.date, [])
+        txn_date_list.append(txn)
+        self.txns_by_date[txn.date] = txn_date_list
+    
+    def to_ofx1(self):
+        # Sort transactions and fill in date information.
+        # OFX transactions appear most recent first, and oldest last.
+        self.date_list = self.txns_by_date.keys()
+        self.date_list.sort()
+        self.date_list.reverse()
+        
+        self.startdate = self.date_list[-1]
+        self.enddate   = self.date_list[0] 
+        if self.stmtdate is None:
+            self.stmtdate = date.today().strftime("%Y%m%d")
+        
+        # Generate the OFX statement.
+        with Fragments():
+            document = DOCUMENT(self._ofx_header(),
+                                OFX(self._ofx_signon(),
+                                    self._ofx_stmt()))
+        return str(document)
+    
+    def to_str(self):
+        return self.to_ofx1()
+    
+    def __str__(self):
+        return self.to_ofx1()
+    
     def _ofx_txns(self):
-        txns = ""
+        txns = []
         
         for date in self.date_list:
             txn_list = self.txns_by_date[date]
@@ -152,15 +164,150 @@ class Generator:
                 txn.txid = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
                                                 txn_date, txn_index,
                                                 txn_amt)
-                txns += txn.to_ofx()
+                txns.append(txn.to_ofx())
                 txn_index -= 1
         
         return BANKTRANLIST(
             DTSTART(self.startdate),
             DTEND(self.enddate),
-            txns)
+            *txns)
     
     
+class StreamGenerator(_BaseGenerator):
+    """Like Generator, but writes its statement to a file object as it
+    goes, rather than holding every transaction in memory, so that it can
+    make statements of any size:
+
+        stmt = ofx.StreamGenerator(open("big.ofx", "w"), fid="1000",
+                                   org="FAKEOFX", stmtdate="20100131")
+        for txn in source:
+            stmt.add_transaction(date=txn.date, amount=txn.amount)
+        stmt.close()
+
+    The output is the same as Generator.to_ofx1() would give for the same
+    transactions; there is no to_ofx1() here, since the statement can
+    only be written once, by close().  Transactions must be added most
+    recent date first, which is the order they appear in the statement,
+    or a ValueError is raised; with 'presorted=False' they can come in
+    any order, and are sorted in chunks of 'chunk_size' on disk before
+    being written.  The statement's start and end dates are only known at
+    the end, so the STMTTRN blocks go to a temporary spool file (in
+    'spool_dir', if given) until close() writes the whole document out."""
+    def __init__(self, stream, presorted=True, chunk_size=100000,
+                 spool_dir=None, **params):
+        _BaseGenerator.__init__(self, **params)
+        self.stream     = stream
+        self.presorted  = presorted
+        self.chunk_size = chunk_size
+        self.spool_dir  = spool_dir
+        self.spool      = tempfile.TemporaryFile(dir=spool_dir)
+        self.startdate  = None
+        self.enddate    = None
+        self.count      = 0
+        self.date_txns  = []
+        self.chunks     = []
+        self.chunk      = []
+
+    def add_transaction(self, date=None, amount=None, number=None,
+                        txid=None, type=None, payee=None, memo=None):
+        fields = (date, amount, number, txid, type, payee, memo)
+        if self.presorted:
+            self._add_sorted(ofx.Transaction(*fields))
+        else:
+            self.chunk.append((date, self.count, fields))
+            if len(self.chunk) >= self.chunk_size:
+                self._spool_chunk()
+        self.count += 1
+
+    def _add_sorted(self, txn):
+        if len(self.date_txns) > 0 and txn.date != self.date_txns[0].date:
+            if txn.date > self.date_txns[0].date:
+                raise ValueError("Transaction dated %s added after one dated %s."
+                                 % (txn.date, self.date_txns[0].date))
+            self._write_date()
+        if self.enddate is None:
+            self.enddate = txn.date
+        self.startdate = txn.date
+        self.date_txns.append(txn)
+
+    def _write_date(self):
+        # Number this date's transactions the way Generator._ofx_txns does.
+        txn_index = len(self.date_txns)
+        for txn in self.date_txns:
+            txn.txid = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
+                                           txn.date, txn_index, txn.amount)
+            self.spool.write(txn.to_ofx())
+            txn_index -= 1
+        self.date_txns = []
+
+    def _spool_chunk(self):
+        # Sort by date, newest first, keeping the order transactions were
+        # added in within a date.
+        self.chunk.sort(key=lambda (txn_date, seq, fields): seq)
+        self.chunk.sort(key=lambda (txn_date, seq, fields): txn_date, reverse=True)
+        chunk = tempfile.TemporaryFile(dir=self.spool_dir)
+        for item in self.chunk:
+            cPickle.dump(item, chunk, 2)
+        chunk.seek(0)
+        self.chunks.append(chunk)
+        self.chunk = []
+
+    def _read_chunk(self, chunk):
+        while True:
+            try:
+                txn_date, seq, fields = cPickle.load(chunk)
+            except EOFError:
+                chunk.close()
+                return
+            yield (_Newest(txn_date), seq, fields)
+
+    def close(self):
+        """Write out the statement.  The stream is left open."""
+        if not self.presorted:
+            self._spool_chunk()
+            for newest, seq, fields in heapq.merge(*[self._read_chunk(chunk)
+                                                     for chunk in self.chunks]):
+                self._add_sorted(ofx.Transaction(*fields))
+            self.chunks = []
+        self._write_date()
+
+        if self.stmtdate is None:
+            self.stmtdate = date.today().strftime("%Y%m%d")
+        if self.startdate is None:
+            self.startdate = self.enddate = self.stmtdate
+
+        document = DOCUMENT(self._ofx_header(),
+                            OFX(self._ofx_signon(),
+                                self._ofx_stmt()))
+        before, after = document.split(_TXNS_MARKER)
+        self.stream.write(before)
+        self.spool.seek(0)
+        shutil.copyfileobj(self.spool, self.stream)
+        self.spool.close()
+        self.stream.write(after)
+
+    def _ofx_txns(self):
+        return BANKTRANLIST(
+            DTSTART(self.startdate),
+            DTEND(self.enddate),
+            _TXNS_MARKER)
+
+# Stands in for the transactions in the document StreamGenerator builds.
+_TXNS_MARKER = "\0TXNS\0"
+
+class _Newest(object):
+    """Sort key for a date string that puts the most recent dates first."""
+    __slots__ = ("date",)
+
+    def __init__(self, date):
+        self.date = date
+
+    def __lt__(self, other):
+        return self.date > other.date
+
+    def __eq__(self, other):
+        return self.date == other.date
+
 #
 #  ofx.Transaction - clean and format transaction information.
 #
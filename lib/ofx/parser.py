@@ -18,8 +18,11 @@
 
 import re
 import sys
+import threading
+from ofx.rules import Rule, RuleSet
+from ofx.timings import timed
 from pyparsing import alphanums, alphas, CharsNotIn, Dict, Forward, Group, \
-Literal, OneOrMore, Optional, SkipTo, White, Word, ZeroOrMore
+Literal, OneOrMore, Optional, ParseException, SkipTo, White, Word, ZeroOrMore
 
 def _ofxStartDebugAction( instring, loc, expr ):
     sys.stderr.write("Match %s at loc %s (%d,%d)" % 
@@ -32,11 +35,90 @@ def _ofxSuccessDebugAction( instring, startloc, endloc, expr, toks ):
     
 def _ofxExceptionDebugAction( instring, loc, expr, exc ):
     sys.stderr.write("Exception raised: %s" % exc)
-    
+
+# Patterns used by the SGML tokenizer.  A header line is a bare word, a
+# colon, and the rest of the line.  A body token is an open or close tag,
+# followed by the content on the rest of its line (leading whitespace,
+# including line breaks, is skipped, just as the pyparsing grammar does),
+# followed by anything else up to the next tag, which is ignored.
+_HEADER = re.compile(r"^\s*([A-Za-z]+):[ \t]*([^\r\n]*)", re.MULTILINE)
+_TOKEN  = re.compile(r"<(/?)([^>]*)>\s*([^<\r\n]*)[^<]*")
+_JUNK   = re.compile('[\xBD-\xFF\x64\x0A\x08]{4,}')
+
+# Patterns for the pre-passes the pyparsing engine needs; see the strip_*
+# methods of Parser.
+_EMPTY_TAGS  = re.compile('<(?P<tag>[^>]+)>\s*</(?P=tag)>')
+_CLOSE_TAGS  = re.compile('<(?P<tag>[^>]+)>\s*(?P<value>[^<\n\r]+)(?:\s*</(?P=tag)>)?(?P<lineend>[\n\r]*)')
+_BLANK_TAGS  = re.compile('<(DTASOF|BALAMT|BANKID|CATEGORY|NAME)>[\n\r]+')
+_BLANK_TYPE  = re.compile('<ACCTTYPE>(?P<contentend>[<\n\r])')
+
+class GrammarCache:
+    """Thread-safe store of built pyparsing grammars, one per debug flag.
+    Building a grammar is expensive next to parsing a small document, and
+    a built grammar can be shared by any number of parsers, so each
+    parser class keeps one of these at module level.  The grammar is
+    streamlined before it is handed out so that parseString doesn't
+    modify it while other threads are using it."""
+    def __init__(self):
+        self.grammars = {}
+        self.lock = threading.Lock()
+
+    def get(self, debug, build):
+        """Return the grammar for the given debug flag, calling build(debug)
+        to make it the first time it is asked for."""
+        self.lock.acquire()
+        try:
+            grammar = self.grammars.get(bool(debug))
+            if grammar is None:
+                grammar = build(debug)
+                grammar.streamline()
+                self.grammars[bool(debug)] = grammar
+            return grammar
+        finally:
+            self.lock.release()
+
+_grammars = GrammarCache()
+
+# Blank content tags are dropped from the parse, except for these, which
+# are filled in with a placeholder value.
+_BLANK_DEFAULTS = { "ACCTTYPE" : "UNKNOWN" }
+
 class Parser:
     """Dirt-simple OFX parser for interpreting server results (primarily for
-    errors at this point).  Currently parses OFX 1.02."""
-    def __init__(self, debug=False):
+    errors at this point).  Currently parses OFX 1.02.
+
+    Two parsing engines are available.  The default "sgml" engine is a
+    hand-written tokenizer that reads the document in a single scan; the
+    "pyparsing" engine is the original grammar, which is slower but is
+    kept around for comparison and debugging.  Both return the same
+    header/body structure."""
+    # Rewrites applied to a document before it is parsed, in order.  The
+    # tokenizer handles blank and closed content tags itself; the grammar
+    # needs them stripped out first.  Only the ACCTTYPE fix has a trigger;
+    # close_tags changes every document, and there's no substring the
+    # others need that is cheaper to look for than their own patterns.
+    sgml_rules = RuleSet([
+        Rule("junk_ascii", _JUNK)], name="parser.sgml")
+    pyparsing_rules = RuleSet([
+        Rule("empty_tags", _EMPTY_TAGS),
+        Rule("close_tags", _CLOSE_TAGS, '<\g<tag>>\g<value>\g<lineend>'),
+        Rule("blank_tags", _BLANK_TAGS),
+        Rule("junk_ascii", _JUNK),
+        Rule("unknown_account_type", _BLANK_TYPE,
+             '<ACCTTYPE>UNKNOWN\g<contentend>', trigger="<ACCTTYPE>")],
+        name="parser.pyparsing")
+    
+    def __init__(self, debug=False, engine="sgml"):
+        if engine not in ("sgml", "pyparsing"):
+            raise ValueError("Unknown parser engine '%s'." % engine)
+        self.debug  = debug
+        self.engine = engine
+        self.parser = None
+        if engine == "pyparsing":
+            self.parser = _grammars.get(debug, self._grammar)
+    
+    def _grammar(self, debug=False):
+        """Build the pyparsing grammar for OFX documents."""
         # Parser definition for headers
         header = Group(Word(alphas) + Literal(":").suppress() +
             Optional(CharsNotIn("\r\n")))
@@ -53,9 +135,10 @@ class Parser:
         body = Group(aggregate).setResultsName("body")
         
         # The parser as a whole
-        self.parser = headers + body
+        parser = headers + body
         if (debug):
-            self.parser.setDebugActions(_ofxStartDebugAction, _ofxSuccessDebugAction, _ofxExceptionDebugAction)
+            parser.setDebugActions(_ofxStartDebugAction, _ofxSuccessDebugAction, _ofxExceptionDebugAction)
+        return parser
     
     def _tag(self, closed=True):
         """Generate parser definitions for OFX tags."""
@@ -67,43 +150,233 @@ class Parser:
         else:
             return openTag
     
-    def parse(self, ofx):
+    def parse(self, ofx, timings=None):
         """Parse a string argument and return a tree structure representing
-        the parsed document."""
-        ofx = self.strip_empty_tags(ofx)
-        ofx = self.strip_close_tags(ofx)
-        ofx = self.strip_blank_dtasof(ofx)
-        ofx = self.strip_junk_ascii(ofx)
-        ofx = self.fix_unknown_account_type(ofx)
-        return self.parser.parseString(ofx).asDict()
+        the parsed document.  If an ofx.Timings is given, the rule pre-pass
+        and the parse are timed as the 'parser_rules' and 'parse' stages."""
+        if self.engine == "sgml":
+            return self.tokenize(ofx, timings)
+        with timed(timings, "parser_rules", ofx) as stage:
+            ofx = self.pyparsing_rules.apply(ofx)
+            stage.output_bytes = len(ofx)
+        with timed(timings, "parse", ofx):
+            return self.parser.parseString(ofx).asDict()
+    
+    def tokenize(self, ofx, timings=None):
+        """Parse a string argument in a single scan, without the regex
+        pre-passes or the pyparsing grammar.  Close tags are optional on
+        content tags, as SGML allows; content tags left blank are dropped
+        (or given a placeholder value, for ACCTTYPE), and empty
+        aggregates are dropped.  Raises a ParseException if the document
+        has no header or no body."""
+        # Schwab puts binary junk, newlines included, in NAME fields; see
+        # sgml_rules.  A rule leaves the text alone if it doesn't match.
+        with timed(timings, "parser_rules", ofx) as stage:
+            ofx = self.sgml_rules.apply(ofx)
+            stage.output_bytes = len(ofx)
+        
+        with timed(timings, "parse", ofx):
+            return self._tokenize(ofx)
+    
+    def _tokenize(self, ofx):
+        start = ofx.find("<")
+        if start == -1:
+            raise ParseException(ofx, len(ofx), "No OFX body found")
+        
+        header = {}
+        for match in _HEADER.finditer(ofx, 0, start):
+            header[match.group(1)] = match.group(2)
+        if len(header) == 0:
+            raise ParseException(ofx, 0, "No OFX headers found")
+        
+        # Each stack frame is the tag of an open aggregate and the list
+        # of children collected so far for it.  A tag is pushed when it
+        # has no content on its line; if its close tag never comes, it
+        # turns out to have been a blank content tag, and its children
+        # are handed back to its parent.
+        stack = []
+        children = []
+        for match in _TOKEN.finditer(ofx, start):
+            close, tag, value = match.groups()
+            if not close:
+                if value:
+                    children.append(Node(tag, value))
+                else:
+                    stack.append((tag, children))
+                    children = []
+                continue
+            
+            depth = len(stack) - 1
+            while depth >= 0 and stack[depth][0] != tag:
+                depth -= 1
+            if depth < 0:
+                # A close tag for a content tag (or a stray one); these
+                # carry no information.
+                continue
+            
+            while len(stack) > depth + 1:
+                children = self._close_blank(stack.pop(), children)
+            
+            open_tag, parent = stack.pop()
+            if len(children) > 0:
+                parent.append(Node(open_tag, children=children))
+            children = parent
+            if len(stack) == 0:
+                break
+        
+        # Close anything left open at the end of the document.
+        while len(stack) > 0:
+            open_tag, parent = stack.pop()
+            if len(children) > 0:
+                parent.append(Node(open_tag, children=children))
+            children = parent
+        
+        if len(children) == 0 or children[0].children is None:
+            raise ParseException(ofx, start, "No OFX aggregate found")
+        
+        return { "header" : header, "body" : { "OFX" : children[0] } }
+    
+    def _close_blank(self, frame, children):
+        """Resolve a stack frame that never got a close tag into a blank
+        content tag, and return its parent's child list with the blank tag
+        (if it has a default value) and the frame's children added."""
+        tag, parent = frame
+        if tag in _BLANK_DEFAULTS:
+            parent.append(Node(tag, _BLANK_DEFAULTS[tag]))
+        parent.extend(children)
+        return parent
     
     def strip_empty_tags(self, ofx):
         """Strips open/close tags that have no content."""
-        strip_search = '<(?P<tag>[^>]+)>\s*</(?P=tag)>'
-        return re.sub(strip_search, '', ofx)
+        return _EMPTY_TAGS.sub('', ofx)
 
     def strip_close_tags(self, ofx):
         """Strips close tags on non-aggregate nodes.  Close tags seem to be
         valid OFX/1.x, but they screw up our parser definition and are optional.
         This allows me to keep using the same parser without having to re-write
         it from scratch just yet."""
-        strip_search = '<(?P<tag>[^>]+)>\s*(?P<value>[^<\n\r]+)(?:\s*</(?P=tag)>)?(?P<lineend>[\n\r]*)'
-        return re.sub(strip_search, '<\g<tag>>\g<value>\g<lineend>', ofx)
+        return _CLOSE_TAGS.sub('<\g<tag>>\g<value>\g<lineend>', ofx)
     
     def strip_blank_dtasof(self, ofx):
         """Strips empty dtasof tags from wells fargo/wachovia downloads.  Again, it would
         be better to just rewrite the parser, but for now this is a workaround."""
-        blank_search = '<(DTASOF|BALAMT|BANKID|CATEGORY|NAME)>[\n\r]+'
-        return re.sub(blank_search, '', ofx)
+        return _BLANK_TAGS.sub('', ofx)
     
     def strip_junk_ascii(self, ofx):
         """Strips high ascii gibberish characters from Schwab statements. They seem to 
         contains strings of EF BF BD EF BF BD 0A 08 EF BF BD 64 EF BF BD in the <NAME> field, 
         and the newline is screwing up the parser."""
-        return re.sub('[\xBD-\xFF\x64\x0A\x08]{4,}', '', ofx)
+        return _JUNK.sub('', ofx)
 
     def fix_unknown_account_type(self, ofx):
         """Sets the content of <ACCTTYPE> nodes without content to be UNKNOWN so that the
         parser is able to parse it. This isn't really the best solution, but it's a decent workaround."""
-        return re.sub('<ACCTTYPE>(?P<contentend>[<\n\r])', '<ACCTTYPE>UNKNOWN\g<contentend>', ofx)
+        return _BLANK_TYPE.sub('<ACCTTYPE>UNKNOWN\g<contentend>', ofx)
+
+
+class Node(object):
+    """One element of a document read by the SGML tokenizer.  A node acts
+    like the pyparsing group for the element: index 0 is the tag, followed
+    by either the content value or the child nodes, and named lookups
+    return the content of the last child with that tag.  Only the parts of
+    the ParseResults interface that the rest of the library uses are
+    provided."""
+    __slots__ = ("tag", "value", "children", "_named")
+    
+    def __init__(self, tag, value=None, children=None):
+        self.tag      = tag
+        self.value    = value
+        self.children = children
+        self._named   = None
+    
+    def _items(self):
+        if self.children is None:
+            return [self.tag, self.value]
+        return [self.tag] + self.children
+    
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self.named()[key]
+        return self._items()[key]
+    
+    def __contains__(self, key):
+        return key in self.named()
+    
+    def __len__(self):
+        if self.children is None:
+            return 2
+        return len(self.children) + 1
+    
+    def __iter__(self):
+        return iter(self._items())
+    
+    def __repr__(self):
+        return repr(self.asList())
+    
+    def named(self):
+        """Returns a dictionary of child tags to child content, where
+        aggregate children are represented by a NodeList of their own
+        children.  If a tag appears more than once, the last one wins."""
+        if self._named is None:
+            self._named = {}
+            if self.children is not None:
+                for child in self.children:
+                    if child.children is None:
+                        self._named[child.tag] = child.value
+                    else:
+                        self._named[child.tag] = NodeList(child)
+        return self._named
+    
+    def keys(self):
+        return self.named().keys()
+    
+    def items(self):
+        return self.named().items()
+    
+    def asDict(self):
+        return dict(self.named())
+    
+    def asList(self):
+        if self.children is None:
+            return [self.tag, self.value]
+        return [self.tag] + [child.asList() for child in self.children]
+
+
+class NodeList(object):
+    """The children of an aggregate Node, without the aggregate's own tag.
+    This is what a named lookup of an aggregate returns, matching the
+    pyparsing Dict results the library was written against."""
+    __slots__ = ("node",)
+    
+    def __init__(self, node):
+        self.node = node
+    
+    def __getitem__(self, key):
+        if isinstance(key, basestring):
+            return self.node.named()[key]
+        return self.node.children[key]
+    
+    def __contains__(self, key):
+        return key in self.node.named()
+    
+    def __len__(self):
+        return len(self.node.children)
+    
+    def __iter__(self):
+        return iter(self.node.children)
+    
+    def __repr__(self):
+        return repr(self.asList())
+    
+    def keys(self):
+        return self.node.keys()
+    
+    def items(self):
+        return self.node.items()
+    
+    def asDict(self):
+        return self.node.asDict()
+    
+    def asList(self):
+        return [child.asList() for child in self.node.children]
 
@@ -0,0 +1,231 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.reader - streaming reader for large OFX 1.x documents.
+#
+
+from ofx.document import Document
+from ofx.parser import _HEADER, _TOKEN, _JUNK
+from pyparsing import ParseException
+
+# Content tags that some institutions send blank, and that would otherwise
+# look like the start of an aggregate.  These are the tags the pyparsing
+# engine strips (plus ACCTTYPE, which it fills in).
+_BLANK_TAGS = { "ACCTTYPE" : "UNKNOWN",
+                "BALAMT"   : None,
+                "BANKID"   : None,
+                "CATEGORY" : None,
+                "DTASOF"   : None,
+                "NAME"     : None }
+
+class Reader(Document):
+    """Streaming reader for OFX 1.x documents.  The reader pulls the
+    document from a file object a chunk at a time and reports it as a
+    series of events, so memory use depends on the size of the largest
+    element rather than the size of the document:
+
+        reader = ofx.Reader(open("statement.ofx"))
+        for txn in reader.transactions():
+            print txn["TRNAMT"]
+
+    Events are tuples of (event, tag, value).  An aggregate produces a
+    ("start", tag, None) event and a matching ("end", tag, None) event;
+    a content tag produces a single ("content", tag, value) event.  The
+    document headers are available in the 'headers' dictionary once
+    reading has begun.
+
+    The reader is also a Document: as_xml() and write_xml() convert the
+    document to OFX 2.0 as they read it, the same way an ofx.Response
+    would, without ever holding the whole document (or its parse tree)
+    in memory.  Only the first aggregate in the body is converted, as
+    with the parser.  The source can be anything with a read() method,
+    including an mmap.  If a RuleSet is given (Response.rules, say), it
+    is applied to each piece of the body as it is read; this only works
+    for rules whose matches can't include a "<".
+
+    Blank content tags are handled the same way as the SGML engine in
+    ofx.Parser does, with one difference: since the reader can't wait
+    for the end of the document to find out whether an open tag was an
+    aggregate, a tag without content is taken to be an aggregate as soon
+    as an aggregate inside it is closed."""
+    def __init__(self, source, chunk_size=65536, rules=None):
+        self.source     = source
+        self.chunk_size = chunk_size
+        self.rules      = rules
+        self.headers    = {}
+
+    def events(self):
+        """Generate (event, tag, value) tuples for the whole document."""
+        # Each stack frame is [tag, resolved, buffer].  A frame is resolved
+        # once we know it's an aggregate; until then, its start event and
+        # any events inside it are held in its buffer.  Resolved frames are
+        # always at the bottom of the stack.
+        stack = []
+        for region in self._regions():
+            for match in _TOKEN.finditer(region):
+                close, tag, value = match.groups()
+                out = []
+                if not close:
+                    if value:
+                        out.append(("content", tag, value))
+                    elif tag in _BLANK_TAGS:
+                        if _BLANK_TAGS[tag] is not None:
+                            out.append(("content", tag, _BLANK_TAGS[tag]))
+                    else:
+                        stack.append([tag, False, []])
+                        continue
+                else:
+                    depth = len(stack) - 1
+                    while depth >= 0 and stack[depth][0] != tag:
+                        depth -= 1
+                    if depth < 0:
+                        # A close tag on a content tag; nothing to report.
+                        continue
+                    out = self._close(stack, depth)
+
+                if len(stack) > 0 and not stack[-1][1]:
+                    stack[-1][2].extend(out)
+                else:
+                    for event in out:
+                        yield event
+
+        # Close anything left open at the end of the document.
+        while len(stack) > 0:
+            for event in self._close(stack, len(stack) - 1):
+                yield event
+
+    def _close(self, stack, depth):
+        """Close the frame at 'depth', treating every frame above it as a
+        blank content tag, and return the events that are now ready to go
+        to whatever encloses the closed frame."""
+        while len(stack) > depth + 1:
+            blank_tag, resolved, buffer = stack.pop()
+            if _BLANK_TAGS.get(blank_tag) is not None:
+                buffer.insert(0, ("content", blank_tag, _BLANK_TAGS[blank_tag]))
+            stack[-1][2].extend(buffer)
+
+        tag, resolved, buffer = stack.pop()
+        if resolved:
+            return [("end", tag, None)]
+        elif len(buffer) == 0:
+            # An empty aggregate, which we drop.
+            return []
+
+        # This frame is an aggregate after all, and so is everything
+        # enclosing it; flush whatever the enclosing frames were holding.
+        out = []
+        for frame in stack:
+            if not frame[1]:
+                out.append(("start", frame[0], None))
+                out.extend(frame[2])
+                frame[1] = True
+                frame[2] = []
+        out.append(("start", tag, None))
+        out.extend(buffer)
+        out.append(("end", tag, None))
+        return out
+
+    def _regions(self):
+        """Read the headers, then generate pieces of the body, each starting
+        at a tag and ending just before a tag (or at the end of input)."""
+        pending = ""
+        while True:
+            chunk = self.source.read(self.chunk_size)
+            pending += chunk
+            start = pending.find("<")
+            if start != -1 or chunk == "":
+                break
+
+        if start == -1:
+            raise ParseException(pending, len(pending), "No OFX body found")
+        for match in _HEADER.finditer(pending, 0, start):
+            self.headers[match.group(1)] = match.group(2)
+        if len(self.headers) == 0:
+            raise ParseException(pending, 0, "No OFX headers found")
+        pending = pending[start:]
+
+        while True:
+            chunk = self.source.read(self.chunk_size)
+            if chunk == "":
+                break
+            pending += chunk
+            end = pending.rfind("<")
+            if end > 0:
+                yield self._clean(pending[:end])
+                pending = pending[end:]
+
+        if len(pending) > 0:
+            yield self._clean(pending)
+
+    def _clean(self, region):
+        # See Parser.strip_junk_ascii.  Junk never contains a "<", so it
+        # can't straddle two regions.  sub() hands back the region itself
+        # if there's no junk, so there's no need to search for it first.
+        if self.rules is not None:
+            region = self.rules.apply(region)
+        return _JUNK.sub('', region)
+
+    def _write_document(self, write, original_format=None, date_format=None):
+        # The headers are known once the first event has been read.
+        events = self.events()
+        for event, tag, value in events:
+            if event != "start":
+                raise ParseException("", 0, "No OFX aggregate found")
+            break
+        else:
+            raise ParseException("", 0, "No OFX aggregate found")
+
+        self._write_header(write, self.headers, original_format, date_format)
+        write("<%s>\n" % tag)
+        depth = 1
+        for event, tag, value in events:
+            if event == "content":
+                write("%s<%s>%s</%s>\n" % (" " * (depth * 2), tag,
+                                           self._escape(value), tag))
+            elif event == "start":
+                write("%s<%s>\n" % (" " * (depth * 2), tag))
+                depth += 1
+            else:
+                depth -= 1
+                write("%s</%s>\n" % (" " * (depth * 2), tag))
+                if depth == 0:
+                    break
+
+    def transactions(self):
+        """Generate a dictionary for each STMTTRN aggregate in the document,
+        mapping tags to content.  Aggregates inside the transaction (such
+        as PAYEE) appear as nested dictionaries."""
+        return self.aggregates("STMTTRN")
+
+    def aggregates(self, name):
+        """Generate a dictionary (as described for transactions()) for each
+        aggregate with the given tag."""
+        stack = None
+        for event, tag, value in self.events():
+            if stack is None:
+                if event == "start" and tag == name:
+                    stack = [{}]
+            elif event == "content":
+                stack[-1][tag] = value
+            elif event == "start":
+                child = {}
+                stack[-1][tag] = child
+                stack.append(child)
+            elif event == "end":
+                done = stack.pop()
+                if len(stack) == 0:
+                    stack = None
+                    yield done
+
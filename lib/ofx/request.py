@@ -69,7 +69,11 @@ class Request:
                 APPID(self.app_name),
                 APPVER(self.app_version)))
     
-    def fi_profile(self, institution, username, password):
+    def fi_profile(self, institution, username, password, dtprofup=None):
+        # A DTPROFUP from a profile we already have lets the server answer
+        # "up to date" instead of sending the whole profile again.
+        if dtprofup is None:
+            dtprofup = "19980101"
         return self._message(institution, username, password,
             PROFMSGSRQV1(
                 PROFTRNRQ(
@@ -77,7 +81,7 @@ class Request:
                     CLTCOOKIE(self.cookie),
                     PROFRQ(
                         CLIENTROUTING("NONE"),
-                        DTPROFUP("19980101")))))
+                        DTPROFUP(dtprofup)))))
     
     def account_info(self, institution, username, password):
         """Returns a complete OFX account information request document."""
@@ -17,26 +17,37 @@
 #
 
 import ofx
+from ofx.rules import Rule, RuleSet
 
 class Response(ofx.Document):
-    def __init__(self, response, debug=False):
+    # Rewrites applied to the raw response before it is parsed, in order.
+    rules = RuleSet([
         # Bank of America (California) seems to be putting out bad Content-type
         # headers on manual OFX download.  I'm special-casing this out since
         # B of A is such a large bank.
         # REVIEW: Check later to see if this is still needed, espcially once
         # B of A is mechanized.
         # REVIEW: Checked.  Still needed.  Feh!
-        self.raw_response = response.replace('Content- type:application/ofx', "")
+        Rule("boa_content_type", 'Content- type:application/ofx',
+             literal=True),
         
         # Good god, another one.  Regex?
-        self.raw_response = self.raw_response.replace('Content-Type: application/x-ofx', "")
+        Rule("x_ofx_content_type", 'Content-Type: application/x-ofx',
+             literal=True),
         
         # I'm seeing this a lot, so here's an ugly workaround.  I wonder why multiple
         # FIs are causing it, though.
-        self.raw_response = self.raw_response.replace('****OFX download terminated due to exception: Null or zero length FITID****', '')
+        Rule("null_fitid_exception",
+             '****OFX download terminated due to exception: Null or zero length FITID****',
+             literal=True)], name="response")
+    
+    def __init__(self, response, debug=False, timings=None):
+        with ofx.timed(timings, "response_rules", response) as stage:
+            self.raw_response = self.rules.apply(response)
+            stage.output_bytes = len(self.raw_response)
         
         parser = ofx.Parser(debug)
-        self.parse_dict = parser.parse(self.raw_response)
+        self.parse_dict = parser.parse(self.raw_response, timings)
         self.ofx = self.parse_dict["body"]["OFX"].asDict()
     
     def as_dict(self):
@@ -0,0 +1,211 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.rules - ordered text rewrites that work around institutions' quirks.
+#
+
+import re
+import sys
+import threading
+import time
+
+# Finds the institution's FID in an OFX document, for rules that only
+# apply to some institutions.
+_FID = re.compile(r"<FID>\s*([^<\r\n]*)")
+
+# Every named RuleSet, by name.
+registry = {}
+
+class Rule:
+    """One quirk fix: a pattern to look for in a document, and what to
+    replace it with.  The pattern is a regular expression (compiled once,
+    here), or for a 'literal' rule a plain string, which is found and
+    replaced with string methods and so costs much less to look for.
+    Rewrites that aren't a simple replacement can be given as a function
+    instead, taking the text and returning a tuple of the new text and
+    the number of changes made.  'count' limits the number of
+    replacements, as it does for re.sub.
+
+    Most documents need none of the fixes, so each rule can have a cheap
+    'trigger' that must pass before the rule does any real work: either
+    a string that must appear in the document, or a function that takes
+    the document and returns true if the rule should run.  A literal
+    rule's pattern is its own trigger.  A rule given a list of
+    'institutions' (FIDs) only runs on their documents.
+
+    The 'description' is written to standard error, when debugging,
+    each time the rule changes a document."""
+    def __init__(self, name, pattern=None, replacement="", literal=False,
+                 flags=0, count=0, trigger=None, institutions=None,
+                 function=None, description=None):
+        self.name         = name
+        self.replacement  = replacement
+        self.literal      = literal
+        self.count        = count
+        self.trigger      = trigger
+        self.function     = function
+        self.description  = description
+        self.institutions = None
+        if institutions is not None:
+            self.institutions = frozenset(institutions)
+        if literal or pattern is None or not isinstance(pattern, basestring):
+            self.pattern = pattern
+        else:
+            self.pattern = re.compile(pattern, flags)
+        if literal and trigger is None:
+            self.trigger = pattern
+
+    def triggered(self, text):
+        """Return true if the rule should run on the text."""
+        if self.trigger is None:
+            return True
+        elif isinstance(self.trigger, basestring):
+            return self.trigger in text
+        return self.trigger(text)
+
+    def apply(self, text):
+        """Return the rewritten text and the number of replacements made.
+        If nothing matched, the text is returned as is.  The trigger is
+        not checked."""
+        if self.function is not None:
+            return self.function(text)
+        elif not self.literal:
+            return self.pattern.subn(self.replacement, text, self.count)
+        elif self.pattern not in text:
+            return text, 0
+        count = text.count(self.pattern)
+        if self.count:
+            count = min(count, self.count)
+            return text.replace(self.pattern, self.replacement, count), count
+        return text.replace(self.pattern, self.replacement), count
+
+    def __repr__(self):
+        return "<Rule %s>" % self.name
+
+class RuleSet:
+    """An ordered list of Rules, applied one after another, that keeps
+    count of what each rule does.  Institution-specific fixes can be
+    added to the sets the library uses (Parser.sgml_rules,
+    Parser.pyparsing_rules, Response.rules and ofxtools.QifConverter.rules),
+    which are also listed by name in ofx.rules.registry:
+
+        ofx.Response.rules.add(ofx.Rule("acme_banner", "ACME BANK\\r\\n",
+                                        literal=True, institutions=["1234"]))
+
+    stats() reports, for each rule, how many documents it was checked
+    against, how many set off its trigger, how many it changed, how many
+    replacements it made in all, and the seconds it spent, so that rules
+    which never fire can be found and retired."""
+    def __init__(self, rules=(), name=None):
+        self.rules    = list(rules)
+        self.name     = name
+        self.lock     = threading.Lock()
+        self.counters = {}
+        if name is not None:
+            registry[name] = self
+
+    def add(self, rule, before=None):
+        """Add a rule at the end of the list, or just before the rule
+        named 'before'."""
+        self.lock.acquire()
+        try:
+            # Rules are replaced rather than changed in place, so that
+            # apply() never sees a list in the middle of changing.
+            rules = [existing for existing in self.rules
+                     if existing.name != rule.name]
+            if before is None:
+                rules.append(rule)
+            else:
+                names = [existing.name for existing in rules]
+                rules.insert(names.index(before), rule)
+            self.rules = rules
+        finally:
+            self.lock.release()
+
+    def remove(self, name):
+        """Remove the rule with the given name."""
+        self.lock.acquire()
+        try:
+            self.rules = [rule for rule in self.rules if rule.name != name]
+        finally:
+            self.lock.release()
+
+    def names(self):
+        return [rule.name for rule in self.rules]
+
+    def apply(self, text, fid=None, debug=False):
+        """Apply every rule in order, and return the rewritten text.  The
+        FID, if not given, is looked up in the text when a rule needs it."""
+        results = []
+        for rule in self.rules:
+            if rule.institutions is not None:
+                if fid is None:
+                    match = _FID.search(text)
+                    fid = (match is not None and match.group(1).strip()) or ""
+                if fid not in rule.institutions:
+                    continue
+
+            start = time.time()
+            triggered = rule.triggered(text)
+            count = 0
+            if triggered:
+                text, count = rule.apply(text)
+                if debug and count > 0 and rule.description is not None:
+                    sys.stderr.write(rule.description + "\n")
+            results.append((rule.name, triggered, count, time.time() - start))
+
+        self.lock.acquire()
+        try:
+            for (name, triggered, count, seconds) in results:
+                counter = self.counters.setdefault(name, [0, 0, 0, 0, 0.0])
+                counter[0] += 1
+                if triggered:
+                    counter[1] += 1
+                if count > 0:
+                    counter[2] += 1
+                    counter[3] += count
+                counter[4] += seconds
+        finally:
+            self.lock.release()
+        return text
+
+    def stats(self):
+        """Return a dictionary of each rule's counters."""
+        self.lock.acquire()
+        try:
+            stats = {}
+            for rule in self.rules:
+                runs, triggered, fired, hits, seconds = \
+                    self.counters.get(rule.name, [0, 0, 0, 0, 0.0])
+                stats[rule.name] = { "runs"      : runs,
+                                     "triggered" : triggered,
+                                     "fired"     : fired,
+                                     "hits"      : hits,
+                                     "seconds"   : seconds }
+            return stats
+        finally:
+            self.lock.release()
+
+    def clear_stats(self):
+        """Reset the counters."""
+        self.lock.acquire()
+        try:
+            self.counters = {}
+        finally:
+            self.lock.release()
+
+def rule_stats():
+    """Return the stats() of every named RuleSet, by name."""
+    return dict([(name, rules.stats()) for (name, rules) in registry.items()])
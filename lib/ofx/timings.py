@@ -0,0 +1,101 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofx.timings - time spent in each stage of a conversion.
+#
+
+import time
+
+class Timings:
+    """Records the wall-clock and CPU time spent in each stage of a
+    conversion, along with the size of the stage's input and output (in
+    bytes, where the stage works on text).  Pass one to fixofx.convert(),
+    or to ofx.Response and the ofxtools converters, and read it back once
+    the conversion is done:
+
+        timings = ofx.Timings()
+        fixofx.convert(text, filetype, timings=timings)
+        for stage in timings.stages:
+            metrics.timing("fixofx." + stage["name"], stage["wall"])
+
+    Each stage is a dictionary with 'name', 'wall' and 'cpu' (seconds),
+    'input_bytes' and 'output_bytes' (None if not known), and 'error'
+    (the name of the exception, if the stage failed).  If a callback is
+    given, it is called with each stage as it finishes.  Stages don't
+    overlap, so their times can be added up; as_dict() does so.
+
+    CPU time is process time, as measured by time.clock() (on Unix), so
+    it includes any other threads the process is running."""
+    def __init__(self, callback=None):
+        self.stages   = []
+        self.callback = callback
+
+    def stage(self, name, input=None):
+        """Return a context manager that times the stage 'name'.  See
+        timed()."""
+        return _Stage(self, name, input)
+
+    def record(self, stage):
+        self.stages.append(stage)
+        if self.callback is not None:
+            self.callback(stage)
+
+    def as_dict(self):
+        """Return the stages, with their total times, as a dictionary
+        suitable for JSON."""
+        return { "stages" : list(self.stages),
+                 "wall"   : sum([stage["wall"] for stage in self.stages]),
+                 "cpu"    : sum([stage["cpu"] for stage in self.stages]) }
+
+def timed(timings, name, input=None):
+    """Return a context manager that times the stage 'name' of a
+    conversion, and records it in 'timings' -- or does nothing, if
+    'timings' is None.  If 'input' is given, its length is recorded as the
+    input size; set the output_bytes of the object the context manager
+    returns to record the output size:
+
+        with ofx.timed(timings, "parse", text) as stage:
+            ...
+            stage.output_bytes = len(result)
+    """
+    return _Stage(timings, name, input)
+
+class _Stage:
+    def __init__(self, timings, name, input=None):
+        self.timings      = timings
+        self.name         = name
+        self.input_bytes  = None
+        self.output_bytes = None
+        if timings is not None and input is not None:
+            self.input_bytes = len(input)
+
+    def __enter__(self):
+        if self.timings is not None:
+            self.wall = time.time()
+            self.cpu  = time.clock()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.timings is None:
+            return False
+        stage = { "name"         : self.name,
+                  "wall"         : time.time() - self.wall,
+                  "cpu"          : time.clock() - self.cpu,
+                  "input_bytes"  : self.input_bytes,
+                  "output_bytes" : self.output_bytes }
+        if exc_type is not None:
+            stage["error"] = exc_type.__name__
+        self.timings.record(stage)
+        return False
@@ -34,6 +34,8 @@ def _ofxtoolsSuccessDebugAction( instring, startloc, endloc, expr, toks ):
 def _ofxtoolsExceptionDebugAction( instring, loc, expr, exc ):
     sys.stderr.write("Exception raised: %s" % exc)
 
+from ofxtools.conversion_cache import *
+from ofxtools.dates import *
 from ofxtools.ofc_converter import *
 from ofxtools.ofc_parser import *
 from ofxtools.qif_converter import *
@@ -0,0 +1,256 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofxtools.conversion_cache - converted documents, keyed by their input.
+#
+
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Part of every key; change it whenever the converters' output changes, so
+# that documents cached by an older fixofx (in a DirectoryStore, say) are
+# no longer found.
+_KEY_VERSION = "1"
+
+class ConversionCache:
+    """Cache of converted (OFX 2.0) documents, keyed by a hash of the raw
+    input and the conversion options, so that converting the same upload
+    twice (a re-upload, a retry) only does the work once:
+
+        cache = ofxtools.ConversionCache(ofxtools.MemoryStore(size=256))
+        key = cache.key(text, filetype=filetype, fid=fid, org=org)
+        converted = cache.get(key)
+        if converted is None:
+            converted = ...
+            cache.put(key, converted)
+
+    fixofx.convert() does this when given a cache.  The documents are kept
+    in a store: a MemoryStore for a single process, or a DirectoryStore,
+    which can be shared between processes and runs.  The 'hits' and
+    'misses' counters record how often get() found a document."""
+    def __init__(self, store):
+        self.store  = store
+        self.lock   = threading.Lock()
+        self.hits   = 0
+        self.misses = 0
+
+    def key(self, text, **options):
+        """Return the cache key for converting 'text' with the given
+        options.  Options that don't change the output (such as verbose)
+        should be left out."""
+        digest = hashlib.sha1()
+        digest.update("fixofx conversion %s\n" % _KEY_VERSION)
+        for name in sorted(options.keys()):
+            digest.update("%s=%r\n" % (name, options[name]))
+        digest.update("\n")
+        digest.update(text)
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return the cached document for the key, or None."""
+        value = self.store.get(key)
+        self.lock.acquire()
+        try:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        finally:
+            self.lock.release()
+        return value
+
+    def put(self, key, value):
+        """Cache the document for the key."""
+        self.store.put(key, value)
+
+    def stats(self):
+        """Return the cache counters as a dictionary, along with the
+        store's own counts."""
+        lookups = self.hits + self.misses
+        stats = { "hits"     : self.hits,
+                  "misses"   : self.misses,
+                  "hit_rate" : float(self.hits) / max(lookups, 1) }
+        stats.update(self.store.stats())
+        return stats
+
+    def clear(self):
+        """Empty the store and reset the counters."""
+        self.lock.acquire()
+        try:
+            self.store.clear()
+            self.hits   = 0
+            self.misses = 0
+        finally:
+            self.lock.release()
+
+class MemoryStore:
+    """LRU store for ConversionCache that holds up to 'size' documents in
+    memory."""
+    def __init__(self, size=256):
+        self.size      = size
+        self.documents = OrderedDict()
+        self.lock      = threading.Lock()
+
+    def get(self, key):
+        self.lock.acquire()
+        try:
+            value = self.documents.pop(key, None)
+            if value is not None:
+                self.documents[key] = value
+            return value
+        finally:
+            self.lock.release()
+
+    def put(self, key, value):
+        self.lock.acquire()
+        try:
+            self.documents.pop(key, None)
+            self.documents[key] = value
+            while len(self.documents) > self.size:
+                self.documents.popitem(last=False)
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        self.lock.acquire()
+        try:
+            return { "entries" : len(self.documents),
+                     "bytes"   : sum([len(value) for value in
+                                      self.documents.values()]) }
+        finally:
+            self.lock.release()
+
+    def clear(self):
+        self.lock.acquire()
+        try:
+            self.documents.clear()
+        finally:
+            self.lock.release()
+
+class DirectoryStore:
+    """Store for ConversionCache that keeps each document in its own file
+    under 'path', and keeps the total size under 'max_bytes' by removing
+    the least recently used documents.  Files are written to a temporary
+    name and renamed into place, so several processes (fixofx's batch
+    workers, say) can share the directory."""
+    def __init__(self, path, max_bytes=100 * 1024 * 1024):
+        self.path      = path
+        self.max_bytes = max_bytes
+        self.bytes     = None
+        self.lock      = threading.Lock()
+        if not os.path.isdir(path):
+            try:
+                os.makedirs(path)
+            except OSError:
+                # Another process may have just made it.
+                if not os.path.isdir(path):
+                    raise
+
+    def get(self, key):
+        file_path = self._file(key)
+        try:
+            document = open(file_path, "rb")
+            try:
+                value = document.read()
+            finally:
+                document.close()
+            # The modification time doubles as the last use time.
+            os.utime(file_path, None)
+            return value
+        except EnvironmentError:
+            return None
+
+    def put(self, key, value):
+        file_path = self._file(key)
+        directory = os.path.dirname(file_path)
+        if not os.path.isdir(directory):
+            try:
+                os.mkdir(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        (handle, temp_path) = tempfile.mkstemp(dir=directory, prefix=".")
+        temp = os.fdopen(handle, "wb")
+        try:
+            temp.write(value)
+        finally:
+            temp.close()
+        try:
+            replaced = os.path.getsize(file_path)
+        except OSError:
+            replaced = 0
+        os.rename(temp_path, file_path)
+
+        self.lock.acquire()
+        try:
+            if self.bytes is None:
+                self.bytes = sum([size for (mtime, size, path) in self._files()])
+            else:
+                self.bytes += len(value) - replaced
+            if self.bytes > self.max_bytes:
+                self._trim()
+        finally:
+            self.lock.release()
+
+    def stats(self):
+        files = self._files()
+        return { "entries" : len(files),
+                 "bytes"   : sum([size for (mtime, size, path) in files]) }
+
+    def clear(self):
+        for (mtime, size, path) in self._files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        self.bytes = 0
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def _files(self):
+        # Returns (mtime, size, path) for every document, oldest first.
+        files = []
+        for (dirpath, dirnames, filenames) in os.walk(self.path):
+            for filename in filenames:
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        return files
+
+    def _trim(self):
+        # Other processes may have been adding documents too, so look at
+        # what's really there, and make some room while we're at it.
+        files = self._files()
+        total = sum([size for (mtime, size, path) in files])
+        target = self.max_bytes * 0.9
+        for (mtime, size, path) in files:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+        self.bytes = total
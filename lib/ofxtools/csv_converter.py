@@ -109,6 +109,11 @@ class CsvConverter:
             self._check_date_format(parsed_date)
 
     def _parse_date(self, txn_date, dayfirst=False):
+        # See QifConverter._parse_date.
+        if txn_date != "UNKNOWN":
+            return ofxtools.date_cache.parse(txn_date, dayfirst=dayfirst)
+        else:
+            return "UNKNOWN"
 
     def _check_date_format(self, parsed_date):
         # If we *ever* find a date that parses as dayfirst, treat
@@ -347,9 +352,11 @@ class CsvConverter:
 
     def to_ofx102(self):
         if self.debug: sys.stderr.write("Making OFX/1.02.\n")
-        return DOCUMENT(self._ofx_header(),
-                        OFX(self._ofx_signon(),
-                            self._ofx_stmt()))
+        with Fragments():
+            document = DOCUMENT(self._ofx_header(),
+                                OFX(self._ofx_signon(),
+                                    self._ofx_stmt()))
+        return str(document)
 
     def to_xml(self):
         ofx102 = self.to_ofx102()
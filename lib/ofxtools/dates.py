@@ -0,0 +1,167 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+#
+#  ofxtools.dates - cached parsing of transaction dates.
+#
+
+import datetime
+import dateutil.parser
+import re
+import threading
+from collections import OrderedDict
+
+# Numeric dates in the shapes banks send most often: MM/DD/YYYY (or
+# DD/MM/YYYY, or with a two-digit year), Quicken's MM/DD'YY, and
+# YYYYMMDD.
+_SLASHED = re.compile(r"^\s*(\d{1,2}) */ *(\d{1,2}) *[/'] *(\d{4}|\d{2})\s*$")
+_COMPACT = re.compile(r"^\s*(\d{4})(\d{2})(\d{2})\s*$")
+
+class DateCache:
+    """Bounded LRU cache of parsed transaction dates, keyed on the date
+    string and the dayfirst flag.  Statements repeat the same few dates
+    over and over, and dateutil is slow, so converters parse dates with
+    the shared 'date_cache' instance:
+
+        parsed = ofxtools.date_cache.parse("01/13/2005")
+
+    Dates in the common numeric shapes are worked out directly; anything
+    else goes to dateutil, with a retry as MM/DD/YYYY for 8-digit dates
+    dateutil doesn't understand.  Results are exactly what dateutil would
+    return, including the microsecond value of 3 that marks a date which
+    could only have been day-first.  The 'hits', 'misses' and 'fast'
+    counters record cache hits, cache misses, and misses that were
+    handled without calling dateutil."""
+    def __init__(self, size=1024):
+        self.size   = size
+        self.cache  = OrderedDict()
+        self.lock   = threading.Lock()
+        self.hits   = 0
+        self.misses = 0
+        self.fast   = 0
+
+    def parse(self, txn_date, dayfirst=False):
+        """Return a datetime for the date string, or raise ValueError if
+        the date can't be recognized."""
+        key = (txn_date, bool(dayfirst))
+        self.lock.acquire()
+        try:
+            result = self.cache.pop(key, None)
+            if result is not None:
+                self.hits += 1
+                self.cache[key] = result
+        finally:
+            self.lock.release()
+
+        if result is None:
+            result = self._parse_shape(txn_date, dayfirst)
+            fast   = result is not None
+            if not fast:
+                try:
+                    result = self._parse(txn_date, dayfirst)
+                except ValueError, e:
+                    result = e
+
+            self.lock.acquire()
+            try:
+                self.misses += 1
+                if fast:
+                    self.fast += 1
+                self.cache[key] = result
+                if len(self.cache) > self.size:
+                    self.cache.popitem(last=False)
+            finally:
+                self.lock.release()
+
+        if isinstance(result, ValueError):
+            raise ValueError(str(result))
+        return result
+
+    def stats(self):
+        """Return the cache counters as a dictionary."""
+        return { "hits"   : self.hits,
+                 "misses" : self.misses,
+                 "fast"   : self.fast,
+                 "size"   : len(self.cache) }
+
+    def clear(self):
+        """Empty the cache and reset the counters."""
+        self.lock.acquire()
+        try:
+            self.cache.clear()
+            self.hits   = 0
+            self.misses = 0
+            self.fast   = 0
+        finally:
+            self.lock.release()
+
+    def _parse(self, txn_date, dayfirst):
+        try:
+            return dateutil.parser.parse(txn_date, dayfirst=dayfirst)
+
+        except ValueError:
+            # dateutil.parser doesn't recognize dates of the
+            # format "MMDDYYYY", though it does recognize
+            # "MM/DD/YYYY".  So, if parsing has failed above,
+            # try shoving in some slashes and see if that
+            # parses.
+            try:
+                if len(txn_date) == 8:
+                    # The int() cast will only succeed if all 8
+                    # characters of txn_date are numbers.  If
+                    # it fails, it will throw an exception we
+                    # can catch below.
+                    date_int = int(txn_date)
+                    # No exception?  Great, keep parsing the
+                    # string (dateutil wants a string
+                    # argument).
+                    slashified = "%s/%s/%s" % (txn_date[0:2],
+                                               txn_date[2:4],
+                                               txn_date[4:])
+                    return dateutil.parser.parse(slashified,
+                                                 dayfirst=dayfirst)
+            except:
+                pass
+
+        # If we've made it this far, our guesses have failed.
+        raise ValueError("Unrecognized date format: '%s'." % txn_date)
+
+    def _parse_shape(self, txn_date, dayfirst):
+        # Follow dateutil's rules for three numeric fields, and leave
+        # anything out of the ordinary (including invalid dates) to it.
+        convertyear = dateutil.parser.DEFAULTPARSER.info.convertyear
+        try:
+            match = _SLASHED.match(txn_date)
+            if match is not None:
+                first, second, year = [int(x) for x in match.groups()]
+                if first > 31:
+                    return None
+                elif first > 12 or (dayfirst and second <= 12):
+                    return datetime.datetime(convertyear(year), second, first,
+                                             0, 0, 0, 3)
+                else:
+                    return datetime.datetime(convertyear(year), first, second,
+                                             0, 0, 0, 2)
+
+            match = _COMPACT.match(txn_date)
+            if match is not None:
+                year, month, day = [int(x) for x in match.groups()]
+                if year > 31:
+                    return datetime.datetime(convertyear(year), month, day,
+                                             0, 0, 0, 1)
+        except ValueError:
+            pass
+        return None
+
+date_cache = DateCache()
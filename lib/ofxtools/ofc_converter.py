@@ -21,16 +21,18 @@ import ofxtools
 import re
 import sys
 from ofx.builder import *
+from ofxtools.ofx2 import aggregate, balance, content, document, signon, status
 
 class OfcConverter:
     def __init__(self, ofc, fid="UNKNOWN", org="UNKNOWN", curdef=None,
-                 lang="ENG", debug=False):
+                 lang="ENG", debug=False, timings=None):
         self.ofc      = ofc
         self.fid      = fid
         self.org      = org
         self.curdef   = curdef
         self.lang     = lang
         self.debug    = debug
+        self.timings  = timings
 
         self.bankid     = "UNKNOWN"
         self.accttype   = "UNKNOWN"
@@ -66,8 +68,9 @@ class OfcConverter:
 
         if self.debug: sys.stderr.write("Parsing document.\n")
 
-        parser = ofxtools.OfcParser(debug=debug)
-        self.parsed_ofc = parser.parse(self.ofc)
+        with ofx.timed(timings, "parse", self.ofc):
+            parser = ofxtools.OfcParser(debug=debug)
+            self.parsed_ofc = parser.parse(self.ofc)
 
         if self.debug: sys.stderr.write("Extracting document properties.\n")
 
@@ -92,23 +95,26 @@ class OfcConverter:
 
     def to_ofx102(self):
         if self.debug: sys.stderr.write("Making OFX/1.02.\n")
-        return DOCUMENT(self._ofx_header(),
-                        OFX(self._ofx_signon(),
-                            self._ofx_stmt()))
-
-    def to_xml(self):
-        ofx102 = self.to_ofx102()
-
-        if self.debug:
-            sys.stderr.write(ofx102 + "\n")
-            sys.stderr.write("Parsing OFX/1.02.\n")
-        response = ofx.Response(ofx102, debug=self.debug)
-
+        with ofx.timed(self.timings, "to_ofx102") as stage:
+            with Fragments():
+                document = DOCUMENT(self._ofx_header(),
+                                    OFX(self._ofx_signon(),
+                                        self._ofx_stmt()))
+            ofx102 = str(document)
+            stage.output_bytes = len(ofx102)
+        return ofx102
+
+    def to_xml(self, stream=None):
+        """Returns the statement as an OFX 2.0 document.  The document is
+        built straight from the parsed OFC rather than by parsing the
+        output of to_ofx102(), but it comes out the same.  If a file-like
+        'stream' is given, the document is written to it instead of being
+        returned."""
         if self.debug: sys.stderr.write("Making OFX/2.0.\n")
-
-        xml = response.as_xml(original_format="OFC")
-
-        return xml
+        with ofx.timed(self.timings, "build"):
+            document = self._ofx2_document()
+        return document.as_xml(original_format="OFC", stream=stream,
+                               timings=self.timings)
 
     # FIXME: Move the remaining methods to ofx.Document or ofx.Response.
 
@@ -190,7 +196,16 @@ class OfcConverter:
             DTASOF(self.end_date))
 
     def _ofx_txns(self):
-        txns = ""
+        txns = [self._ofx_txn(txn) for txn in self._txns()]
+
+        return BANKTRANLIST(
+            DTSTART(self.start_date),
+            DTEND(self.end_date),
+            *txns)
+
+    def _txns(self):
+        """Generate a dictionary for each transaction in the statement,
+        with its type translated and a synthetic ID added."""
         last_date = None
         txn_index = 1
 
@@ -218,14 +233,9 @@ class OfcConverter:
                 txn["FITID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
                                                    txn_date, txn_index,
                                                    txn_amt)
-                txns += self._ofx_txn(txn)
+                yield txn
                 txn_index += 1
 
-        return BANKTRANLIST(
-            DTSTART(self.start_date),
-            DTEND(self.end_date),
-            txns)
-
     def _ofx_txn(self, txn):
         fields = []
         if self._check_field("TRNTYPE", txn):
@@ -254,4 +264,64 @@ class OfcConverter:
     def _check_field(self, key, txn):
         return txn.has_key(key) and txn[key].strip() != ""
 
+    #
+    # OFX 2.0 generation
+    #
+    # These methods mirror the OFX/1.02 ones above, but build the tree of
+    # ofx.Node objects that ofx.Parser would have made from the OFX/1.02
+    # text (see ofxtools.ofx2).
+    #
+
+    def _ofx2_document(self):
+        return document(signon(self.end_date, self.lang, self.org, self.fid),
+                        self._ofx2_stmt())
+
+    def _ofx2_stmt(self):
+        if self.curdef is None:
+            curdef = "USD"
+        else:
+            curdef = self.curdef
+
+        if self.accttype == "Credit Card":
+            return aggregate("CREDITCARDMSGSRSV1",
+                aggregate("CCSTMTTRNRS",
+                    content("TRNUID", "0"),
+                    status(),
+                    aggregate("CCSTMTRS",
+                        content("CURDEF", curdef),
+                        aggregate("CCACCTFROM",
+                            content("ACCTID", self.acctid)),
+                        self._ofx2_txns(),
+                        balance("LEDGERBAL", self.balance, self.end_date),
+                        balance("AVAILBAL", self.balance, self.end_date))))
+        else:
+            return aggregate("BANKMSGSRSV1",
+                aggregate("STMTTRNRS",
+                    content("TRNUID", "0"),
+                    status(),
+                    aggregate("STMTRS",
+                        content("CURDEF", curdef),
+                        aggregate("BANKACCTFROM",
+                            content("BANKID", self.bankid),
+                            content("ACCTID", self.acctid),
+                            content("ACCTTYPE", self.accttype)),
+                        self._ofx2_txns(),
+                        balance("LEDGERBAL", self.balance, self.end_date),
+                        balance("AVAILBAL", self.balance, self.end_date))))
+
+    def _ofx2_txns(self):
+        txns = [self._ofx2_txn(txn) for txn in self._txns()]
+        return aggregate("BANKTRANLIST",
+            content("DTSTART", self.start_date),
+            content("DTEND", self.end_date),
+            *txns)
+
+    def _ofx2_txn(self, txn):
+        fields = []
+        for tag in _TXN_FIELDS:
+            value = txn.get(tag, "").strip()
+            if value != "":
+                fields.append(content(tag, value))
+        return aggregate("STMTTRN", *fields)
 
+_TXN_FIELDS = ("TRNTYPE", "DTPOSTED", "TRNAMT", "CHECKNUM", "FITID", "NAME", "MEMO")
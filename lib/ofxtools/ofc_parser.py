@@ -17,12 +17,19 @@
 #
 
 import ofxtools
+from ofx.parser import GrammarCache
 from pyparsing import alphanums, CharsNotIn, Dict, Forward, Group, \
 Literal, OneOrMore, White, Word, ZeroOrMore
 
+_grammars = GrammarCache()
+
 class OfcParser:
     """Dirt-simple OFC parser for interpreting OFC documents."""
     def __init__(self, debug=False):
+        self.parser = _grammars.get(debug, self._grammar)
+    
+    def _grammar(self, debug=False):
+        """Build the pyparsing grammar for OFC documents."""
         aggregate = Forward().setResultsName("OFC")
         aggregate_open_tag, aggregate_close_tag = self._tag()
         content_open_tag = self._tag(closed=False)
@@ -31,11 +38,12 @@ class OfcParser:
             + Dict(OneOrMore(aggregate | content)) \
             + aggregate_close_tag)
         
-        self.parser = Group(aggregate).setResultsName("document")
+        parser = Group(aggregate).setResultsName("document")
         if (debug):
-            self.parser.setDebugActions(ofxtools._ofxtoolsStartDebugAction, 
-                                        ofxtools._ofxtoolsSuccessDebugAction, 
-                                        ofxtools._ofxtoolsExceptionDebugAction)
+            parser.setDebugActions(ofxtools._ofxtoolsStartDebugAction, 
+                                   ofxtools._ofxtoolsSuccessDebugAction, 
+                                   ofxtools._ofxtoolsExceptionDebugAction)
+        return parser
     
     def _tag(self, closed=True):
         """Generate parser definitions for OFX tags."""
@@ -26,11 +26,48 @@ import xml.sax.saxutils as sax
 from decimal import *
 from time import localtime, strftime
 from ofx.builder import *
+from ofxtools.ofx2 import aggregate, balance, content, document, signon, status
+
+_TYPE_HEADER = re.compile("!Type:", re.IGNORECASE)
+_ACCOUNT     = re.compile("!Account", re.IGNORECASE)
 
 class QifConverter:
+    # Fixes for broken QIF files, applied in order before parsing.
+    rules = ofx.RuleSet([
+        # Some joker British bank starts QIF with a single bang and nothing
+        # else.
+        ofx.Rule("typeless_bang_header", "\\A!\n", "!Type:Bank\n", count=1,
+                 trigger=lambda qif: qif.startswith("!\n"),
+                 description="Fixing typeless bang header."),
+
+        # Chase does not provide a Type header, so force one in the
+        # case where it is omitted.
+        ofx.Rule("missing_type_header",
+                 trigger=lambda qif: _TYPE_HEADER.search(qif) is None,
+                 function=lambda qif: ("!Type:Bank\n" + qif, 1),
+                 description="Forcing bank type header."),
+
+        ofx.Rule("account_block", "(!Account.*?\\^\\s*)", count=1,
+                 flags=re.DOTALL | re.IGNORECASE,
+                 trigger=lambda qif: _ACCOUNT.search(qif) is not None,
+                 description="Discarding account block from QIF file."),
+
+        # Some other personal finance program puts out a spurious transaction
+        # showing current balance, but not as a balance -- instead as a
+        # transaction before the type header.  And, there are a bunch of other
+        # cases where crap before the type header is messing us up right now.
+        # So, this is an awfully big hammer but one that at least lets people
+        # import from other finance programs and broken banks.
+        ofx.Rule("stray_crap", "\\A.+?(?=!Type)", count=1,
+                 flags=re.DOTALL | re.IGNORECASE,
+                 trigger=lambda qif: qif[:5].lower() != "!type",
+                 description="Discarding stray crap from beginning of QIF file.")],
+        name="qif")
+
     def __init__(self, qif, fid="UNKNOWN", org="UNKNOWN", bankid="UNKNOWN",
                  accttype="UNKNOWN", acctid="UNKNOWN", balance="UNKNOWN",
-                 curdef=None, lang="ENG", dayfirst=False, debug=False):
+                 curdef=None, lang="ENG", dayfirst=False, debug=False,
+                 timings=None):
         self.qif      = qif
         self.fid      = fid
         self.org      = org
@@ -42,6 +79,7 @@ class QifConverter:
         self.lang     = lang
         self.debug    = debug
         self.dayfirst = dayfirst
+        self.timings  = timings
 
         self.parsed_qif = None
 
@@ -86,43 +124,15 @@ class QifConverter:
                            "REPEATPMT"   : "REPEATPMT",
                            "OTHER"       : "OTHER"        }
 
-        # Some joker British bank starts QIF with a single bang and nothing
-        # else.
-        if re.match("!\n", self.qif) is not None:
-            if self.debug: sys.stderr.write("Fixing typeless bang header.\n")
-            self.qif = self.qif.replace("!", "!Type:Bank", 1)
-
-        # Chase does not provide a Type header, so force one in the
-        # case where it is omitted.
-        if re.search("!Type:", self.qif, re.IGNORECASE) == None:
-            if self.debug: sys.stderr.write("Forcing bank type header.\n")
-            self.qif = "!Type:Bank\n" + self.qif
-
-        acctblock = re.search("(!Account.*?\^\s*)", self.qif, re.DOTALL | re.IGNORECASE | re.MULTILINE)
-        if acctblock is not None:
-            block = acctblock.group(1)
-            if self.debug:
-                sys.stderr.write("Discarding account block from QIF file:\n%s" % block)
-            self.qif = self.qif.replace(block, '', 1)
-
-        # Some other personal finance program puts out a spurious transaction
-        # showing current balance, but not as a balance -- instead as a
-        # transaction before the type header.  And, there are a bunch of other
-        # cases where crap before the type header is messing us up right now.
-        # So, this is an awfully big hammer but one that at least lets people
-        # import from other finance programs and broken banks.
-        straycrap = re.search("^(.*?)!Type", self.qif, re.DOTALL | re.IGNORECASE | re.MULTILINE)
-        if straycrap is not None:
-            crap = straycrap.group(1)
-            if len(crap) > 0:
-              if self.debug:
-                  sys.stderr.write("Discarding stray crap from beginning of QIF file:\n%s" % crap)
-              self.qif = self.qif.replace(crap, '', 1)
+        with ofx.timed(timings, "qif_rules", self.qif) as stage:
+            self.qif = self.rules.apply(self.qif, fid=self.fid, debug=self.debug)
+            stage.output_bytes = len(self.qif)
 
         if self.debug: sys.stderr.write("Parsing document.\n")
 
-        parser = ofxtools.QifParser(debug=debug)
-        self.parsed_qif = parser.parse(self.qif)
+        with ofx.timed(timings, "parse", self.qif):
+            parser = ofxtools.QifParser(debug=debug)
+            self.parsed_qif = parser.parse(self.qif)
 
         if self.debug: sys.stderr.write("Cleaning transactions.\n")
 
@@ -132,9 +142,12 @@ class QifConverter:
         # at dates; the second actually applies the date conversion and
         # all other conversions, and extracts information needed for
         # the final output (like date range).
-        txn_list = self._extract_txn_list(self.parsed_qif)
-        self._guess_formats(txn_list)
-        self._clean_txn_list(txn_list)
+        with ofx.timed(timings, "extract_txn_list"):
+            txn_list = self._extract_txn_list(self.parsed_qif)
+        with ofx.timed(timings, "guess_formats"):
+            self._guess_formats(txn_list)
+        with ofx.timed(timings, "clean_txn_list"):
+            self._clean_txn_list(txn_list)
 
     def _extract_txn_list(self, qif):
         stmt_obj = qif.asDict()["QifStatement"]
@@ -180,37 +193,9 @@ class QifConverter:
     def _parse_date(self, txn_date, dayfirst=False):
         # Try as best we can to parse the date into a datetime object. Note:
         # this assumes that we never see a timestamp, just the date, in any
-        # QIF date.
+        # QIF date.  See ofxtools.DateCache for the formats we understand.
         if txn_date != "UNKNOWN":
-            try:
-                return dateutil.parser.parse(txn_date, dayfirst=dayfirst)
-
-            except ValueError:
-                # dateutil.parser doesn't recognize dates of the
-                # format "MMDDYYYY", though it does recognize
-                # "MM/DD/YYYY".  So, if parsing has failed above,
-                # try shoving in some slashes and see if that
-                # parses.
-                try:
-                    if len(txn_date) == 8:
-                        # The int() cast will only succeed if all 8
-                        # characters of txn_date are numbers.  If
-                        # it fails, it will throw an exception we
-                        # can catch below.
-                        date_int = int(txn_date)
-                        # No exception?  Great, keep parsing the
-                        # string (dateutil wants a string
-                        # argument).
-                        slashified = "%s/%s/%s" % (txn_date[0:2],
-                                                   txn_date[2:4],
-                                                   txn_date[4:])
-                        return dateutil.parser.parse(slashified,
-                                                     dayfirst=dayfirst)
-                except:
-                    pass
-
-            # If we've made it this far, our guesses have failed.
-            raise ValueError("Unrecognized date format: '%s'." % txn_date)
+            return ofxtools.date_cache.parse(txn_date, dayfirst=dayfirst)
         else:
             return "UNKNOWN"
 
@@ -474,26 +459,30 @@ class QifConverter:
 
     def to_ofx102(self):
         if self.debug: sys.stderr.write("Making OFX/1.02.\n")
-        return DOCUMENT(self._ofx_header(),
-                        OFX(self._ofx_signon(),
-                            self._ofx_stmt()))
-
-    def to_xml(self):
-        ofx102 = self.to_ofx102()
-
-        if self.debug:
-            sys.stderr.write(ofx102 + "\n")
-            sys.stderr.write("Parsing OFX/1.02.\n")
-        response = ofx.Response(ofx102) #, debug=self.debug)
-
+        with ofx.timed(self.timings, "to_ofx102") as stage:
+            with Fragments():
+                document = DOCUMENT(self._ofx_header(),
+                                    OFX(self._ofx_signon(),
+                                        self._ofx_stmt()))
+            ofx102 = str(document)
+            stage.output_bytes = len(ofx102)
+        return ofx102
+
+    def to_xml(self, stream=None):
+        """Returns the statement as an OFX 2.0 document.  The document is
+        built straight from the cleaned transactions rather than by parsing
+        the output of to_ofx102(), but it comes out the same.  If a
+        file-like 'stream' is given, the document is written to it instead
+        of being returned."""
         if self.debug: sys.stderr.write("Making OFX/2.0.\n")
         if self.dayfirst:
             date_format = "DD/MM/YY"
         else:
             date_format = "MM/DD/YY"
-        xml = response.as_xml(original_format="QIF", date_format=date_format)
-
-        return xml
+        with ofx.timed(self.timings, "build"):
+            document = self._ofx2_document()
+        return document.as_xml(original_format="QIF", date_format=date_format,
+                               stream=stream, timings=self.timings)
 
     # FIXME: Move the remaining methods to ofx.Document or ofx.Response.
 
@@ -575,8 +564,17 @@ class QifConverter:
             DTASOF(self.end_date))
 
     def _ofx_txns(self):
-        txns = ""
+        txns = [self._ofx_txn(txn) for txn in self._sorted_txns()]
+
+        # FIXME: This should respect the type of statement being generated.
+        return BANKTRANLIST(
+            DTSTART(self.start_date),
+            DTEND(self.end_date),
+            *txns)
 
+    def _sorted_txns(self):
+        """Generate the transactions in statement order, giving each one
+        its synthetic ID."""
         # OFX transactions appear most recent first, and oldest last,
         # so we do a reverse sort of the dates in this statement.
         date_list = self.txns_by_date.keys()
@@ -594,15 +592,9 @@ class QifConverter:
                 txn["ID"] = "%s-%s-%s-%s-%s" % (self.org, self.accttype,
                                                 txn_date, txn_index,
                                                 txn_amt)
-                txns += self._ofx_txn(txn)
+                yield txn
                 txn_index -= 1
 
-        # FIXME: This should respect the type of statement being generated.
-        return BANKTRANLIST(
-            DTSTART(self.start_date),
-            DTEND(self.end_date),
-            txns)
-
     def _ofx_txn(self, txn):
         fields = []
         if self._check_field("Type", txn):
@@ -631,4 +623,72 @@ class QifConverter:
     def _check_field(self, key, txn):
         return txn.has_key(key) and txn[key].strip() != ""
 
+    #
+    # OFX 2.0 generation
+    #
+    # These methods mirror the OFX/1.02 ones above, but build the tree of
+    # ofx.Node objects that ofx.Parser would have made from the OFX/1.02
+    # text (see ofxtools.ofx2).
+    #
+
+    def _ofx2_document(self):
+        return document(signon(self.end_date, self.lang, self.org, self.fid),
+                        self._ofx2_stmt())
+
+    def _ofx2_stmt(self):
+        if self.curdef is None:
+            curdef = "USD"
+        else:
+            curdef = self.curdef
+
+        if self.accttype == "CREDITCARD":
+            return aggregate("CREDITCARDMSGSRSV1",
+                aggregate("CCSTMTTRNRS",
+                    content("TRNUID", "0"),
+                    status(),
+                    aggregate("CCSTMTRS",
+                        content("CURDEF", curdef),
+                        aggregate("CCACCTFROM",
+                            content("ACCTID", self.acctid)),
+                        self._ofx2_txns(),
+                        balance("LEDGERBAL", self.balance, self.end_date),
+                        balance("AVAILBAL", self.balance, self.end_date))))
+        else:
+            return aggregate("BANKMSGSRSV1",
+                aggregate("STMTTRNRS",
+                    content("TRNUID", "0"),
+                    status(),
+                    aggregate("STMTRS",
+                        content("CURDEF", curdef),
+                        aggregate("BANKACCTFROM",
+                            content("BANKID", self.bankid),
+                            content("ACCTID", self.acctid),
+                            content("ACCTTYPE", self.accttype)),
+                        self._ofx2_txns(),
+                        balance("LEDGERBAL", self.balance, self.end_date),
+                        balance("AVAILBAL", self.balance, self.end_date))))
+
+    def _ofx2_txns(self):
+        txns = [self._ofx2_txn(txn) for txn in self._sorted_txns()]
+        return aggregate("BANKTRANLIST",
+            content("DTSTART", self.start_date),
+            content("DTEND", self.end_date),
+            *txns)
+
+    def _ofx2_txn(self, txn):
+        fields = []
+        for key, tag in _TXN_FIELDS:
+            value = txn.get(key, "").strip()
+            if value != "":
+                fields.append(content(tag, value))
+
+        if self._check_field("Payee", txn):
+            fields.append(content("NAME", sax.escape(sax.unescape(txn["Payee"].strip()))))
+
+        if self._check_field("Memo", txn):
+            fields.append(content("MEMO", sax.escape(sax.unescape(txn["Memo"].strip()))))
+
+        return aggregate("STMTTRN", *fields)
 
+_TXN_FIELDS = (("Type", "TRNTYPE"), ("Date", "DTPOSTED"), ("Amount", "TRNAMT"),
+               ("Number", "CHECKNUM"), ("ID", "FITID"))
@@ -17,109 +17,192 @@
 #
 
 import ofxtools
+import sys
+from ofx.parser import GrammarCache
 from pyparsing import CaselessLiteral, Group, LineEnd, Literal, \
-    MatchFirst, oneOf, OneOrMore, Optional, Or, restOfLine, SkipTo, \
-    White, Word, ZeroOrMore
+    MatchFirst, oneOf, OneOrMore, Optional, Or, ParseException, \
+    restOfLine, SkipTo, White, Word, ZeroOrMore
+
+_grammars = GrammarCache()
+
+# Field codes for each kind of QIF record, mapped to the names used in
+# parse results.
+_ACCOUNT_ITEMS       = { 'N' : "Name",
+                         'T' : "AccountType",
+                         'D' : "Description",
+                         'L' : "CreditLimit",
+                         'X' : "UnknownField",
+                         'B' : "Balance",
+                         '/' : "BalanceDate",
+                         '$' : "Balance" }
+
+_NONINVESTMENT_ITEMS = { 'D' : "Date",
+                         'T' : "Amount",
+                         'U' : "Amount2",
+                         'C' : "Cleared",
+                         'N' : "Number",
+                         'P' : "Payee",
+                         'M' : "Memo",
+                         'L' : "Category",
+                         'A' : "Address",
+                         'S' : "SplitCategory",
+                         'E' : "SplitMemo",
+                         '$' : "SplitAmount",
+                         '-' : "NegativeSplitAmount" }
+
+_INVESTMENT_ITEMS    = { 'D' : "Date",
+                         'N' : "Action",
+                         'Y' : "Security",
+                         'I' : "Price",
+                         'Q' : "Quantity",
+                         'T' : "Amount",
+                         'C' : "Cleared",
+                         'P' : "Text",
+                         'M' : "Memo",
+                         'O' : "Commission",
+                         'L' : "TransferAccount",
+                         '$' : "TransferAmount" }
+
+_CATEGORY_ITEMS      = { 'N' : "Name",
+                         'D' : "Description",
+                         'T' : "TaxRelated",
+                         'I' : "IncomeCategory",
+                         'E' : "ExpenseCategory",
+                         'B' : "BudgetAmount",
+                         'R' : "TaxSchedule" }
+
+_CLASS_ITEMS         = { 'N' : "Name",
+                         'D' : "Description" }
+
+# Section headers understood by the line scanner, matched (like the
+# grammar's CaselessLiteral) against the start of the lowercased header
+# line.  Sections named None are skipped over.
+_SECTIONS = [ ("!type:bank",  "BankTransactions",       _NONINVESTMENT_ITEMS),
+              ("!type:cash",  "CashTransactions",       _NONINVESTMENT_ITEMS),
+              ("!type:ccard", "CreditCardTransactions", _NONINVESTMENT_ITEMS),
+              ("!type!ccard", "CreditCardTransactions", _NONINVESTMENT_ITEMS),
+              ("!type:oth l", "CreditCardTransactions", _NONINVESTMENT_ITEMS),
+              ("!type:invst", "InvestmentTransactions", _INVESTMENT_ITEMS),
+              ("!account",    None,                     _ACCOUNT_ITEMS),
+              ("!type:cat",   None,                     _CATEGORY_ITEMS),
+              ("!type:class", None,                     _CLASS_ITEMS) ]
+
+class QifTransaction(dict):
+    """One QIF record, mapping field names to values."""
+    def asDict(self):
+        return dict(self)
+
+class QifSection(list):
+    """The transactions under one QIF section header."""
+    def __init__(self, name):
+        list.__init__(self)
+        self.name = name
+
+    def asDict(self):
+        return self
+
+class QifStatement(list):
+    """The transaction sections of a QIF document, in order.  A section
+    name can be tested with 'in', as with a pyparsing result."""
+    def __contains__(self, name):
+        for section in self:
+            if section.name == name:
+                return True
+        return False
+
+    def asDict(self):
+        sections = {}
+        for section in self:
+            sections[section.name] = section
+        return sections
+
+class QifResult:
+    """The result of QifParser.parse with the scanner engine.  It answers
+    asDict() the same way the pyparsing result does, with the statement
+    under the "QifStatement" key."""
+    def __init__(self, statement):
+        self.statement = statement
+
+    def asDict(self):
+        return { "QifStatement" : self.statement }
 
 class QifParser:
-    def __init__(self, debug=False):
-        account_items       = { 'N' : "Name",
-                                'T' : "AccountType",
-                                'D' : "Description",
-                                'L' : "CreditLimit",
-                                'X' : "UnknownField",
-                                'B' : "Balance",
-                                '/' : "BalanceDate",
-                                '$' : "Balance" }
-        
-        noninvestment_items = { 'D' : "Date",
-                                'T' : "Amount",
-                                'U' : "Amount2",
-                                'C' : "Cleared",
-                                'N' : "Number",
-                                'P' : "Payee",
-                                'M' : "Memo",
-                                'L' : "Category",
-                                'A' : "Address",
-                                'S' : "SplitCategory",
-                                'E' : "SplitMemo",
-                                '$' : "SplitAmount",
-                                '-' : "NegativeSplitAmount" }
-        
-        investment_items    = { 'D' : "Date",
-                                'N' : "Action",
-                                'Y' : "Security",
-                                'I' : "Price",
-                                'Q' : "Quantity",
-                                'T' : "Amount",
-                                'C' : "Cleared",
-                                'P' : "Text",
-                                'M' : "Memo",
-                                'O' : "Commission",
-                                'L' : "TransferAccount",
-                                '$' : "TransferAmount" }
-        
-        category_items      = { 'N' : "Name",
-                                'D' : "Description",
-                                'T' : "TaxRelated",
-                                'I' : "IncomeCategory",
-                                'E' : "ExpenseCategory",
-                                'B' : "BudgetAmount",
-                                'R' : "TaxSchedule" }
-        
-        class_items         = { 'N' : "Name",
-                                'D' : "Description" }
-        
+    """Parser for QIF documents.
+
+    Two parsing engines are available.  The default "scanner" engine
+    reads the document a line at a time and can work from a file object
+    as well as a string; the "pyparsing" engine is the original grammar,
+    which is much slower on large files but is kept around for
+    comparison and debugging.  Both return results that work the same
+    way with QifConverter: the statement is a list of transaction
+    sections, and each section is a list of transactions with asDict().
+
+    The scanner is more forgiving than the grammar.  It skips lines with
+    field codes it doesn't know, and keeps a final transaction that is
+    missing its closing "^" line, where the grammar stops at the first
+    line it can't match."""
+    def __init__(self, debug=False, engine="scanner"):
+        if engine not in ("scanner", "pyparsing"):
+            raise ValueError("Unknown parser engine '%s'." % engine)
+        self.debug  = debug
+        self.engine = engine
+        self.parser = None
+        if engine == "pyparsing":
+            self.parser = _grammars.get(debug, self._grammar)
+    
+    def _grammar(self, debug=False):
+        """Build the pyparsing grammar for QIF documents."""
         options   = Group(CaselessLiteral('!Option:') + restOfLine).suppress()
         
         banktxns  = Group(CaselessLiteral('!Type:Bank').suppress() + 
-                          ZeroOrMore(Or([self._items(noninvestment_items),
+                          ZeroOrMore(Or([self._items(_NONINVESTMENT_ITEMS),
                                          options]))
                           ).setResultsName("BankTransactions")
         
         cashtxns  = Group(CaselessLiteral('!Type:Cash').suppress() + 
-                          ZeroOrMore(Or([self._items(noninvestment_items),
+                          ZeroOrMore(Or([self._items(_NONINVESTMENT_ITEMS),
                                          options]))
                           ).setResultsName("CashTransactions")
         
         ccardtxns = Group(Or([CaselessLiteral('!Type:CCard').suppress(),
                               CaselessLiteral('!Type!CCard').suppress()]) + 
-                          ZeroOrMore(Or([self._items(noninvestment_items),
+                          ZeroOrMore(Or([self._items(_NONINVESTMENT_ITEMS),
                                          options]))
                           ).setResultsName("CreditCardTransactions")
         
         liabilitytxns = Group(CaselessLiteral('!Type:Oth L').suppress() + 
-                          ZeroOrMore(Or([self._items(noninvestment_items),
+                          ZeroOrMore(Or([self._items(_NONINVESTMENT_ITEMS),
                                          options]))
                           ).setResultsName("CreditCardTransactions")
         
         invsttxns = Group(CaselessLiteral('!Type:Invst').suppress() + 
-                          ZeroOrMore(self._items(investment_items))
+                          ZeroOrMore(self._items(_INVESTMENT_ITEMS))
                           ).setResultsName("InvestmentTransactions")
         
         acctlist  = Group(CaselessLiteral('!Account').suppress() +
-                          ZeroOrMore(Or([self._items(account_items, name="AccountInfo")]))
+                          ZeroOrMore(Or([self._items(_ACCOUNT_ITEMS, name="AccountInfo")]))
                           ).setResultsName("AccountList")
         
         category  = Group(CaselessLiteral('!Type:Cat').suppress() +
-                          ZeroOrMore(self._items(category_items))
+                          ZeroOrMore(self._items(_CATEGORY_ITEMS))
                           ).setResultsName("CategoryList")
         
         classlist = Group(CaselessLiteral('!Type:Class').suppress() +
-                          ZeroOrMore(self._items(category_items))
+                          ZeroOrMore(self._items(_CATEGORY_ITEMS))
                           ).setResultsName("ClassList")
         
-        self.parser = Group(ZeroOrMore(White()).suppress() +
-                            ZeroOrMore(acctlist).suppress() +
-                            OneOrMore(ccardtxns | cashtxns | banktxns | liabilitytxns | invsttxns) +
-                            ZeroOrMore(White()).suppress()
-                            ).setResultsName("QifStatement")
+        parser = Group(ZeroOrMore(White()).suppress() +
+                       ZeroOrMore(acctlist).suppress() +
+                       OneOrMore(ccardtxns | cashtxns | banktxns | liabilitytxns | invsttxns) +
+                       ZeroOrMore(White()).suppress()
+                       ).setResultsName("QifStatement")
         
         if (debug):
-            self.parser.setDebugActions(ofxtools._ofxtoolsStartDebugAction, 
-                                        ofxtools._ofxtoolsSuccessDebugAction, 
-                                        ofxtools._ofxtoolsExceptionDebugAction)
+            parser.setDebugActions(ofxtools._ofxtoolsStartDebugAction, 
+                                   ofxtools._ofxtoolsSuccessDebugAction, 
+                                   ofxtools._ofxtoolsExceptionDebugAction)
         
+        return parser
     
     def _items(self, items, name="Transaction"):
         item_list = []
@@ -137,5 +220,87 @@ class QifParser:
                LineEnd().suppress()
     
     def parse(self, qif):
-        return self.parser.parseString(qif)
+        """Parse a QIF document, given as a string or (for the scanner
+        engine) a file object."""
+        if self.engine == "pyparsing":
+            return self.parser.parseString(qif)
+
+        statement = QifStatement()
+        for (name, txn) in self._records(qif):
+            if txn is None:
+                statement.append(QifSection(name))
+            else:
+                statement[-1].append(txn)
+
+        if len(statement) == 0:
+            raise ParseException(qif, 0, "No QIF transaction section found")
+        return QifResult(statement)
+
+    def scan(self, source):
+        """Generate a (section name, QifTransaction) pair for each
+        transaction in a QIF document, given as a string or a file
+        object.  Only one transaction is held in memory at a time."""
+        for (name, txn) in self._records(source):
+            if txn is not None:
+                yield (name, txn)
+
+    def _records(self, source):
+        # Like scan(), but also generates (section name, None) at the start
+        # of each transaction section.
+        if isinstance(source, basestring):
+            source = source.splitlines()
+
+        name  = None
+        items = None
+        txn   = None
+        for line in source:
+            if "\t" in line:
+                # The grammar sees the document with tabs expanded.
+                line = line.expandtabs()
+            line = line.lstrip().rstrip("\r\n")
+            if len(line) == 0:
+                continue
+
+            code = line[0]
+            if code == "!":
+                lowered = line.lower()
+                for (prefix, section_name, section_items) in _SECTIONS:
+                    if lowered.startswith(prefix):
+                        if txn and name is not None:
+                            yield (name, txn)
+                        name  = section_name
+                        items = section_items
+                        txn   = None
+                        if name is not None:
+                            yield (name, None)
+                        if self.debug:
+                            sys.stderr.write("Scanning QIF section %s.\n" % line)
+                        break
+                else:
+                    # An !Option line, or a section we don't know about.
+                    if not lowered.startswith("!option:"):
+                        if txn and name is not None:
+                            yield (name, txn)
+                        name  = None
+                        items = None
+                        txn   = None
+                continue
+
+            if items is None:
+                continue
+            if code == "^":
+                if txn and name is not None:
+                    txn["Currency"] = line.rstrip()
+                    yield (name, txn)
+                txn = None
+                continue
+
+            field = items.get(code.upper())
+            if field is not None:
+                if txn is None:
+                    txn = QifTransaction()
+                txn[field] = line[1:]
+
+        if txn and name is not None:
+            yield (name, txn)
     
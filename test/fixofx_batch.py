@@ -0,0 +1,137 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofx_test_utils
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+fixofx = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                      "fixofx.py")
+
+class BatchTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        for name in ["checking.ofx", "savings.ofx"]:
+            shutil.copy(os.path.join(ofx_test_utils.fixtures, name), self.dir)
+    
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+    
+    def _run(self, *args):
+        return self._run_report(*args)[0]
+    
+    def _run_report(self, *args):
+        """Run fixofx, and return its exit code and its status lines, each
+        split into fields."""
+        process = subprocess.Popen([sys.executable, fixofx] + list(args),
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+        (output, errors) = process.communicate()
+        lines = [line.split("\t") for line in output.splitlines()]
+        return process.returncode, sorted(lines)
+    
+    def _read(self, *path):
+        return open(os.path.join(self.dir, *path)).read()
+    
+    def _files(self, path):
+        found = []
+        for (dirpath, dirnames, filenames) in os.walk(path):
+            for filename in filenames:
+                found.append(os.path.relpath(os.path.join(dirpath, filename),
+                                             self.dir))
+        return sorted(found)
+    
+    def test_directory(self):
+        """Test converting a directory, with outputs next to the inputs."""
+        (code, lines) = self._run_report(self.dir)
+        self.assertEqual(0, code)
+        self.assertEqual(2, len(lines))
+        for (name, line) in zip(["checking.ofx", "savings.ofx"], lines):
+            path = os.path.join(self.dir, name)
+            self.assertEqual([path, "OFX/1.02", "0", path + ".xml"],
+                             [line[0], line[1], line[3], line[4]])
+        self.assertEqual(ofx_test_utils.get_checking_xml() + "\n",
+                         self._read("checking.ofx.xml"))
+    
+    def test_output_dir_structure(self):
+        """Test that the inputs' directories are recreated under the
+        output directory."""
+        os.mkdir(os.path.join(self.dir, "sub"))
+        os.rename(os.path.join(self.dir, "savings.ofx"),
+                  os.path.join(self.dir, "sub", "savings.ofx"))
+        output_dir = tempfile.mkdtemp()
+        try:
+            self.assertEqual(0, self._run("-o", output_dir, self.dir))
+            self.assertTrue(os.path.isfile(os.path.join(output_dir,
+                                                        "checking.ofx.xml")))
+            self.assertTrue(os.path.isfile(os.path.join(output_dir, "sub",
+                                                        "savings.ofx.xml")))
+        finally:
+            shutil.rmtree(output_dir)
+    
+    def test_manifest_and_glob(self):
+        manifest = os.path.join(self.dir, "manifest.txt")
+        listfile = open(manifest, "w")
+        listfile.write("# Comment\n\n%s\n" % os.path.join(self.dir, "savings.ofx"))
+        listfile.close()
+        (code, lines) = self._run_report("-m", manifest,
+                                         os.path.join(self.dir, "check*"))
+        self.assertEqual(0, code)
+        self.assertEqual([os.path.join(self.dir, "checking.ofx"),
+                          os.path.join(self.dir, "savings.ofx")],
+                         [line[0] for line in lines])
+    
+    def test_failure(self):
+        """Test that a bad file is reported, doesn't stop the others, and
+        makes the batch exit with code 6."""
+        bad = open(os.path.join(self.dir, "bad.ofx"), "w")
+        bad.write("This is not a statement.\n")
+        bad.close()
+        missing = os.path.join(self.dir, "missing.ofx")
+        (code, lines) = self._run_report(self.dir, missing)
+        self.assertEqual(6, code)
+        codes = dict([(line[0], line[3]) for line in lines])
+        self.assertEqual("0", codes[os.path.join(self.dir, "checking.ofx")])
+        self.assertEqual("0", codes[os.path.join(self.dir, "savings.ofx")])
+        self.assertNotEqual("0", codes[os.path.join(self.dir, "bad.ofx")])
+        self.assertEqual("2", codes[missing])
+    
+    def test_rerun_skips_outputs(self):
+        """Test that running a batch again doesn't convert its own
+        output from the last run."""
+        expected = ["checking.ofx", "checking.ofx.xml",
+                    "savings.ofx", "savings.ofx.xml"]
+        for run in range(2):
+            self.assertEqual(0, self._run(self.dir))
+            self.assertEqual(expected, self._files(self.dir))
+    
+    def test_rerun_skips_output_dir(self):
+        """Test the same with an output directory inside the inputs."""
+        output_dir = os.path.join(self.dir, "out")
+        expected = ["checking.ofx", os.path.join("out", "checking.ofx.xml"),
+                    os.path.join("out", "savings.ofx.xml"), "savings.ofx"]
+        for run in range(2):
+            self.assertEqual(0, self._run("-o", output_dir, self.dir))
+            self.assertEqual(expected, self._files(self.dir))
+    
+
+if __name__ == '__main__':
+    unittest.main()
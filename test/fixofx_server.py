@@ -0,0 +1,144 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import httplib
+import json
+import ofx_test_utils
+import ofxtools
+import os
+import shutil
+import signal
+import socket
+import subprocess
+import tempfile
+import time
+import unittest
+
+fixofx = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..",
+                      "fixofx.py")
+
+class UnixHTTPConnection(httplib.HTTPConnection):
+    """HTTP connection to a server listening on a Unix socket."""
+    def __init__(self, path):
+        httplib.HTTPConnection.__init__(self, "localhost")
+        self.path = path
+    
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(self.path)
+
+class ServerTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.socket_path = os.path.join(self.dir, "fixofx.sock")
+        self.server = subprocess.Popen([sys.executable, fixofx, "--serve",
+                                        self.socket_path, "-j", "1"],
+                                       stdout=subprocess.PIPE,
+                                       stderr=subprocess.PIPE)
+        # Wait for the server to start listening.
+        deadline = time.time() + 30
+        while True:
+            try:
+                connection = UnixHTTPConnection(self.socket_path)
+                connection.connect()
+                connection.close()
+                break
+            except socket.error:
+                if time.time() > deadline or self.server.poll() is not None:
+                    self._stop()
+                    self.fail("The server didn't start.")
+                time.sleep(0.05)
+        self.qif = ofx_test_utils.get_checking_qif()
+    
+    def tearDown(self):
+        if self.server is not None:
+            self._stop()
+    
+    def _stop(self):
+        """Stop the server, and return what it wrote to standard error."""
+        if self.server.poll() is None:
+            self.server.send_signal(signal.SIGTERM)
+        (output, errors) = self.server.communicate()
+        self.server = None
+        shutil.rmtree(self.dir)
+        return errors
+    
+    def _request(self, method, path, body=None):
+        connection = UnixHTTPConnection(self.socket_path)
+        try:
+            connection.request(method, path, body)
+            response = connection.getresponse()
+            return response, response.read()
+        finally:
+            connection.close()
+    
+    def test_convert_qif(self):
+        (response, body) = self._request("POST", "/convert", self.qif)
+        self.assertEqual(200, response.status)
+        self.assertEqual("0", response.getheader("X-Fixofx-Exit-Code"))
+        self.assertEqual("QIF", response.getheader("X-Fixofx-File-Type"))
+        self.assertEqual(ofxtools.QifConverter(self.qif).to_xml(), body)
+    
+    def test_query_options(self):
+        (response, body) = self._request("POST", "/convert?fid=1234&org=Test",
+                                         self.qif)
+        self.assertEqual(200, response.status)
+        self.assertEqual(ofxtools.QifConverter(self.qif, fid="1234",
+                                               org="Test").to_xml(), body)
+    
+    def test_empty_body(self):
+        (response, body) = self._request("POST", "/convert", "")
+        self.assertEqual(400, response.status)
+        self.assertEqual("3", response.getheader("X-Fixofx-Exit-Code"))
+        self.assertEqual("UNKNOWN", response.getheader("X-Fixofx-File-Type"))
+    
+    def test_not_found(self):
+        (response, body) = self._request("POST", "/other", self.qif)
+        self.assertEqual(404, response.status)
+        (response, body) = self._request("GET", "/other")
+        self.assertEqual(404, response.status)
+    
+    def test_stats(self):
+        self._request("POST", "/convert", self.qif)
+        self._request("POST", "/convert", self.qif)
+        self._request("POST", "/convert", "")
+        (response, body) = self._request("GET", "/stats")
+        self.assertEqual(200, response.status)
+        self.assertEqual("application/json", response.getheader("Content-Type"))
+        stats = json.loads(body)
+        self.assertEqual(3, stats["requests"])
+        self.assertEqual(1, stats["failures"])
+        latency = stats["latency_ms"]
+        self.assertEqual(["max", "p50", "p90", "p95", "p99"], sorted(latency.keys()))
+        self.assertTrue(0 <= latency["p50"] <= latency["p90"] <= latency["p95"]
+                        <= latency["p99"] <= latency["max"])
+        
+        # The counts are reported again when the server shuts down.
+        errors = self._stop()
+        self.assertTrue("Served 3 requests (1 failed)." in errors)
+        self.assertTrue("Latency (ms): p50 " in errors)
+    
+    def test_no_stats(self):
+        (response, body) = self._request("GET", "/stats")
+        stats = json.loads(body)
+        self.assertEqual(0, stats["requests"])
+        self.assertEqual({}, stats["latency_ms"])
+    
+
+if __name__ == '__main__':
+    unittest.main()
@@ -22,23 +22,63 @@ sys.path.insert(0, '../lib')
 
 import ofx_test_utils
 
+import datetime
+import re
+import threading
+import time
 import urllib2
 from wsgi_intercept.urllib2_intercept import install_opener
 import wsgi_intercept
 
+# Requests for this account number get an "Account not found" error.
+BAD_ACCOUNT = "0000000000"
+
 class MockOfxServer:
-    def __init__(self, port=9876):
+    def __init__(self, port=9876, delay=0, max_days=None):
         install_opener()
         wsgi_intercept.add_wsgi_intercept('localhost', port, self.interceptor)
+        self.delay      = delay
+        self.max_days   = max_days
+        self.lock       = threading.Lock()
+        self.active     = 0
+        self.max_active = 0
+        self.requests   = 0
     
     def handleResponse(self, environment, start_response):
+        self.lock.acquire()
+        self.active    += 1
+        self.requests  += 1
+        self.max_active = max(self.max_active, self.active)
+        self.lock.release()
+        try:
+            if self.delay:
+                time.sleep(self.delay)
+            return self._respond(environment, start_response)
+        finally:
+            self.lock.acquire()
+            self.active -= 1
+            self.lock.release()
+    
+    def _respond(self, environment, start_response):
+        body = self._body(environment)
         status  = "200 OK"
-        headers = [('Content-Type', 'application/ofx')]
+        headers = [('Content-Type', 'application/ofx'),
+                   ('Content-Length', str(len(body))),
+                   ('Connection', 'keep-alive')]
         start_response(status, headers)
+        return body
+    
+    def _body(self, environment):
         if environment.has_key("wsgi.input"):
             request_body = environment["wsgi.input"].read()
             
-            if request_body.find("<ACCTTYPE>CHECKING") != -1:
+            if request_body.find("<PROFRQ>") != -1:
+                return self._profile(request_body)
+            elif request_body.find("<ACCTID>" + BAD_ACCOUNT) != -1:
+                return self._stmt_error("2003")
+            elif self._too_long(request_body):
+                return self._stmt_error("2000")
+            elif request_body.find("<ACCTTYPE>CHECKING") != -1:
                 return ofx_test_utils.get_checking_stmt()
             elif request_body.find("<ACCTTYPE>SAVINGS") != -1:
                 return ofx_test_utils.get_savings_stmt()
@@ -47,9 +87,58 @@ class MockOfxServer:
         else:
             return ofx_test_utils.get_creditcard_stmt()
     
+    def _stmt_error(self, code):
+        # Fail the statement request, but not the signon.
+        stmt = ofx_test_utils.get_checking_stmt()
+        signon_end = stmt.index("</SONRS>")
+        return stmt[:signon_end] + \
+               stmt[signon_end:].replace("<CODE>0", "<CODE>" + code, 1)
+    
+    def _profile(self, request_body):
+        # Answer "up to date" if the client has the current profile.
+        profile = ofx_test_utils.get_profile()
+        sent    = re.search(r"<DTPROFUP>(\d{8})", request_body).group(1)
+        current = re.search(r"<DTPROFUP>(\d{8})", profile).group(1)
+        if sent < current:
+            return profile
+        signon_end = profile.index("</SONRS>")
+        profile = profile[:signon_end] + \
+                  profile[signon_end:].replace("<CODE>0", "<CODE>1", 1)
+        return profile[:profile.index("<PROFRS>")] + \
+               "</PROFTRNRS>\n</PROFMSGSRSV1>\n</OFX>\n"
+    
+    def _too_long(self, request_body):
+        # True if the request asks for more than 'max_days' of history.
+        match = re.search(r"<DTSTART>(\d{8})", request_body)
+        if self.max_days is None or match is None:
+            return False
+        dtstart = datetime.datetime.strptime(match.group(1), "%Y%m%d")
+        return datetime.datetime.now() - dtstart > \
+               datetime.timedelta(days=self.max_days + 1)
+    
     def interceptor(self):
         return self.handleResponse
 
+class KeepAliveConnection(wsgi_intercept.WSGI_HTTPConnection):
+    """An intercepted connection that, like a keep-alive connection to a
+    real server, can carry more than one request.  'connects' counts the
+    connections opened, across all instances."""
+    connects = 0
+    
+    def connect(self):
+        KeepAliveConnection.connects += 1
+        wsgi_intercept.WSGI_HTTPConnection.connect(self)
+    
+    def putrequest(self, *args, **kwargs):
+        # A wsgi_fake_socket only handles one request, so give each new
+        # request a fresh one without counting a new connection.
+        sock = self.sock
+        if isinstance(sock, wsgi_intercept.wsgi_fake_socket):
+            self.sock = wsgi_intercept.wsgi_fake_socket(sock.app, sock.host,
+                                                        sock.port,
+                                                        sock.script_name)
+        wsgi_intercept.WSGI_HTTPConnection.putrequest(self, *args, **kwargs)
+
 import unittest
 
 class MockOfxServerTest(unittest.TestCase):
@@ -110,6 +110,46 @@ class BuilderTests(unittest.TestCase):
         
         controlquery = "OFXHEADER:100\r\nDATA:OFXSGML\r\nVERSION:102\r\nSECURITY:NONE\r\nENCODING:USASCII\r\nCHARSET:1252\r\nCOMPRESSION:NONE\r\nOLDFILEUID:NONE\r\nNEWFILEUID:9B33CA3E-C237-4577-8F00-7AFB0B827B5E\r\n\r\n<OFX>\r\n<SIGNONMSGSRQV1>\r\n<SONRQ>\r\n<DTCLIENT>20060221150810\r\n<USERID>username\r\n<USERPASS>userpass\r\n<LANGUAGE>ENG\r\n<FI>\r\n<ORG>FAKEOFX\r\n<FID>1000\r\n</FI>\r\n<APPID>MONEY\r\n<APPVER>1200\r\n</SONRQ>\r\n</SIGNONMSGSRQV1>\r\n<BANKMSGSRQV1>\r\n<STMTTRNRQ>\r\n<TRNUID>9B33CA3E-C237-4577-8F00-7AFB0B827B5E\r\n<CLTCOOKIE>4\r\n<STMTRQ>\r\n<BANKACCTFROM>\r\n<BANKID>2000\r\n<ACCTID>12345678\r\n<ACCTTYPE>CHECKING\r\n</BANKACCTFROM>\r\n<INCTRAN>\r\n<DTSTART>20060221150810\r\n<INCLUDE>Y\r\n</INCTRAN>\r\n</STMTRQ>\r\n</STMTTRNRQ>\r\n</BANKMSGSRQV1>\r\n</OFX>"
         self.assertEqual(testquery, controlquery)
+    
+    def test_fragments_match_strings(self):
+        """Test that documents built from fragments come out the same."""
+        def build():
+            txns = ""
+            for i in range(1000):
+                txns += STMTTRN(TRNTYPE("DEBIT"), TRNAMT("-%d.00" % i))
+            return DOCUMENT(
+                HEADER(OFXHEADER("100"), DATA("OFXSGML")),
+                OFX(BANKMSGSRSV1(BANKTRANLIST(DTSTART("20060101"), txns))))
+        text = build()
+        with Fragments():
+            fragment = build()
+        self.assertTrue(isinstance(fragment, Fragment))
+        self.assertEqual(str(fragment), text)
+        pieces = []
+        fragment.write(pieces.append)
+        self.assertEqual("".join(pieces), text)
+    
+    def test_fragments_small_aggregate(self):
+        """Test that small aggregates are still strings in fragment mode."""
+        with Fragments():
+            txn = STMTTRN(TRNAMT("1.00"))
+        self.assertEqual("<STMTTRN>\r\n<TRNAMT>1.00\r\n</STMTTRN>\r\n", txn)
+        self.assertTrue(isinstance(txn, str))
+    
+    def test_fragments_nested_blocks(self):
+        """Test that leaving a nested block keeps the outer one going."""
+        with Fragments():
+            with Fragments():
+                pass
+            self.assertTrue(isinstance(STMTTRN("x" * 5000), Fragment))
+        self.assertTrue(isinstance(STMTTRN("x" * 5000), str))
+    
+    def test_fragment_addition(self):
+        """Test adding fragments to strings and to each other."""
+        with Fragments():
+            big = STMTTRN("x" * 5000)
+        self.assertEqual("a" + big + big + "b",
+                         "a" + str(big) + str(big) + "b")
 
 if __name__ == '__main__':
     unittest.main()
@@ -18,8 +18,13 @@ sys.path.insert(0, '../lib')
 
 import ofx_test_utils
 import ofx
-from mock_ofx_server import MockOfxServer
+from mock_ofx_server import MockOfxServer, KeepAliveConnection
 
+import os
+import shutil
+import socket
+import tempfile
+import time
 import unittest
 
 class ClientTests(unittest.TestCase):
@@ -83,6 +88,202 @@ class ClientTests(unittest.TestCase):
                                                         self.password)
         self.assertEqual(creditcard_response.as_string(), self.creditcard_stmt)
     
+    def test_get_statements(self):
+        bad_account = ofx.Account(acct_number="0000000000",
+                                  aba_number="12345678",
+                                  acct_type="Checking",
+                                  institution=self.institution)
+        accounts = [self.checking_account, bad_account, self.savings_account,
+                    self.creditcard_account]
+        jobs = [(account, self.username, self.password) for account in accounts]
+        results = self.client.get_statements(jobs)
+        
+        self.assertEqual([account for (account, response, error) in results],
+                         accounts)
+        (account, response, error) = results[0]
+        self.assertEqual(response.as_string(), self.checking_stmt)
+        self.assertEqual(error, None)
+        (account, response, error) = results[1]
+        self.assertEqual(response, None)
+        self.assertTrue(isinstance(error, ofx.Error))
+        self.assertEqual(error.code, 2003)
+        self.assertEqual(results[2][1].as_string(), self.savings_stmt)
+        self.assertEqual(results[3][1].as_string(), self.creditcard_stmt)
+    
+    def test_get_statements_request_message(self):
+        """Test that get_statements' threads don't change the request
+        message the calling thread sees."""
+        self.client.get_account_info(self.institution, self.username,
+                                     self.password)
+        request_msg = self.client.get_request_message()
+        jobs = [(self.checking_account, self.username, self.password),
+                (self.savings_account, self.username, self.password)]
+        self.client.get_statements(jobs)
+        self.assertEqual(request_msg, self.client.get_request_message())
+        self.assertEqual(request_msg, self.client.request_msg)
+    
+    def test_get_statements_per_institution(self):
+        other_port = self.port + 1
+        other_server = MockOfxServer(port=other_port, delay=0.02)
+        self.server.delay = 0.02
+        other_institution = ofx.Institution(ofx_org="Other Bank",
+                                            ofx_fid="88888",
+                                            ofx_url="http://localhost:%d/" % other_port)
+        jobs = []
+        for i in range(6):
+            for institution in (self.institution, other_institution):
+                account = ofx.Account(acct_number="1122334455",
+                                      aba_number="12345678",
+                                      acct_type="Checking",
+                                      institution=institution)
+                jobs.append((account, self.username, self.password))
+        
+        results = self.client.get_statements(jobs, threads=8, per_institution=2)
+        self.assertEqual(len(results), 12)
+        for (account, response, error) in results:
+            self.assertEqual(error, None)
+        self.assertEqual(self.server.requests, 6)
+        self.assertEqual(other_server.requests, 6)
+        self.assertTrue(self.server.max_active <= 2)
+        self.assertTrue(other_server.max_active <= 2)
+    
+    def _pooled_client(self, **params):
+        KeepAliveConnection.connects = 0
+        pool = ofx.ConnectionPool(connection_classes={ "http" : KeepAliveConnection },
+                                  **params)
+        return ofx.Client(pool=pool), pool
+    
+    def test_pool_reuses_connection(self):
+        client, pool = self._pooled_client()
+        bad_account = ofx.Account(acct_number="0000000000",
+                                  aba_number="12345678",
+                                  acct_type="Checking",
+                                  institution=self.institution)
+        response = client.get_bank_statement(self.checking_account,
+                                             self.username, self.password)
+        self.assertEqual(response.as_string(), self.checking_stmt)
+        # All three steps of the 365/90/30-day retry ladder fail.
+        self.assertRaises(ofx.Error, client.get_bank_statement, bad_account,
+                          self.username, self.password)
+        
+        self.assertEqual(self.server.requests, 4)
+        self.assertEqual(KeepAliveConnection.connects, 1)
+        stats = pool.stats()
+        self.assertEqual(stats["requests"], 4)
+        self.assertEqual(stats["created"], 1)
+        self.assertEqual(stats["reused"], 3)
+        self.assertEqual(stats["idle"], 1)
+        self.assertEqual(stats["reuse_rate"], 0.75)
+    
+    def test_pool_idle_timeout(self):
+        client, pool = self._pooled_client(idle_timeout=0)
+        client.get_statement(self.checking_account, self.username, self.password)
+        time.sleep(0.01)
+        client.get_statement(self.savings_account, self.username, self.password)
+        self.assertEqual(KeepAliveConnection.connects, 2)
+        self.assertEqual(pool.stats()["expired"], 1)
+        self.assertEqual(pool.stats()["reused"], 0)
+    
+    def test_pool_stale_connection(self):
+        class ClosedSocket:
+            def sendall(self, data):
+                raise socket.error(32, "Broken pipe")
+            def close(self):
+                pass
+        
+        client, pool = self._pooled_client()
+        client.get_statement(self.checking_account, self.username, self.password)
+        pool.idle[self.mockurl][0][0].sock = ClosedSocket()
+        response = client.get_statement(self.savings_account,
+                                        self.username, self.password)
+        self.assertEqual(response.as_string(), self.savings_stmt)
+        stats = pool.stats()
+        self.assertEqual(stats["created"], 2)
+        self.assertEqual(stats["retried"], 1)
+        self.assertEqual(stats["discarded"], 1)
+    
+    def test_date_range_cache(self):
+        self.server.max_days = 90
+        temp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(temp_dir, "ranges.json")
+            ranges = ofx.DateRangeCache(path)
+            client = ofx.Client(ranges=ranges)
+            
+            # The first fetch learns that 365 days is too long.
+            response = client.get_bank_statement(self.checking_account,
+                                                 self.username, self.password)
+            self.assertEqual(response.as_string(), self.checking_stmt)
+            self.assertEqual(self.server.requests, 2)
+            
+            client.get_bank_statement(self.checking_account,
+                                      self.username, self.password)
+            self.assertEqual(self.server.requests, 3)
+            self.assertEqual(ranges.stats(),
+                             { "hits" : 1, "probes" : 1, "size" : 1 })
+            
+            # Credit card statements are learned separately.
+            client.get_creditcard_statement(self.creditcard_account,
+                                            self.username, self.password)
+            self.assertEqual(self.server.requests, 5)
+            
+            # The learned ranges survive in the cache file.
+            ranges = ofx.DateRangeCache(path)
+            self.assertEqual(ranges.start(self.institution, "bank"), 90)
+            
+            # Once it's time to re-probe, the client tries 365 days again.
+            ranges.reprobe_interval = 0
+            self.server.max_days = None
+            client = ofx.Client(ranges=ranges)
+            client.get_bank_statement(self.checking_account,
+                                      self.username, self.password)
+            self.assertEqual(self.server.requests, 6)
+            self.assertEqual(ofx.DateRangeCache(path).start(self.institution,
+                                                            "bank"), 365)
+        finally:
+            shutil.rmtree(temp_dir)
+    
+    def test_profile_cache(self):
+        temp_dir = tempfile.mkdtemp()
+        try:
+            profiles = ofx.ProfileCache(temp_dir)
+            client = ofx.Client(profiles=profiles)
+            
+            profile = client.get_fi_profile(self.institution)
+            self.assertEqual(profile.as_string(), ofx_test_utils.get_profile())
+            self.assertTrue("<DTPROFUP>19980101" in client.get_request_message())
+            
+            # The second request sends the profile's DTPROFUP, and gets
+            # back the same parsed response.
+            self.assertTrue(client.get_fi_profile(self.institution) is profile)
+            self.assertTrue("<DTPROFUP>20100601" in client.get_request_message())
+            self.assertEqual(profiles.stats(),
+                             { "hits" : 1, "misses" : 1, "size" : 1 })
+            
+            # A new cache reads the profile back from disk.
+            client = ofx.Client(profiles=ofx.ProfileCache(temp_dir))
+            cached = client.get_fi_profile(self.institution)
+            self.assertEqual(cached.as_string(), ofx_test_utils.get_profile())
+            self.assertTrue("<DTPROFUP>20100601" in client.get_request_message())
+            
+            # An expired profile is downloaded again in full.
+            client = ofx.Client(profiles=ofx.ProfileCache(temp_dir, max_age=-1))
+            client.get_fi_profile(self.institution)
+            self.assertTrue("<DTPROFUP>19980101" in client.get_request_message())
+            
+            # If the saved profile can't be parsed, the server's "up to
+            # date" answer is no use, so the full profile is requested.
+            for name in os.listdir(temp_dir):
+                open(os.path.join(temp_dir, name), "w").write(
+                    "<DTPROFUP>20100601\n")
+            profiles = ofx.ProfileCache(temp_dir)
+            client = ofx.Client(profiles=profiles)
+            profile = client.get_fi_profile(self.institution)
+            self.assertEqual(profile.as_string(), ofx_test_utils.get_profile())
+            self.assertTrue("<DTPROFUP>19980101" in client.get_request_message())
+            self.assertTrue(profiles.response(self.institution) is profile)
+        finally:
+            shutil.rmtree(temp_dir)
 
 if __name__ == '__main__':
     unittest.main()
@@ -20,6 +20,7 @@ import ofx
 import ofx_test_utils
 
 import unittest
+from StringIO import StringIO
 
 class DocumentTests(unittest.TestCase):
     def setUp(self):
@@ -29,6 +30,42 @@ class DocumentTests(unittest.TestCase):
         response = ofx.Response(self.checking)
         self.assertEqual('<?xml version="1.0"', response.as_xml()[:19])
     
+    def test_as_xml_regression(self):
+        """Test that output matches a copy saved from the original
+        recursive formatter."""
+        response = ofx.Response(self.checking)
+        self.assertEqual(ofx_test_utils.get_checking_xml(),
+                         response.as_xml(original_format="OFX/1.02"))
+    
+    def test_pyparsing_as_xml(self):
+        """Test that output from a pyparsing parse is the same."""
+        response = ofx.Response(self.checking)
+        response.parse_dict = ofx.Parser(engine="pyparsing").parse(self.checking)
+        self.assertEqual(ofx_test_utils.get_checking_xml(),
+                         response.as_xml(original_format="OFX/1.02"))
+    
+    def test_write_xml(self):
+        """Test writing to a stream gives the same output as as_xml."""
+        response = ofx.Response(self.checking)
+        stream = StringIO()
+        response.write_xml(stream, original_format="OFX/1.02")
+        self.assertEqual(ofx_test_utils.get_checking_xml(), stream.getvalue())
+    
+    def test_as_xml_stream(self):
+        """Test that as_xml writes to a stream when given one."""
+        response = ofx.Response(self.checking)
+        stream = StringIO()
+        self.assertEqual(None, response.as_xml(original_format="OFX/1.02",
+                                               stream=stream))
+        self.assertEqual(ofx_test_utils.get_checking_xml(), stream.getvalue())
+    
+    def test_as_xml_repeatable(self):
+        """Test that formatting doesn't consume the parse tree."""
+        response = ofx.Response(self.checking)
+        self.assertEqual(response.as_xml(), response.as_xml())
+        statement = response.get_statements()[0]
+        self.assertEqual(statement.as_xml(), statement.as_xml())
+    
 
 if __name__ == '__main__':
     unittest.main()
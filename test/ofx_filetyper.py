@@ -0,0 +1,102 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import mmap
+import ofx
+import ofx_test_utils
+import os
+import tempfile
+import unittest
+from StringIO import StringIO
+
+class FileTyperTests(unittest.TestCase):
+    def setUp(self):
+        self.checking = ofx_test_utils.get_checking_stmt()
+        self.qif = "!Type:Bank\nD01/13/2005\nT-12.50\n^\n"
+        self.csv = "Date,Payee,Amount\n" + \
+            "".join(['01/%02d/2005,"Shop, Inc.",-%d.50\n' % (day % 28 + 1, day)
+                     for day in range(5000)])
+    
+    def test_types(self):
+        self.assertEqual(ofx.FileTyper(self.checking).trust(), "OFX/1.02")
+        self.assertEqual(ofx.FileTyper(self.qif).trust(), "QIF")
+        self.assertEqual(ofx.FileTyper(self.csv).trust(), "CSV")
+        self.assertEqual(ofx.FileTyper(self.csv.replace(",", "\t")).trust(), 
+                         "TSV")
+    
+    def test_prefix(self):
+        typer = ofx.FileTyper(self.csv, prefix_size=1024, sample_lines=10)
+        self.assertTrue(len(typer.text) <= 1024)
+        self.assertTrue(typer.text.endswith("\n"))
+        self.assertEqual(len(typer.samples), 10)
+        self.assertEqual(typer.trust(), "CSV")
+    
+    def test_samples_count(self):
+        # Sampled lines count toward the CSV field frequencies.
+        text = "a,b,c\n1,2,3\n4,5,6\n7,8,9\n" + "x,y\n" * 1000
+        self.assertEqual(ofx.FileTyper(text).trust(), "UNKNOWN")
+        self.assertEqual(ofx.FileTyper(text, prefix_size=24).trust(), "UNKNOWN")
+        self.assertEqual(ofx.FileTyper(text[:24]).trust(), "CSV")
+    
+    def test_small_source(self):
+        typer = ofx.FileTyper(self.qif)
+        self.assertEqual(typer.text, self.qif)
+        self.assertEqual(typer.samples, [])
+    
+    def test_file_object(self):
+        source = StringIO(self.csv)
+        self.assertEqual(ofx.FileTyper(source, prefix_size=1024).trust(), "CSV")
+        self.assertEqual(source.tell(), 0)
+        self.assertEqual(source.read(), self.csv)
+    
+    def test_file_object_mid_stream(self):
+        """Test typing a file object from the position it's at."""
+        head = "x,y\n" * 2000
+        source = StringIO(head + self.csv)
+        source.seek(len(head))
+        typer = ofx.FileTyper(source, prefix_size=1024, sample_lines=10)
+        expected = ofx.FileTyper(self.csv, prefix_size=1024, sample_lines=10)
+        self.assertEqual(typer.text, expected.text)
+        self.assertEqual(typer.samples, expected.samples)
+        self.assertEqual(typer.trust(), "CSV")
+        self.assertEqual(source.tell(), len(head))
+        
+        # What's left is shorter than the prefix, so it's all examined.
+        source = StringIO(self.csv + self.qif)
+        source.seek(len(self.csv))
+        typer = ofx.FileTyper(source)
+        self.assertEqual(typer.text, self.qif)
+        self.assertEqual(typer.samples, [])
+        self.assertEqual(typer.trust(), "QIF")
+    
+    def test_mmap(self):
+        (fd, path) = tempfile.mkstemp()
+        try:
+            os.write(fd, self.checking)
+            mapped = mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+            self.assertEqual(ofx.FileTyper(mapped, prefix_size=4096).trust(), 
+                             "OFX/1.02")
+            self.assertEqual(mapped.tell(), 0)
+            mapped.close()
+        finally:
+            os.close(fd)
+            os.remove(path)
+    
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofx
+import random
+import StringIO
+import unittest
+
+class StreamGeneratorTests(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(0)
+        self.txns = []
+        for i in range(200):
+            self.txns.append({ "date"   : "2010%02d%02d" % (rand.randint(1, 2),
+                                                         rand.randint(1, 28)),
+                               "amount" : "%.2f" % rand.uniform(-100, 100),
+                               "payee"  : "Payee %d" % i,
+                               "memo"   : rand.choice([None, "memo"]) })
+        self.params = { "fid" : "1000", "org" : "FAKEOFX",
+                        "stmtdate" : "20100301" }
+    
+    def _expected(self):
+        generator = ofx.Generator(**self.params)
+        for txn in self.txns:
+            generator.add_transaction(**txn)
+        return generator.to_ofx1()
+    
+    def test_presorted(self):
+        stream = StringIO.StringIO()
+        generator = ofx.StreamGenerator(stream, **self.params)
+        # A stable sort, most recent date first, is the statement's order.
+        for txn in sorted(self.txns, key=lambda txn: txn["date"], reverse=True):
+            generator.add_transaction(**txn)
+        generator.close()
+        self.assertEqual(stream.getvalue(), self._expected())
+    
+    def test_unsorted(self):
+        stream = StringIO.StringIO()
+        generator = ofx.StreamGenerator(stream, presorted=False,
+                                        chunk_size=30, **self.params)
+        for txn in self.txns:
+            generator.add_transaction(**txn)
+        generator.close()
+        self.assertEqual(stream.getvalue(), self._expected())
+    
+    def test_out_of_order(self):
+        generator = ofx.StreamGenerator(StringIO.StringIO(), **self.params)
+        generator.add_transaction(date="20100101", amount="1.00")
+        self.assertRaises(ValueError, generator.add_transaction,
+                          date="20100102", amount="1.00")
+    
+    def test_no_txns(self):
+        stream = StringIO.StringIO()
+        generator = ofx.StreamGenerator(stream, **self.params)
+        generator.close()
+        response = ofx.Response(stream.getvalue())
+        statement = response.get_statements()[0]
+        self.assertEqual(statement.get_begin_date(), "20100301")
+        self.assertEqual(statement.get_end_date(), "20100301")
+    
+    def test_no_to_ofx1(self):
+        """Test that StreamGenerator doesn't offer Generator's in-memory
+        output, which it can't give, and still converts to a string."""
+        generator = ofx.StreamGenerator(StringIO.StringIO(), **self.params)
+        self.assertFalse(hasattr(generator, "to_ofx1"))
+        self.assertFalse(hasattr(generator, "to_str"))
+        self.assertTrue(str(generator).startswith("<ofx.generator.StreamGenerator"))
+        self.assertTrue(isinstance(ofx.Generator(**self.params), ofx.Generator))
+
+if __name__ == '__main__':
+    unittest.main()
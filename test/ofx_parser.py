@@ -21,6 +21,7 @@ import ofx_test_utils
 
 import os
 import unittest
+from pyparsing import ParseException
 
 class ParserTests(unittest.TestCase):
     def setUp(self):
@@ -44,6 +45,71 @@ class ParserTests(unittest.TestCase):
         """Test reading a header from the OFX document."""
         self.assertEqual("100", self.checkparse["header"]["OFXHEADER"])
     
+    def test_engines_agree(self):
+        """Test that the tokenizer and the pyparsing grammar produce the
+        same tree for each of the fixture statements."""
+        sgml = ofx.Parser(engine="sgml")
+        pyparsing = ofx.Parser(engine="pyparsing")
+        for stmt in [ofx_test_utils.get_checking_stmt(),
+                     ofx_test_utils.get_savings_stmt(),
+                     ofx_test_utils.get_creditcard_stmt()]:
+            expected = pyparsing.parse(stmt)
+            actual = sgml.parse(stmt)
+            self.assertEqual(expected["body"]["OFX"].asList(),
+                             actual["body"]["OFX"].asList())
+            self.assertEqual(expected["header"].asDict(), actual["header"])
+    
+    def test_unknown_engine(self):
+        """Test that asking for an unknown engine fails loudly."""
+        self.assertRaises(ValueError, ofx.Parser, engine="fnargle")
+    
+    def test_grammar_shared(self):
+        """Test that pyparsing parsers share one grammar per debug flag."""
+        first = ofx.Parser(engine="pyparsing")
+        second = ofx.Parser(engine="pyparsing")
+        self.assertTrue(first.parser is second.parser)
+        debug = ofx.Parser(debug=True, engine="pyparsing")
+        self.assertFalse(first.parser is debug.parser)
+    
+    def test_close_tags(self):
+        """Test that optional close tags on content tags are accepted."""
+        stmt = ofx_test_utils.get_checking_stmt().replace(
+            "<CODE>0\n", "<CODE>0</CODE>\n")
+        parse = ofx.Parser().parse(stmt)
+        self.assertEqual("0",
+            parse["body"]["OFX"]["SIGNONMSGSRSV1"]["SONRS"]["STATUS"]["CODE"])
+    
+    def test_empty_tags(self):
+        """Test that an open/close tag pair with no content is dropped."""
+        stmt = ofx_test_utils.get_checking_stmt().replace(
+            "<CODE>0\n", "<CODE>0\n<MEMO></MEMO>\n")
+        parse = ofx.Parser().parse(stmt)
+        status = parse["body"]["OFX"]["SIGNONMSGSRSV1"]["SONRS"]["STATUS"]
+        self.assertEqual(["CODE", "SEVERITY", "MESSAGE"],
+                         [child[0] for child in status])
+    
+    def test_blank_dtasof(self):
+        """Test that a blank DTASOF does not swallow the tags after it."""
+        stmt = ofx_test_utils.get_checking_stmt().replace(
+            "<DTASOF>20100723\n", "<DTASOF>\n")
+        parse = ofx.Parser().parse(stmt)
+        stmtrs = parse["body"]["OFX"]["BANKMSGSRSV1"]["STMTTRNRS"]["STMTRS"]
+        self.assertEqual(["BALAMT"], stmtrs["LEDGERBAL"].keys())
+        self.assertEqual(["BALAMT"], stmtrs["AVAILBAL"].keys())
+    
+    def test_unknown_account_type(self):
+        """Test that a blank ACCTTYPE is filled in as UNKNOWN."""
+        stmt = ofx_test_utils.get_checking_stmt().replace(
+            "<ACCTTYPE>CHECKING\n", "<ACCTTYPE>\n")
+        parse = ofx.Parser().parse(stmt)
+        acctfrom = parse["body"]["OFX"]["BANKMSGSRSV1"]["STMTTRNRS"]["STMTRS"]["BANKACCTFROM"]
+        self.assertEqual("UNKNOWN", acctfrom["ACCTTYPE"])
+    
+    def test_no_body(self):
+        """Test that a document without a body raises a ParseException."""
+        self.assertRaises(ParseException, ofx.Parser().parse,
+                          "OFXHEADER:100\nDATA:OFXSGML\n")
+    
 
 if __name__ == '__main__':
     unittest.main()
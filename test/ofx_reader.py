@@ -0,0 +1,106 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofx
+import ofx_test_utils
+
+import mmap
+import tempfile
+import unittest
+from StringIO import StringIO
+
+class ReaderTests(unittest.TestCase):
+    def setUp(self):
+        self.checking = ofx_test_utils.get_checking_stmt()
+    
+    def _tree(self, events):
+        """Rebuild a nested list like Node.asList() from reader events."""
+        stack = [[]]
+        for event, tag, value in events:
+            if event == "start":
+                stack.append([tag])
+            elif event == "content":
+                stack[-1].append([tag, value])
+            else:
+                done = stack.pop()
+                stack[-1].append(done)
+        return stack[0][0]
+    
+    def test_matches_parser(self):
+        """Test that the events describe the same tree the parser builds."""
+        for stmt in [ofx_test_utils.get_checking_stmt(),
+                     ofx_test_utils.get_savings_stmt(),
+                     ofx_test_utils.get_creditcard_stmt()]:
+            expected = ofx.Parser().parse(stmt)
+            reader = ofx.Reader(StringIO(stmt))
+            self.assertEqual(expected["body"]["OFX"].asList(),
+                             self._tree(reader.events()))
+            self.assertEqual(expected["header"], reader.headers)
+    
+    def test_small_chunks(self):
+        """Test that tags and values split across chunks are reassembled."""
+        whole = list(ofx.Reader(StringIO(self.checking)).events())
+        for size in [1, 7, 64]:
+            reader = ofx.Reader(StringIO(self.checking), chunk_size=size)
+            self.assertEqual(whole, list(reader.events()))
+    
+    def test_transactions(self):
+        """Test reading each transaction as a dictionary."""
+        txns = list(ofx.Reader(StringIO(self.checking)).transactions())
+        self.assertEqual(self.checking.count("<STMTTRN>"), len(txns))
+        self.assertEqual("Payroll", txns[-1]["NAME"])
+        self.assertEqual("1961.54", txns[-1]["TRNAMT"])
+    
+    def test_blank_dtasof(self):
+        """Test that a blank DTASOF does not swallow the tags after it."""
+        stmt = self.checking.replace("<DTASOF>20100723\n", "<DTASOF>\n")
+        ledgerbal = list(ofx.Reader(StringIO(stmt)).aggregates("LEDGERBAL"))
+        self.assertEqual([{ "BALAMT" : "1129.49" }], ledgerbal)
+    
+    def test_unknown_account_type(self):
+        """Test that a blank ACCTTYPE is filled in as UNKNOWN."""
+        stmt = self.checking.replace("<ACCTTYPE>CHECKING\n", "<ACCTTYPE>\n")
+        acctfrom = list(ofx.Reader(StringIO(stmt)).aggregates("BANKACCTFROM"))
+        self.assertEqual("UNKNOWN", acctfrom[0]["ACCTTYPE"])
+    
+    def test_as_xml(self):
+        """Test that the streamed XML matches what Response writes."""
+        for stmt in [ofx_test_utils.get_checking_stmt(),
+                     ofx_test_utils.get_savings_stmt(),
+                     ofx_test_utils.get_creditcard_stmt()]:
+            expected = ofx.Response(stmt).as_xml(original_format="OFX/1.02")
+            reader = ofx.Reader(StringIO(stmt), chunk_size=7,
+                                rules=ofx.Response.rules)
+            self.assertEqual(expected, reader.as_xml(original_format="OFX/1.02"))
+    
+    def test_mmap(self):
+        """Test reading from a memory-mapped file."""
+        source = tempfile.TemporaryFile()
+        source.write(self.checking)
+        source.flush()
+        mapped = mmap.mmap(source.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self.assertEqual(ofx.Reader(StringIO(self.checking)).as_xml(),
+                             ofx.Reader(mapped).as_xml())
+        finally:
+            mapped.close()
+            source.close()
+    
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofx
+import ofx_test_utils
+import unittest
+
+class RuleSetTests(unittest.TestCase):
+    def setUp(self):
+        self.rules = ofx.RuleSet([
+            ofx.Rule("banner", "BANNER\n", literal=True),
+            ofx.Rule("blank_name", r"<NAME>[\r\n]+")])
+    
+    def test_apply(self):
+        text = "BANNER\n<NAME>\n<MEMO>x\n<NAME>\n"
+        self.assertEqual(self.rules.apply(text), "<MEMO>x\n")
+        stats = self.rules.stats()
+        self.assertEqual(stats["banner"]["hits"], 1)
+        self.assertEqual(stats["blank_name"]["hits"], 2)
+        self.assertEqual(stats["blank_name"]["fired"], 1)
+    
+    def test_unchanged(self):
+        text = "<NAME>Coffee\n"
+        self.assertTrue(self.rules.apply(text) is text)
+        stats = self.rules.stats()
+        self.assertEqual(stats["banner"],
+                         { "runs" : 1, "triggered" : 0, "fired" : 0,
+                           "hits" : 0, "seconds" : stats["banner"]["seconds"] })
+        self.assertEqual(stats["blank_name"]["triggered"], 1)
+    
+    def test_trigger(self):
+        calls = []
+        def rewrite(text):
+            calls.append(text)
+            return text.upper(), 1
+        self.rules.add(ofx.Rule("shout", function=rewrite,
+                                trigger=lambda text: "<ACME>" in text))
+        self.assertEqual(self.rules.apply("<NAME>x\n"), "<NAME>x\n")
+        self.assertEqual(calls, [])
+        self.assertEqual(self.rules.apply("<ACME>x\n"), "<ACME>X\n")
+        self.assertEqual(self.rules.stats()["shout"]["triggered"], 1)
+    
+    def test_institutions(self):
+        self.rules.add(ofx.Rule("acme_only", "<MEMO>", "<NAME>",
+                                literal=True, institutions=["1234"]))
+        text = "<FI>\n<FID>1234\n</FI>\n<MEMO>x\n"
+        self.assertEqual(self.rules.apply(text), text.replace("MEMO", "NAME"))
+        self.assertEqual(self.rules.apply(text.replace("1234", "9999")),
+                         text.replace("1234", "9999"))
+        self.assertEqual(self.rules.apply("<MEMO>x\n", fid="1234"), "<NAME>x\n")
+        self.assertEqual(self.rules.stats()["acme_only"]["runs"], 2)
+    
+    def test_registry(self):
+        self.assertTrue(ofx.rules.registry["response"] is ofx.Response.rules)
+        self.assertTrue("parser.sgml" in ofx.rule_stats())
+    
+    def test_order(self):
+        self.rules.add(ofx.Rule("name_first", "<NAME>\n", "<NAME>X\n",
+                                literal=True), before="blank_name")
+        self.assertEqual(self.rules.names(),
+                         ["banner", "name_first", "blank_name"])
+        self.assertEqual(self.rules.apply("<NAME>\n"), "<NAME>X\n")
+        self.rules.remove("name_first")
+        self.assertEqual(self.rules.apply("<NAME>\n"), "")
+    
+    def test_response_rules(self):
+        ofx.Response.rules.clear_stats()
+        checking = ofx_test_utils.get_checking_stmt()
+        junk = checking.replace("<OFX>", "Content-Type: application/x-ofx<OFX>")
+        response = ofx.Response(junk)
+        self.assertEqual(response.as_string(), checking)
+        stats = ofx.Response.rules.stats()
+        self.assertEqual(stats["x_ofx_content_type"]["hits"], 1)
+        self.assertEqual(stats["boa_content_type"]["runs"], 1)
+        self.assertEqual(stats["boa_content_type"]["hits"], 0)
+
+if __name__ == '__main__':
+    unittest.main()
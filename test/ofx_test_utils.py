@@ -25,3 +25,17 @@ def get_savings_stmt():
 def get_creditcard_stmt():
     return open(os.path.join(fixtures, "creditcard.ofx"), 'rU').read()
 
+def get_checking_xml():
+    return open(os.path.join(fixtures, "checking.xml"), 'rU').read()
+
+def get_checking_ofc():
+    return open(os.path.join(fixtures, "checking.ofc"), 'rU').read()
+
+def get_checking_ofc_xml():
+    return open(os.path.join(fixtures, "checking_ofc.xml"), 'rU').read()
+
+def get_profile():
+    return open(os.path.join(fixtures, "profile.ofx"), 'rU').read()
+
+def get_checking_qif():
+    return open(os.path.join(fixtures, "checking.qif"), 'rU').read()
@@ -0,0 +1,120 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofx
+import ofx_test_utils
+import ofxtools
+import textwrap
+import unittest
+from StringIO import StringIO
+
+class TimingsTests(unittest.TestCase):
+    def setUp(self):
+        self.checking = ofx_test_utils.get_checking_stmt()
+    
+    def _names(self, timings):
+        return [stage["name"] for stage in timings.stages]
+    
+    def test_timed_without_timings(self):
+        """Test that timing with no Timings does nothing."""
+        with ofx.timed(None, "parse", "text") as stage:
+            stage.output_bytes = 4
+        self.assertEqual(None, stage.input_bytes)
+    
+    def test_stage(self):
+        timings = ofx.Timings()
+        with timings.stage("parse", "text") as stage:
+            stage.output_bytes = 12
+        self.assertEqual(1, len(timings.stages))
+        self.assertEqual("parse", timings.stages[0]["name"])
+        self.assertEqual(4, timings.stages[0]["input_bytes"])
+        self.assertEqual(12, timings.stages[0]["output_bytes"])
+        self.assertTrue(timings.stages[0]["wall"] >= 0)
+        self.assertTrue("error" not in timings.stages[0])
+    
+    def test_failed_stage(self):
+        """Test that a stage that raises is still recorded."""
+        timings = ofx.Timings()
+        try:
+            with ofx.timed(timings, "parse"):
+                raise ValueError("bad")
+        except ValueError:
+            pass
+        self.assertEqual("ValueError", timings.stages[0]["error"])
+    
+    def test_callback(self):
+        seen = []
+        timings = ofx.Timings(callback=seen.append)
+        with ofx.timed(timings, "parse"):
+            pass
+        self.assertEqual(timings.stages, seen)
+    
+    def test_as_dict(self):
+        timings = ofx.Timings()
+        for name in ["parse", "as_xml"]:
+            with ofx.timed(timings, name):
+                pass
+        report = timings.as_dict()
+        self.assertEqual(2, len(report["stages"]))
+        self.assertAlmostEqual(sum([stage["wall"] for stage in timings.stages]),
+                               report["wall"])
+    
+    def test_response_stages(self):
+        timings = ofx.Timings()
+        response = ofx.Response(self.checking, timings=timings)
+        xml = response.as_xml(original_format="OFX/1.02", timings=timings)
+        self.assertEqual(["response_rules", "parser_rules", "parse", "as_xml"],
+                         self._names(timings))
+        self.assertEqual(len(self.checking), timings.stages[0]["input_bytes"])
+        self.assertEqual(len(xml), timings.stages[-1]["output_bytes"])
+    
+    def test_write_xml_output_bytes(self):
+        timings = ofx.Timings()
+        stream = StringIO()
+        ofx.Response(self.checking).write_xml(stream, timings=timings)
+        self.assertEqual(["as_xml"], self._names(timings))
+        self.assertEqual(len(stream.getvalue()),
+                         timings.stages[0]["output_bytes"])
+    
+    def test_qif_converter_stages(self):
+        qiftext = textwrap.dedent('''\
+        !Type:Bank
+        D01/13/2005
+        T-12.50
+        PCoffee
+        ^
+        ''')
+        timings = ofx.Timings()
+        converter = ofxtools.QifConverter(qiftext, timings=timings)
+        converter.to_xml()
+        self.assertEqual(["qif_rules", "parse", "extract_txn_list",
+                          "guess_formats", "clean_txn_list", "build", "as_xml"],
+                         self._names(timings))
+    
+    def test_ofc_converter_stages(self):
+        timings = ofx.Timings()
+        converter = ofxtools.OfcConverter(ofx_test_utils.get_checking_ofc(),
+                                          timings=timings)
+        converter.to_ofx102()
+        converter.to_xml()
+        self.assertEqual(["parse", "to_ofx102", "build", "as_xml"],
+                         self._names(timings))
+    
+
+if __name__ == '__main__':
+    unittest.main()
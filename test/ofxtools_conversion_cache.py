@@ -0,0 +1,111 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofxtools
+from ofxtools import conversion_cache
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+class ConversionCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = ofxtools.ConversionCache(ofxtools.MemoryStore(size=2))
+    
+    def test_key(self):
+        key = self.cache.key("text", fid="1", org="A")
+        self.assertEqual(key, self.cache.key("text", org="A", fid="1"))
+        self.assertNotEqual(key, self.cache.key("text", fid="1", org="B"))
+        self.assertNotEqual(key, self.cache.key("text2", fid="1", org="A"))
+        self.assertNotEqual(self.cache.key("text", dayfirst=False),
+                            self.cache.key("text", dayfirst="False"))
+    
+    def test_key_version(self):
+        key = self.cache.key("text", fid="1")
+        old_version = conversion_cache._KEY_VERSION
+        conversion_cache._KEY_VERSION = old_version + "-next"
+        try:
+            self.assertNotEqual(key, self.cache.key("text", fid="1"))
+        finally:
+            conversion_cache._KEY_VERSION = old_version
+    
+    def test_memory_store(self):
+        self.assertEqual(self.cache.get("a"), None)
+        self.cache.put("a", "<OFX>a</OFX>")
+        self.cache.put("b", "<OFX>b</OFX>")
+        self.assertEqual(self.cache.get("a"), "<OFX>a</OFX>")
+        # "b" is now the least recently used, so it goes first.
+        self.cache.put("c", "<OFX>c</OFX>")
+        self.assertEqual(self.cache.get("b"), None)
+        self.assertEqual(self.cache.get("a"), "<OFX>a</OFX>")
+        self.assertEqual(self.cache.stats(),
+                         { "hits" : 2, "misses" : 2, "hit_rate" : 0.5,
+                           "entries" : 2, "bytes" : 24 })
+    
+    def test_clear(self):
+        self.cache.put("a", "<OFX>a</OFX>")
+        self.cache.get("a")
+        self.cache.clear()
+        self.assertEqual(self.cache.get("a"), None)
+        self.assertEqual(self.cache.stats()["hits"], 0)
+
+class DirectoryStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+    
+    def tearDown(self):
+        shutil.rmtree(self.path)
+    
+    def test_shared(self):
+        cache = ofxtools.ConversionCache(ofxtools.DirectoryStore(self.path))
+        key = cache.key("text", filetype="QIF")
+        cache.put(key, "<OFX></OFX>")
+        
+        other = ofxtools.ConversionCache(ofxtools.DirectoryStore(self.path))
+        self.assertEqual(other.get(key), "<OFX></OFX>")
+        self.assertEqual(other.get(cache.key("text", filetype="OFC")), None)
+        self.assertEqual(other.stats(),
+                         { "hits" : 1, "misses" : 1, "hit_rate" : 0.5,
+                           "entries" : 1, "bytes" : 11 })
+    
+    def test_size_limit(self):
+        store = ofxtools.DirectoryStore(self.path, max_bytes=250)
+        for (age, key) in ((30, "bb01"), (20, "aa02"), (10, "aa03")):
+            store.put(key, "x" * 100)
+            # Make sure each document looks older than the next.
+            past = time.time() - age
+            os.utime(os.path.join(self.path, key[:2], key), (past, past))
+        
+        self.assertEqual(store.get("bb01"), None)
+        self.assertEqual(store.get("aa02"), "x" * 100)
+        self.assertEqual(store.get("aa03"), "x" * 100)
+        self.assertEqual(store.stats(), { "entries" : 2, "bytes" : 200 })
+    
+    def test_overwrite(self):
+        store = ofxtools.DirectoryStore(self.path, max_bytes=1000)
+        # Rewriting a document mustn't count its size twice, or the store
+        # would think it's full and rescan the directory on every put().
+        for i in range(5):
+            store.put("aa01", "x" * 100)
+        store.put("aa02", "x" * 50)
+        self.assertEqual(store.bytes, 150)
+        self.assertEqual(store.stats(), { "entries" : 2, "bytes" : 150 })
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import dateutil.parser
+import ofxtools
+import unittest
+
+class DateCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = ofxtools.DateCache(size=4)
+    
+    def test_matches_dateutil(self):
+        for date in ["01/13/2005", "1/3/2005", "01/13'05", " 1/ 3'05", 
+                     "13/01/2005", "05/04/05", "20050113"]:
+            for dayfirst in (False, True):
+                self.assertEqual(self.cache.parse(date, dayfirst=dayfirst),
+                                 dateutil.parser.parse(date, dayfirst=dayfirst))
+    
+    def test_dayfirst_marker(self):
+        self.assertEqual(self.cache.parse("13/01/2005").microsecond, 3)
+        self.assertEqual(self.cache.parse("01/13/2005").microsecond, 2)
+    
+    def test_compact_us_date(self):
+        parsed = self.cache.parse("01132005")
+        self.assertEqual((parsed.year, parsed.month, parsed.day), 
+                         (2005, 1, 13))
+    
+    def test_other_formats(self):
+        parsed = self.cache.parse("Jan 13, 2005")
+        self.assertEqual((parsed.year, parsed.month, parsed.day), 
+                         (2005, 1, 13))
+        self.assertEqual(self.cache.fast, 0)
+    
+    def test_unrecognized(self):
+        self.assertRaises(ValueError, self.cache.parse, "garbage")
+        self.assertRaises(ValueError, self.cache.parse, "garbage")
+        self.assertEqual(self.cache.hits, 1)
+    
+    def test_counters(self):
+        self.cache.parse("01/13/2005")
+        self.cache.parse("01/13/2005")
+        self.cache.parse("01/13/2005", dayfirst=True)
+        self.assertEqual(self.cache.stats(), 
+                         { "hits" : 1, "misses" : 2, "fast" : 2, "size" : 2 })
+    
+    def test_bounded(self):
+        for day in range(1, 11):
+            self.cache.parse("01/%02d/2005" % day)
+        self.assertEqual(len(self.cache.cache), 4)
+        self.cache.parse("01/10/2005")
+        self.cache.parse("01/01/2005")
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 11))
+    
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofx
+import ofx_test_utils
+import ofxtools
+import unittest
+from StringIO import StringIO
+
+class OfcConverterTests(unittest.TestCase):
+    def setUp(self):
+        self.ofc = ofx_test_utils.get_checking_ofc()
+    
+    def test_to_xml_golden(self):
+        converter = ofxtools.OfcConverter(self.ofc)
+        self.assertEqual(converter.to_xml(), ofx_test_utils.get_checking_ofc_xml())
+    
+    def test_to_xml_stream(self):
+        converter = ofxtools.OfcConverter(self.ofc)
+        stream = StringIO()
+        self.assertEqual(None, converter.to_xml(stream=stream))
+        self.assertEqual(ofx_test_utils.get_checking_ofc_xml(), stream.getvalue())
+    
+    def test_to_xml_matches_round_trip(self):
+        for options in ({}, { "org" : "A&B", "fid" : " 123", "curdef" : "EUR" },
+                        { "lang" : "" }):
+            converter = ofxtools.OfcConverter(self.ofc, **options)
+            response = ofx.Response(converter.to_ofx102())
+            self.assertEqual(converter.to_xml(),
+                             response.as_xml(original_format="OFC"))
+    
+    def test_txn_ids(self):
+        converter = ofxtools.OfcConverter(self.ofc)
+        ids = [txn["FITID"] for txn in converter._txns()]
+        self.assertEqual(ids, ["UNKNOWN-CHECKING-20050110-1--20.00",
+                               "UNKNOWN-CHECKING-20050110-2-50.00",
+                               "UNKNOWN-CHECKING-20050120-1-500.00"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -16,16 +16,24 @@ import sys
 sys.path.insert(0, '../3rdparty')
 sys.path.insert(0, '../lib')
 
+import ofx
 import ofxtools
 import textwrap
 import unittest
 from pyparsing import ParseException
+from StringIO import StringIO
 from time import localtime, strftime
 
 class QifConverterTests(unittest.TestCase):
     def setUp(self):
         pass
     
+    def test_parser_grammar_shared(self):
+        first = ofxtools.QifParser(engine="pyparsing")
+        second = ofxtools.QifParser(engine="pyparsing")
+        self.assertTrue(first.parser is not None)
+        self.assertTrue(first.parser is second.parser)
+    
     def test_bank_stmttype(self):
         qiftext = textwrap.dedent('''\
         !Type:Bank
@@ -52,6 +60,37 @@ class QifConverterTests(unittest.TestCase):
         converter = ofxtools.QifConverter(qiftext)
         self.assertEqual(converter.accttype, "CHECKING")
     
+    def test_quirk_rules(self):
+        qiftext = textwrap.dedent('''\
+        !Account
+        NChecking
+        ^
+        D01/13/2005
+        T-10.00
+        ^
+        ''')
+        ofxtools.QifConverter.rules.clear_stats()
+        converter = ofxtools.QifConverter(qiftext)
+        self.assertEqual(converter.qif, "!Type:Bank\nD01/13/2005\nT-10.00\n^\n")
+        stats = ofxtools.QifConverter.rules.stats()
+        self.assertEqual(stats["missing_type_header"]["fired"], 1)
+        self.assertEqual(stats["account_block"]["fired"], 1)
+        self.assertEqual(stats["typeless_bang_header"]["triggered"], 0)
+        self.assertEqual(stats["stray_crap"]["triggered"], 0)
+    
+    def test_to_xml_stream(self):
+        qiftext = textwrap.dedent('''\
+        !Type:Bank
+        D01/13/2005
+        T-12.50
+        PCoffee & Cake
+        ^
+        ''')
+        converter = ofxtools.QifConverter(qiftext)
+        stream = StringIO()
+        self.assertEqual(None, converter.to_xml(stream=stream))
+        self.assertEqual(converter.to_xml(), stream.getvalue())
+    
     def test_no_txns(self):
         qiftext = textwrap.dedent('''\
         !Type:Bank
@@ -338,6 +377,46 @@ class QifConverterTests(unittest.TestCase):
         txn = converter.txns_by_date["20070125"][0]
         self.assertEqual(txn.get("Type"), "CHECK")
         self.assertEqual(txn.get("Number"), "5287")
+    
+    def _round_trip_xml(self, converter):
+        response = ofx.Response(converter.to_ofx102())
+        if converter.dayfirst:
+            date_format = "DD/MM/YY"
+        else:
+            date_format = "MM/DD/YY"
+        return response.as_xml(original_format="QIF", date_format=date_format)
+    
+    def test_to_xml_matches_round_trip(self):
+        qiftext = textwrap.dedent('''\
+        !Type:Bank
+        D13/01/2005
+        T-1,234.50
+        PAT&amp;T <Wireless> "Bill"
+        M  paid online
+        N1001
+        ^
+        D14/01/2005
+        T12.00
+        P   
+        M&lt;memo&gt; & more
+        ^
+        ''')
+        for options in ({}, { "accttype" : "CREDITCARD" },
+                        { "balance" : "", "acctid" : " 12 ", "org" : "A&B" }):
+            converter = ofxtools.QifConverter(qiftext, **options)
+            expected = self._round_trip_xml(converter)
+            converter = ofxtools.QifConverter(qiftext, **options)
+            self.assertEqual(converter.to_xml(), expected)
+    
+    def test_to_xml_blank_accttype(self):
+        qiftext = textwrap.dedent('''\
+        !Type:Bank
+        D01/13/2005
+        T-22.00
+        ^
+        ''')
+        converter = ofxtools.QifConverter(qiftext, accttype="")
+        self.assertTrue("<ACCTTYPE>UNKNOWN</ACCTTYPE>" in converter.to_xml())
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,123 @@
+# Copyright 2005-2010 Wesabe, Inc.
+# 
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+# 
+#     http://www.apache.org/licenses/LICENSE-2.0
+# 
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import sys
+sys.path.insert(0, '../3rdparty')
+sys.path.insert(0, '../lib')
+
+import ofxtools
+import textwrap
+import unittest
+from pyparsing import ParseException
+from StringIO import StringIO
+
+class QifParserTests(unittest.TestCase):
+    def setUp(self):
+        self.qiftext = textwrap.dedent('''\
+        !Type:Bank
+        !Option:AutoSwitch
+        D01/13/2005
+        PStarbucks\tCo
+        T-12.50
+        ^
+        d 01/14/2005
+        NDEP
+        T100 
+        SFood
+        S b
+        ^EUR
+        !Type:CCard
+        D01/15/2005
+        MLunch
+        T-7.25
+        ^
+        ''')
+    
+    def _flatten(self, parsed):
+        sections = []
+        for section in parsed.asDict()["QifStatement"]:
+            sections.append([txn.asDict() for txn in section])
+        return sections
+    
+    def test_engines_agree(self):
+        scanned = ofxtools.QifParser().parse(self.qiftext)
+        grammar = ofxtools.QifParser(engine="pyparsing").parse(self.qiftext)
+        self.assertEqual(self._flatten(scanned), self._flatten(grammar))
+        
+        scanned_stmt = scanned.asDict()["QifStatement"]
+        grammar_stmt = grammar.asDict()["QifStatement"]
+        for name in ("BankTransactions", "CreditCardTransactions", 
+                     "InvestmentTransactions"):
+            self.assertEqual(name in scanned_stmt, name in grammar_stmt)
+    
+    def test_unknown_engine(self):
+        self.assertRaises(ValueError, ofxtools.QifParser, engine="regex")
+    
+    def test_scan_file(self):
+        scanned = list(ofxtools.QifParser().scan(StringIO(self.qiftext)))
+        self.assertEqual([name for (name, txn) in scanned],
+                         ["BankTransactions", "BankTransactions",
+                          "CreditCardTransactions"])
+        self.assertEqual(scanned[1][1]["Number"], "DEP")
+        self.assertEqual(scanned[1][1]["Currency"], "^EUR")
+    
+    def test_investment_items(self):
+        qiftext = textwrap.dedent('''\
+        !Type:Invst
+        D01/13/2005
+        NBuy
+        YACME
+        Q10
+        ^
+        ''')
+        scanned = list(ofxtools.QifParser().scan(qiftext))
+        self.assertEqual(scanned[0][0], "InvestmentTransactions")
+        self.assertEqual(scanned[0][1]["Action"], "Buy")
+        self.assertEqual(scanned[0][1]["Security"], "ACME")
+    
+    def test_skipped_sections(self):
+        qiftext = textwrap.dedent('''\
+        !Account
+        NChecking
+        TBank
+        ^
+        !Type:Cat
+        NFood
+        ^
+        !Type:Oth L
+        D01/13/2005
+        T-5.00
+        ^
+        ''')
+        scanned = list(ofxtools.QifParser().scan(qiftext))
+        self.assertEqual(len(scanned), 1)
+        self.assertEqual(scanned[0][0], "CreditCardTransactions")
+    
+    def test_empty_section(self):
+        parsed = ofxtools.QifParser().parse("!Type:Bank\n")
+        statement = parsed.asDict()["QifStatement"]
+        self.assertTrue("BankTransactions" in statement)
+        self.assertEqual(len(statement[0]), 0)
+    
+    def test_unterminated_txn(self):
+        scanned = list(ofxtools.QifParser().scan("!Type:Bank\nD01/13/2005\n"))
+        self.assertEqual(scanned[0][1]["Date"], "01/13/2005")
+    
+    def test_no_section(self):
+        self.assertRaises(ParseException, ofxtools.QifParser().parse, 
+                          "D01/13/2005\n^\n")
+    
+
+if __name__ == '__main__':
+    unittest.main()
@@ -25,10 +25,15 @@ sys.path.insert(0, '../lib')
 import unittest
 
 def suite():
-    modules_to_test = ['ofxtools_qif_converter', 'mock_ofx_server', 
+    modules_to_test = ['fixofx_batch', 'fixofx_server', 
+                       'ofxtools_conversion_cache', 'ofxtools_dates', 
+                       'ofxtools_ofc_converter', 'ofxtools_qif_converter', 
+                       'ofxtools_qif_parser', 'mock_ofx_server', 
                        'ofx_account', 'ofx_builder', 'ofx_client', 
-                       'ofx_document', 'ofx_error', 'ofx_parser', 
-                       'ofx_request', 'ofx_response', 'ofx_validators']
+                       'ofx_document', 'ofx_error', 'ofx_filetyper', 
+                       'ofx_generator', 'ofx_parser', 'ofx_reader', 
+                       'ofx_request', 'ofx_response', 'ofx_rules', 
+                       'ofx_timings', 'ofx_validators']
     alltests = unittest.TestSuite()
     
     for module in map(__import__, modules_to_test):